@@ -0,0 +1,45 @@
+import sys
+import tempfile
+from pathlib import Path
+from benchmarks.synthetic import load_template, scale_dataset, write_dataset
+from src.batch import run_batch
+
+"""
+Benchmarks the batch mode of src/batch.py: the throughput (datasets/s) of
+reporting a directory of synthetic schedules (10x mini_json_dataset.json each,
+plus one malformed file) with 1, 2 and 4 worker processes. The CSV reports
+stream the steps into the exporter, so their stages are load and steps+export.
+Stage seconds are summed over the datasets, so they grow with the jobs when
+the cores are shared.
+
+Run from the repository root with `python -m benchmarks.bench_batch [datasets] [scale]`.
+"""
+
+DEFAULT_DATASETS = 8
+DEFAULT_SCALE = 10
+JOBS = [1, 2, 4]
+
+
+if __name__ == '__main__':
+    datasets = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_DATASETS
+    scale = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_SCALE
+    template = load_template()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_dir = Path(tmp_dir) / 'schedules'
+        input_dir.mkdir()
+        schedules = []
+        for number in range(datasets):
+            path = input_dir / f'schedule_{number}.json'
+            write_dataset(scale_dataset(template, scale), path)
+            schedules.append(path)
+        broken = input_dir / 'broken.json'
+        broken.write_text('{"stops": [')
+        schedules.append(broken)
+
+        print(f"{datasets} datasets of {scale}x and one malformed file")
+        print(f"  {'jobs':>4} {'seconds':>8} {'datasets/s':>10} {'load s':>8} {'steps+export s':>14} {'failed':>6}")
+        for jobs in JOBS:
+            summary = run_batch(schedules, Path(tmp_dir) / f'out_{jobs}', jobs, fmt='csv')
+            stages = summary['stage_seconds']
+            print(f"  {jobs:>4} {summary['seconds']:>8.2f} {summary['datasets_per_second']:>10.2f} "
+                  f"{stages['load']:>8.2f} {stages['steps+export']:>14.2f} {summary['failed']:>6}")
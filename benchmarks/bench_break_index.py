@@ -0,0 +1,112 @@
+import random
+import sys
+import time
+import numpy as np
+from benchmarks.synthetic import load_template
+from src.breaks import BreakIndex
+from src.index import DutyEventIndex, TripIndex, resolve_service_trips
+from src.stops import UNKNOWN_STOP, StopRegistry
+from src.vectorized import break_arrays, index_events_frame
+
+"""
+Benchmarks the time-window and stop queries of BreakIndex (src/breaks.py)
+against scanning the break lists of every duty, at 1M breaks by default.
+count_on_break only searches; on_break also builds the dict of every break it
+finds, so its time grows with the size of the answer.
+
+The breaks of mini_json_dataset.json are copied, each copy moved to a seeded
+random day of DAYS and shifted by a random number of minutes, until there are
+enough of them (1M breaks is about a month of a network 110 times the template). Queries ask
+for the breaks overlapping a one-hour window, over all stops and at the
+busiest stop; the full scan is what answering them from the report takes.
+on_break is timed again with one break lasting all DAYS added, which every
+window overlaps: it must not make the other breaks slower to find.
+
+Run from the repository root with `python -m benchmarks.bench_break_index [breaks]`.
+"""
+
+DEFAULT_BREAKS = 1_000_000
+QUERIES = 200
+SCAN_QUERIES = 5
+WINDOWS = [5, 60]
+SEED = 0
+DAYS = 30
+
+
+"""Copy the breaks of the template until there are `count`, returning the arguments of BreakIndex."""
+def synthetic_breaks(count, seed=SEED):
+    json_data = load_template()
+    resolve_service_trips(json_data['vehicles'], TripIndex(json_data['trips']))
+    stops = StopRegistry(json_data['stops'])
+    index = DutyEventIndex(json_data['vehicles'], json_data['duties'], stops)
+    duty_codes, template_duty_ids, starts, durations, stop_codes, _ = break_arrays(index_events_frame(index), stops)
+
+    copies = -(-count // len(starts))
+    rng = np.random.default_rng(seed)
+    shifts = rng.integers(0, DAYS, copies) * 24 * 60 + rng.integers(-120, 121, copies)
+    shifts = np.repeat(shifts, len(starts))[:count]
+    tiled = lambda array: np.tile(array, copies)[:count]
+    copy_numbers = np.repeat(np.arange(copies), len(starts))[:count]
+    duty_ids = [f"{duty_id}_{copy_number}" for copy_number in range(copies) for duty_id in template_duty_ids]
+    return (duty_ids, tiled(duty_codes) + copy_numbers * len(template_duty_ids), tiled(starts) + shifts,
+            tiled(durations), tiled(stop_codes), stops)
+
+def per_query(function, queries):
+    start = time.perf_counter()
+    for query in queries:
+        function(*query)
+    return (time.perf_counter() - start) / len(queries)
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_BREAKS
+    duty_ids, duty_codes, starts, durations, stop_codes, stops = synthetic_breaks(count)
+
+    start = time.perf_counter()
+    index = BreakIndex(duty_ids, duty_codes, starts, durations, stop_codes, stops)
+    build_seconds = time.perf_counter() - start
+
+    names = stops.names() + [UNKNOWN_STOP]
+    # The per-duty break lists of the report, as steps.generate_breaks_info leaves them.
+    report = {}
+    for duty_code, break_start, duration, stop_code in zip(duty_codes.tolist(), starts.tolist(), durations.tolist(),
+                                                          stop_codes.tolist()):
+        report.setdefault(duty_ids[duty_code], []).append(
+            {'break_start_time': break_start, 'break_duration': duration, 'break_stop_name': names[stop_code]})
+
+    busiest = stops.stop_id(int(np.bincount(stop_codes).argmax()))
+    rng = random.Random(SEED)
+    starts_of_windows = [rng.randrange(DAYS * 24 * 60) for _ in range(QUERIES)]
+
+    def scan(window_start, window_end, stop_name=None):
+        return [
+            duty_id for duty_id, breaks in report.items() for info in breaks
+            if info['break_start_time'] < window_end
+            and info['break_start_time'] + info['break_duration'] > window_start
+            and stop_name in (None, info['break_stop_name'])
+        ]
+
+    print(f"{len(index)} breaks of {len(report)} duties, index built in {build_seconds:.2f} s")
+    for width in WINDOWS:
+        windows = [(window_start, window_start + width) for window_start in starts_of_windows]
+        at_busiest = [window + (busiest,) for window in windows]
+        found = sum(index.count_on_break(*window) for window in windows) / len(windows)
+        found_at_busiest = sum(index.count_on_break(*window) for window in at_busiest) / len(windows)
+        print(f"{width}-minute windows: {found:.0f} breaks on average, {found_at_busiest:.0f} at the busiest stop")
+        print(f"  {'query':<40} {'all stops':>12} {'busiest stop':>13}")
+        rows = [
+            ('count_on_break', per_query(index.count_on_break, windows), per_query(index.count_on_break, at_busiest)),
+            ('on_break', per_query(index.on_break, windows), per_query(index.on_break, at_busiest)),
+            ('full scan of the report', per_query(scan, windows[:SCAN_QUERIES]),
+             per_query(scan, [window + (stops.name(busiest),) for window in windows[:SCAN_QUERIES]])),
+        ]
+        for label, all_stops, busiest_stop in rows:
+            print(f"  {label:<40} {all_stops * 1e3:>9.3f} ms {busiest_stop * 1e3:>10.3f} ms")
+
+    busiest_code = stops.code(busiest)
+    long_break = BreakIndex(duty_ids, np.append(duty_codes, 0), np.append(starts, 0),
+                            np.append(durations, DAYS * 24 * 60), np.append(stop_codes, busiest_code), stops)
+    windows = [(window_start, window_start + WINDOWS[-1]) for window_start in starts_of_windows]
+    print(f"{WINDOWS[-1]}-minute windows with one {DAYS}-day break added at the busiest stop:")
+    print(f"  {'on_break':<40} {per_query(long_break.on_break, windows) * 1e3:>9.3f} ms "
+          f"{per_query(long_break.on_break, [window + (busiest,) for window in windows]) * 1e3:>10.3f} ms")
@@ -0,0 +1,110 @@
+import copy
+import sys
+import tempfile
+import time
+from pathlib import Path
+from benchmarks.synthetic import DEFAULT_SEED, load_template, write_scaled_dataset
+from src.compare import compare_reports, duty_changes, unchanged_duties
+from src.main import load_report_inputs, summarise_duties
+from src.metrics import NO_METRICS
+from src.utils import format_time, time_to_minutes
+
+"""
+Benchmarks the schedule comparison of src/compare.py on two versions of a
+seeded synthetic schedule: the second one moves the end of a timed event on
+every CHANGE_EVERY-th vehicle of the template (lengthening an event and
+shortening the break after it, or moving the end of a duty), drops one duty
+and adds another, in every copy. 700x mini_json_dataset.json is about 100k
+duties.
+
+Both versions are streamed into the index, and the inputs of their duties
+hashed (see unchanged_duties); the duties whose inputs changed are run through
+the steps into a ReportSummary, as compare_schedules in src/main.py does,
+then hash-joined. Running the steps on every duty is timed as well, which is
+what hashing the inputs skips. Loading (parsing and validating the JSON, and
+resolving and sorting every timeline of the index, which the hashes and the
+steps would otherwise pay for on first use) is timed apart from the steps, and the join is compared with diffing the fields
+of every duty, which is what the content hashes of the results skip.
+
+Run from the repository root with `python -m benchmarks.bench_compare [scale ...]`.
+"""
+
+DEFAULT_SCALES = [10, 100, 700]
+CHANGE_EVERY = 10
+SHIFT = 5
+
+
+"""Copy the template, moving an event end on every CHANGE_EVERY-th vehicle, dropping one duty and adding one."""
+def changed_template(template):
+    changed = copy.deepcopy(template)
+    for vehicle in changed['vehicles'][::CHANGE_EVERY]:
+        events = vehicle['vehicle_events']
+        for event, next_event in zip(events, events[1:] + [None]):
+            if 'end_time' not in event:
+                continue
+            end = time_to_minutes(event['end_time'])
+            # Only move ends that keep the events of the vehicle in order.
+            if next_event is None or time_to_minutes(next_event.get('start_time', '0.00:00')) >= end + SHIFT:
+                event['end_time'] = format_time(end + SHIFT)
+                break
+    changed['duties'].pop(0)
+    added = copy.deepcopy(changed['duties'][0])
+    added['duty_id'] += '_added'
+    changed['duties'].append(added)
+    return changed
+
+"""Diff the fields of every duty of `new` with its version in `old`, without looking at the digests."""
+def diff_every_duty(old, new):
+    rows = 0
+    for duty_id, (_, summary) in new.duties.items():
+        previous = old.duties.get(duty_id)
+        rows += len(list(duty_changes(duty_id, None if previous is None else previous[1], summary)))
+    return rows
+
+"""Stream a schedule and sort its timelines; returns its (duties, stops, index) with the seconds taken."""
+def timed_load(path):
+    start = time.perf_counter()
+    duties, _, stops, index = load_report_inputs(path, stream=True)
+    for duty in duties:
+        index.events(duty['duty_id'])
+    return (duties, stops, index), time.perf_counter() - start
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    scales = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SCALES
+    template = load_template()
+    new_template = changed_template(template)
+    print(f"{'scale':>6} {'duties':>7} {'changed':>7} {'load s':>7} {'hash s':>7} {'steps s':>7} {'all steps s':>11} "
+          f"{'join s':>7} {'diff all s':>10}")
+    for scale in scales:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            old_path, new_path = Path(tmp_dir) / 'old.json', Path(tmp_dir) / 'new.json'
+            write_scaled_dataset(template, scale, old_path, DEFAULT_SEED)
+            write_scaled_dataset(new_template, scale, new_path, DEFAULT_SEED)
+            old_inputs, old_load = timed_load(old_path)
+            new_inputs, new_load = timed_load(new_path)
+
+        (old_duties, _, old_index), (new_duties, _, new_index) = old_inputs, new_inputs
+        unchanged, hash_seconds = timed(unchanged_duties, old_index, [duty['duty_id'] for duty in old_duties],
+                                        new_index, [duty['duty_id'] for duty in new_duties])
+        old, old_steps = timed(summarise_duties, *old_inputs, 'python', NO_METRICS, None, unchanged)
+        new, new_steps = timed(summarise_duties, *new_inputs, 'python', NO_METRICS, None, unchanged)
+        full_old, full_old_steps = timed(summarise_duties, *old_inputs)
+        full_new, full_new_steps = timed(summarise_duties, *new_inputs)
+
+        start = time.perf_counter()
+        changes = list(compare_reports(old, new))
+        join_seconds = time.perf_counter() - start
+        assert changes == list(compare_reports(full_old, full_new))
+        start = time.perf_counter()
+        diff_every_duty(full_old, full_new)
+        diff_seconds = time.perf_counter() - start
+        print(f"{scale:>6} {len(new):>7} {len(changes):>7} {old_load + new_load:>7.2f} {hash_seconds:>7.2f} "
+              f"{old_steps + new_steps:>7.2f} {full_old_steps + full_new_steps:>11.2f} {join_seconds:>7.3f} "
+              f"{diff_seconds:>10.3f}")
+        del old_inputs, new_inputs, old_duties, new_duties, old_index, new_index, old, new, full_old, full_new, changes
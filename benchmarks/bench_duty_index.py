@@ -0,0 +1,67 @@
+import time
+from benchmarks.synthetic import load_template, scale_dataset
+from src.index import DutyEventIndex
+from src.steps import generate_start_end_times, generate_breaks_info
+from src.utils import compare_times, find_stop_name_by_id, time_to_minutes
+
+"""
+Benchmarks steps 1 and 3 on synthetic datasets from 1x to 100x the size of
+mini_json_dataset.json.
+
+The indexed steps should scale linearly: the time per duty stays flat as the
+dataset grows. The previous full-scan implementation is timed on the smaller
+scales only, since its cost grows with duties x vehicle events.
+
+Run from the repository root with `python -m benchmarks.bench_duty_index`.
+"""
+
+FACTORS = [1, 2, 5, 10, 20, 50, 100]
+FULL_SCAN_FACTORS = [1, 2, 5]
+
+
+"""Steps 1 and 3 as they were implemented before the duty index, scanning every vehicle for every duty."""
+def full_scan_steps(json_data):
+    for duty in json_data['duties']:
+        duty_id = duty['duty_id']
+        earliest_start, latest_end = "23.59:59", "0.00:00"
+        for vehicle in json_data['vehicles']:
+            for event in vehicle['vehicle_events']:
+                if event.get('duty_id') == duty_id:
+                    if 'start_time' in event and (compare_times(event['start_time'], earliest_start) or earliest_start == "23.59:59"):
+                        earliest_start = event['start_time']
+                    if 'end_time' in event and (compare_times(latest_end, event['end_time']) or latest_end == "0.00:00"):
+                        latest_end = event['end_time']
+    for duty in json_data['duties']:
+        duty_id = duty['duty_id']
+        vehicle_events = [
+            event for vehicle in json_data['vehicles'] for event in vehicle['vehicle_events']
+            if event.get('duty_id') == duty_id and 'start_time' in event and 'end_time' in event
+        ]
+        vehicle_events = sorted(vehicle_events, key=lambda x: time_to_minutes(x['start_time']))
+        for current_event, next_event in zip(vehicle_events, vehicle_events[1:]):
+            duration = time_to_minutes(next_event['start_time']) - time_to_minutes(current_event['end_time'])
+            if duration > 15:
+                find_stop_name_by_id(current_event['destination_stop_id'], json_data['stops'])
+
+"""Steps 1 and 3 reading from a DutyEventIndex built once."""
+def indexed_steps(json_data):
+    index = DutyEventIndex(json_data['vehicles'], json_data['duties'])
+    start_end_times = generate_start_end_times(json_data['duties'], json_data['vehicles'], index)
+    generate_breaks_info(start_end_times, json_data['vehicles'], json_data['stops'], index)
+
+def timed(function, json_data):
+    start = time.perf_counter()
+    function(json_data)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    template = load_template()
+    print(f"{'scale':>6} {'duties':>8} {'events':>9} {'indexed s':>10} {'us/duty':>8} {'full scan s':>12}")
+    for factor in FACTORS:
+        json_data = scale_dataset(template, factor)
+        duties = len(json_data['duties'])
+        events = sum(len(vehicle['vehicle_events']) for vehicle in json_data['vehicles'])
+        indexed = timed(indexed_steps, json_data)
+        full_scan = f"{timed(full_scan_steps, json_data):12.3f}" if factor in FULL_SCAN_FACTORS else f"{'-':>12}"
+        print(f"{factor:>5}x {duties:>8} {events:>9} {indexed:>10.3f} {indexed / duties * 1e6:>8.1f} {full_scan}")
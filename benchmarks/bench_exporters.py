@@ -0,0 +1,65 @@
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from benchmarks.synthetic import load_template, scale_dataset
+from src.exporters import write_report
+from src.index import DutyEventIndex, TripIndex, resolve_service_trips
+from src.steps import generate_start_end_times, generate_stop_names, generate_breaks_info
+from src.stops import StopRegistry
+from src.utils import export_to_excel
+
+"""
+Benchmarks the report writers on the three step outputs of a synthetic
+report (20x mini_json_dataset.json by default): export_to_excel once per step
+(pandas DataFrame + to_excel) against the single-pass streaming writers of
+src/exporters.py. Reports rows/s and the tracemalloc peak of each writer.
+
+Run from the repository root with `python -m benchmarks.bench_exporters [scale]`.
+"""
+
+DEFAULT_SCALE = 20
+
+
+def pandas_excel(report, path):
+    for step in (1, 2, 3):
+        export_to_excel(report, f"{path}_step{step}", step)
+
+def streaming(fmt):
+    return lambda report, path: write_report(report, path, fmt)
+
+WRITERS = [('pandas to_excel', pandas_excel), ('xlsx streaming', streaming('xlsx')),
+           ('csv', streaming('csv')), ('parquet', streaming('parquet'))]
+
+
+if __name__ == '__main__':
+    scale = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SCALE
+    json_data = scale_dataset(load_template(), scale)
+    resolve_service_trips(json_data['vehicles'], TripIndex(json_data['trips']))
+    stops = StopRegistry(json_data['stops'])
+    index = DutyEventIndex(json_data['vehicles'], json_data['duties'], stops)
+    report = generate_breaks_info(
+        generate_stop_names(generate_start_end_times(json_data['duties'], None, index), stops), None, stops, index)
+    rows = sum(1 + max(len(duty['Breaks']), 1) + 1 for duty in report)
+    print(f"{scale}x: {len(report)} duties, {rows} rows over the three steps")
+
+    print(f"{'writer':>16} {'seconds':>8} {'rows/s':>9} {'peak MB':>8} {'size MB':>8}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, writer in WRITERS:
+            path = Path(tmp_dir) / name.replace(' ', '_') / 'report'
+            path.parent.mkdir()
+            try:
+                start = time.perf_counter()
+                writer(report, path)
+                seconds = time.perf_counter() - start
+            except ImportError as e:
+                print(f"{name:>16} skipped: {e}")
+                continue
+            tracemalloc.start()
+            writer(report, path)
+            peak_mb = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+            size_mb = sum(os.path.getsize(file) for file in path.parent.iterdir()) / 2**20
+            print(f"{name:>16} {seconds:>8.2f} {rows / seconds:>9.0f} {peak_mb:>8.1f} {size_mb:>8.2f}")
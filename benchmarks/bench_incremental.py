@@ -0,0 +1,63 @@
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from benchmarks.synthetic import load_template, scale_dataset
+from src.incremental import ReportCache, generate_report_incremental
+from src.index import TripIndex, resolve_service_trips
+from src.utils import format_time, time_to_minutes
+
+"""
+Benchmarks incremental recomputation on a synthetic schedule (50x
+mini_json_dataset.json by default): after a first run fills the cache, the
+end time of one timed event is moved on 1, 1% and 10% of the vehicles and the
+report is regenerated incrementally. The time of a full recompute (no cache) is
+given for comparison. Hashing the schedule is the part every run pays for; it
+is timed on its own, and the rest (load the cache, recompute, save) is what
+grows with the change.
+
+Run from the repository root with `python -m benchmarks.bench_incremental [scale]`.
+"""
+
+DEFAULT_SCALE = 50
+
+
+"""Move the end time of a timed event on `count` random vehicles by one minute."""
+def touch_vehicles(vehicles, count, rng):
+    for vehicle in rng.sample(vehicles, count):
+        timed_events = [event for event in vehicle['vehicle_events'] if 'end_time' in event]
+        if timed_events:
+            event = rng.choice(timed_events)
+            event['end_time'] = format_time(time_to_minutes(event['end_time']) + 1)
+
+def timed_run(json_data, cache_path):
+    start = time.perf_counter()
+    ReportCache.from_schedule(json_data['duties'], json_data['vehicles'], json_data['stops'])
+    hashing_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    report, recomputed = generate_report_incremental(
+        json_data['duties'], json_data['vehicles'], json_data['stops'], cache_path)
+    return recomputed, time.perf_counter() - start, hashing_seconds
+
+def print_run(label, recomputed, seconds, hashing_seconds):
+    print(f"  {label:<22} {recomputed:>6} duties {seconds:8.3f} s  (hashing {hashing_seconds:.3f} s,"
+          f" rest {seconds - hashing_seconds:.3f} s)")
+
+
+if __name__ == '__main__':
+    scale = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SCALE
+    rng = random.Random(0)
+    json_data = scale_dataset(load_template(), scale)
+    resolve_service_trips(json_data['vehicles'], TripIndex(json_data['trips']))
+    vehicle_count = len(json_data['vehicles'])
+    print(f"{scale}x: {vehicle_count} vehicles, {len(json_data['duties'])} duties")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache_path = Path(tmp_dir) / 'cache.pickle'
+        print_run('full recompute', *timed_run(json_data, cache_path))
+        print_run('no change', *timed_run(json_data, cache_path))
+        for label, count in [('1 vehicle', 1), ('1% of the vehicles', vehicle_count // 100),
+                             ('10% of the vehicles', vehicle_count // 10)]:
+            touch_vehicles(json_data['vehicles'], count, rng)
+            print_run(label, *timed_run(json_data, cache_path))
@@ -0,0 +1,72 @@
+import sys
+import time
+import tracemalloc
+from benchmarks.synthetic import load_template, scale_dataset
+from src.index import DutyEventIndex, TripIndex, resolve_service_trips
+from src.metrics import NO_METRICS, Metrics
+from src.stops import StopRegistry
+from src.steps import generate_start_end_times, generate_stop_names, generate_breaks_info
+
+"""
+Benchmarks the overhead of the stage instrumentation of src/metrics.py.
+
+Runs steps 1-3 on a synthetic schedule (50x mini_json_dataset.json by default)
+with metrics disabled (NO_METRICS), enabled, and with --profile, and reports
+the best wall time of REPEAT runs of each. Also times one entry and exit of a
+stage, disabled and enabled, on an empty body.
+
+Run from the repository root with `python -m benchmarks.bench_metrics [scale]`.
+"""
+
+DEFAULT_SCALE = 50
+REPEAT = 5
+STAGE_CALLS = 100_000
+
+
+def run_steps(duties, index, stops, metrics):
+    with metrics.stage('step1', len(duties)):
+        start_end_times = generate_start_end_times(duties, None, index)
+    with metrics.stage('step2', len(start_end_times)):
+        start_end_with_stop_names = generate_stop_names(start_end_times, stops)
+    with metrics.stage('step3', len(start_end_with_stop_names)):
+        return generate_breaks_info(start_end_with_stop_names, None, stops, index)
+
+def best_time(function, repeat=REPEAT):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def stage_call_seconds(metrics):
+    def calls():
+        for _ in range(STAGE_CALLS):
+            with metrics.stage('empty'):
+                pass
+    seconds = best_time(calls, 3)
+    metrics.stages.clear()
+    return seconds / STAGE_CALLS
+
+
+if __name__ == '__main__':
+    scale = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SCALE
+    data = scale_dataset(load_template(), scale)
+    resolve_service_trips(data['vehicles'], TripIndex(data['trips']))
+    stops = StopRegistry(data['stops'])
+    index = DutyEventIndex(data['vehicles'], data['duties'], stops)
+    duties = data['duties']
+    run_steps(duties, index, stops, NO_METRICS)
+    print(f"{scale}x: {len(duties)} duties, steps 1-3, best of {REPEAT}")
+
+    baseline = best_time(lambda: run_steps(duties, index, stops, NO_METRICS))
+    print(f"  {'metrics':<10} {'seconds':>8} {'overhead':>9}")
+    print(f"  {'disabled':<10} {baseline:>8.4f} {'':>9}")
+    enabled = best_time(lambda: run_steps(duties, index, stops, Metrics()))
+    print(f"  {'enabled':<10} {enabled:>8.4f} {enabled / baseline - 1:>9.1%}")
+    profiled = best_time(lambda: run_steps(duties, index, stops, Metrics(profile=True)), 1)
+    tracemalloc.stop()
+    print(f"  {'profile':<10} {profiled:>8.4f} {profiled / baseline - 1:>9.1%}")
+
+    print(f"  one stage, disabled: {stage_call_seconds(NO_METRICS) * 1e9:.0f} ns, "
+          f"enabled: {stage_call_seconds(Metrics()) * 1e9:.0f} ns")
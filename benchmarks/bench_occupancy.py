@@ -0,0 +1,69 @@
+import sys
+import time
+from src.index import DutyEventIndex, TripIndex, resolve_service_trips
+from src.occupancy import Occupancy
+from src.stops import StopRegistry
+from src.steps import generate_breaks_info
+from benchmarks.synthetic import load_template, scale_dataset
+
+"""
+Benchmarks the stop occupancy sweep of src/occupancy.py against re-looping the
+calculate_breaks output: for every stop, every break of the report is checked
+for that stop, then every minute of the day is checked against each of the
+stop's breaks, which is quadratic.
+
+Both count the drivers on break at each stop and minute of seeded synthetic
+schedules and must agree. The loop only runs up to NAIVE_MAX_SCALE; the sweep
+(the event frame build included) runs at every scale and should grow with the
+number of duty events only, not with the number of stops times minutes.
+
+Run from the repository root with `python -m benchmarks.bench_occupancy [scale ...]`.
+"""
+
+DEFAULT_SCALES = [1, 10, 100]
+NAIVE_MAX_SCALE = 100
+SEED = 0
+
+
+"""Count the drivers on break at each stop code and minute by looping over the breaks of the report for every stop."""
+def loop_on_break(full_report, stops, start, span):
+    counts = []
+    for code in range(len(stops)):
+        name = stops.name_of(code)
+        stop_breaks = [info for duty_data in full_report for info in duty_data['Breaks']
+                       if info['break_stop_name'] == name]
+        counts.append([
+            sum(info['break_start_time'] <= minute < info['break_start_time'] + info['break_duration']
+                for info in stop_breaks)
+            for minute in range(start, start + span)
+        ])
+    return counts
+
+
+if __name__ == '__main__':
+    scales = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SCALES
+    template = load_template()
+    print(f"{'scale':>6} {'events':>9} {'sweep s':>9} {'events/s':>11} {'loop s':>9}")
+    for scale in scales:
+        json_data = scale_dataset(template, scale, SEED)
+        resolve_service_trips(json_data['vehicles'], TripIndex(json_data['trips']))
+        stops = StopRegistry(json_data['stops'])
+        index = DutyEventIndex(json_data['vehicles'], json_data['duties'], stops)
+        event_count = sum(len(index.timed_events(duty_id)) for duty_id in index.duty_ids())
+
+        start = time.perf_counter()
+        occupancy = Occupancy.from_index(index)
+        sweep_seconds = time.perf_counter() - start
+
+        loop = '-'
+        if scale <= NAIVE_MAX_SCALE:
+            full_report = generate_breaks_info([{'Duty ID': duty_id} for duty_id in index.duty_ids()],
+                                               None, stops, index)
+            start = time.perf_counter()
+            counts = loop_on_break(full_report, stops, occupancy.start, occupancy.span)
+            loop = f"{time.perf_counter() - start:.3f}"
+            minutes = range(occupancy.start, occupancy.start + occupancy.span)
+            assert counts == [[occupancy.drivers_on_break(minute, stops.stop_id(code)) for minute in minutes]
+                              for code in range(len(stops))]
+        print(f"{scale:>6} {event_count:>9} {sweep_seconds:>9.3f} {event_count / sweep_seconds:>11.0f} {loop:>9}")
+        del json_data, index, occupancy
@@ -0,0 +1,62 @@
+import gc
+import os
+import sys
+import time
+from benchmarks.synthetic import load_template, scale_dataset
+from src.index import DutyEventIndex, TripIndex, resolve_service_trips
+from src.parallel import generate_report_parallel
+from src.steps import generate_start_end_times, generate_stop_names, generate_breaks_info
+from src.stops import StopRegistry
+
+"""
+Measures the sharded report (steps 1-3) with 2 to N worker processes against
+the serial steps on a synthetic dataset, 100x mini_json_dataset.json by default.
+N is the number of CPUs, at least 2 so the pool is always measured; the
+speedup is only meaningful when there are that many CPUs, which the output
+states. Each timing is the best of REPEAT runs.
+
+Run from the repository root with `python -m benchmarks.bench_parallel [scale] [max workers]`.
+"""
+
+DEFAULT_SCALE = 100
+REPEAT = 3
+
+
+"""Steps 1-3 as main runs them without --workers."""
+def serial_steps(duties, index):
+    start_end_times = generate_start_end_times(duties, None, index)
+    start_end_with_stop_names = generate_stop_names(start_end_times, index.stops)
+    return generate_breaks_info(start_end_with_stop_names, None, index.stops, index)
+
+"""Return the best of REPEAT timings of function(*args), collecting garbage before each."""
+def best_time(function, *args):
+    best = None
+    for _ in range(REPEAT):
+        gc.collect()
+        start = time.perf_counter()
+        function(*args)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+if __name__ == '__main__':
+    cpus = os.cpu_count() or 1
+    scale = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SCALE
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else max(cpus, 2)
+    json_data = scale_dataset(load_template(), scale)
+    resolve_service_trips(json_data['vehicles'], TripIndex(json_data['trips']))
+    index = DutyEventIndex(json_data['vehicles'], json_data['duties'], StopRegistry(json_data['stops']))
+    duties = json_data['duties']
+    index.timeline_arrays()
+    print(f"{scale}x: {len(duties)} duties, {cpus} CPUs")
+    if max_workers > cpus:
+        print(f"Only {cpus} CPUs: runs with more workers share them, so they show the pool overhead, not a speedup")
+
+    serial = best_time(serial_steps, duties, index)
+    print(f"{'workers':>8} {'seconds':>8} {'duties/s':>10} {'speedup':>8}")
+    print(f"{'serial':>8} {serial:>8.2f} {len(duties) / serial:>10.0f} {1:>7.2f}x")
+    worker_counts = sorted({2, 4, 8, 16, max_workers} & set(range(2, max_workers + 1)))
+    for workers in worker_counts:
+        seconds = best_time(generate_report_parallel, duties, index, workers)
+        print(f"{workers:>8} {seconds:>8.2f} {len(duties) / seconds:>10.0f} {serial / seconds:>7.2f}x")
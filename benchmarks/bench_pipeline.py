@@ -0,0 +1,111 @@
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from benchmarks.synthetic import load_template, scale_dataset
+from src.exporters import ReportSink, write_report
+from src.index import DutyEventIndex, TripIndex, resolve_service_trips
+from src.pipeline import breaks, fan_out, fused, pipeline, start_end, stop_names
+from src.stops import StopRegistry
+from src.steps import generate_start_end_times, generate_stop_names, generate_breaks_info
+from src.utils import export_to_excel
+
+"""
+Benchmarks the generator pipeline of src/pipeline.py against the three-pass
+flow of src/main.py on a synthetic schedule (50x mini_json_dataset.json by
+default), from a DutyEventIndex built beforehand:
+
+- three-pass: steps 1-3 build full lists, exported with export_to_excel after each step
+- three-pass + write_report: the same lists, exported in one pass (--format xlsx before the pipeline)
+- chained / fused pipeline: duties flow through the stages into a streaming XLSX sink
+
+Each flow is also run into a sink that only counts the duties, to time the
+steps alone. Reports the best wall time of REPEAT runs and the tracemalloc
+peak of each flow.
+
+Run from the repository root with `python -m benchmarks.bench_pipeline [scale]`.
+"""
+
+DEFAULT_SCALE = 50
+REPEAT = 3
+
+
+class CountSink:
+
+    def __init__(self):
+        self.count = 0
+
+    def send(self, record):
+        self.count += 1
+
+    def close(self):
+        return self.count
+
+def three_pass_report(duties, index, stops):
+    start_end_times = generate_start_end_times(duties, None, index)
+    start_end_with_stop_names = generate_stop_names(start_end_times, stops)
+    return generate_breaks_info(start_end_with_stop_names, None, stops, index)
+
+def three_pass_excel(duties, index, stops, path):
+    start_end_times = generate_start_end_times(duties, None, index)
+    export_to_excel(start_end_times, f"{path}_step1", step=1)
+    start_end_with_stop_names = generate_stop_names(start_end_times, stops)
+    export_to_excel(start_end_with_stop_names, f"{path}_step2", step=2)
+    full_report = generate_breaks_info(start_end_with_stop_names, None, stops, index)
+    export_to_excel(full_report, f"{path}_step3", step=3)
+
+def three_pass_write_report(duties, index, stops, path):
+    write_report(three_pass_report(duties, index, stops), path, 'xlsx')
+
+def three_pass_count(duties, index, stops, path):
+    fan_out(CountSink())(three_pass_report(duties, index, stops))
+
+def chained(sink):
+    def flow(duties, index, stops, path):
+        pipeline(duties) | start_end(index) | stop_names(stops) | breaks(index, stops) | fan_out(sink(path))
+    return flow
+
+def fused_flow(sink):
+    def flow(duties, index, stops, path):
+        pipeline(duties) | fused(index, stops) | fan_out(sink(path))
+    return flow
+
+xlsx_sink = lambda path: ReportSink(path, 'xlsx')
+count_sink = lambda path: CountSink()
+
+FLOWS = [
+    ('three-pass, count only', three_pass_count),
+    ('chained, count only', chained(count_sink)),
+    ('fused, count only', fused_flow(count_sink)),
+    ('three-pass export_to_excel', three_pass_excel),
+    ('three-pass + write_report', three_pass_write_report),
+    ('chained -> xlsx sink', chained(xlsx_sink)),
+    ('fused -> xlsx sink', fused_flow(xlsx_sink)),
+]
+
+
+if __name__ == '__main__':
+    scale = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SCALE
+    json_data = scale_dataset(load_template(), scale)
+    resolve_service_trips(json_data['vehicles'], TripIndex(json_data['trips']))
+    stops = StopRegistry(json_data['stops'])
+    index = DutyEventIndex(json_data['vehicles'], json_data['duties'], stops)
+    duties = json_data['duties']
+    three_pass_report(duties, index, stops)
+    print(f"{scale}x: {len(duties)} duties")
+
+    print(f"{'flow':>28} {'seconds':>8} {'peak MB':>8}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for number, (name, flow) in enumerate(FLOWS):
+            path = Path(tmp_dir) / f'flow{number}'
+            seconds = float('inf')
+            for _ in range(REPEAT):
+                start = time.perf_counter()
+                flow(duties, index, stops, path)
+                seconds = min(seconds, time.perf_counter() - start)
+            tracemalloc.start()
+            flow(duties, index, stops, path)
+            peak_mb = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+            print(f"{name:>28} {seconds:>8.2f} {peak_mb:>8.1f}")
@@ -0,0 +1,85 @@
+import asyncio
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from benchmarks.synthetic import load_template, scale_dataset, write_dataset
+
+"""
+Benchmarks the report service (src/service.py) with a local load generator.
+
+A synthetic schedule (20x mini_json_dataset.json by default) is served by
+`python -m src.service` in a subprocess. Concurrent keep-alive clients then
+send per-duty queries for random duties and break thresholds, first with a
+cold cache and then with a warm one, and the latency percentiles and
+throughput are reported. For comparison, the time to answer a single duty
+query from a fresh process (import, parse and index, as when the CLI is
+spawned per request) is measured as well.
+
+Run from the repository root with `python -m benchmarks.bench_service [scale] [clients] [requests]`.
+"""
+
+DEFAULT_SCALE = 20
+DEFAULT_CLIENTS = 16
+DEFAULT_REQUESTS = 20_000
+THRESHOLDS = (15, 30)
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+
+"""Send GET requests on one keep-alive connection, recording the latency of each."""
+async def client(port, targets, latencies):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    for target in targets:
+        start = time.perf_counter()
+        writer.write(f"GET {target} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+        head = await reader.readuntil(b'\r\n\r\n')
+        length = next(int(line.split(b':')[1]) for line in head.split(b'\r\n')
+                      if line.lower().startswith(b'content-length'))
+        await reader.readexactly(length)
+        latencies.append(time.perf_counter() - start)
+    writer.close()
+
+async def load(port, targets, clients):
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(client(port, targets[number::clients], latencies) for number in range(clients)))
+    return latencies, time.perf_counter() - start
+
+def print_load(label, latencies, seconds):
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(f"  {label:<11} {len(latencies) / seconds:>9.0f} req/s   p50 {quantiles[49] * 1000:6.2f} ms"
+          f"   p95 {quantiles[94] * 1000:6.2f} ms   p99 {quantiles[98] * 1000:6.2f} ms")
+
+
+if __name__ == '__main__':
+    scale = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SCALE
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_CLIENTS
+    request_count = int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_REQUESTS
+    rng = random.Random(0)
+    json_data = scale_dataset(load_template(), scale)
+    duty_ids = [duty['duty_id'] for duty in json_data['duties']]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir) / 'schedule.json'
+        write_dataset(json_data, path)
+        print(f"{scale}x: {len(duty_ids)} duties, {clients} clients, {request_count} requests per run")
+
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', f"from src.service import Dataset; Dataset.load({str(path)!r})"
+                        f".duty({duty_ids[0]!r})"], cwd=ROOT_DIR, check=True)
+        print(f"  fresh process per query: {time.perf_counter() - start:.2f} s")
+
+        server = subprocess.Popen([sys.executable, '-m', 'src.service', str(path), '--port', '0'],
+                                  cwd=ROOT_DIR, stdout=subprocess.PIPE, text=True)
+        try:
+            port = int(server.stdout.readline().rsplit(':', 1)[1])
+            targets = [f"/duties/{rng.choice(duty_ids)}?threshold={rng.choice(THRESHOLDS)}"
+                       for _ in range(request_count)]
+            print_load('cold cache', *asyncio.run(load(port, targets, clients)))
+            print_load('warm cache', *asyncio.run(load(port, targets, clients)))
+        finally:
+            server.terminate()
+            server.wait()
@@ -0,0 +1,63 @@
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from benchmarks.synthetic import load_template, scale_dataset, write_dataset
+from src.snapshot import snapshot_path
+
+"""
+Benchmarks startup from the binary snapshot of src/snapshot.py against parsing
+the JSON schedule, on synthetic schedules of 10x and 100x mini_json_dataset.json.
+
+Each loader runs in a fresh process (so imports count, as for a CLI run) and
+builds the inputs of the steps: json.load plus the index, the streaming loader,
+the cold snapshot load (parse, index and write the snapshot) and the warm one
+(memory-map the snapshot). The time to then run steps 1-3 is reported as well,
+since the snapshot builds each duty's records when it is first queried.
+
+Run from the repository root with `python -m benchmarks.bench_snapshot [scale...]`.
+"""
+
+DEFAULT_SCALES = [10, 100]
+ROOT_DIR = Path(__file__).resolve().parent.parent
+LOADERS = {
+    'json.load': "from src.main import load_report_inputs as load; duties, _, stops, index = load(path)",
+    'stream': "from src.main import load_report_inputs as load; duties, _, stops, index = load(path, stream=True)",
+    'snapshot': "from src.snapshot import load_schedule_snapshot as load; duties, stops, index = load(path)",
+}
+SCRIPT = """
+import time
+start = time.perf_counter()
+path = {path!r}
+{loader}
+loaded = time.perf_counter()
+from src.pipeline import fan_out, fused, pipeline, ListSink
+pipeline(duties) | fused(index, stops) | fan_out(ListSink())
+print(loaded - start, time.perf_counter() - loaded)
+"""
+
+
+"""Run a loader in a fresh process; returns (process seconds, load seconds, steps seconds)."""
+def run(loader, path):
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', SCRIPT.format(path=str(path), loader=LOADERS[loader])],
+                            cwd=ROOT_DIR, check=True, capture_output=True, text=True).stdout
+    load_seconds, steps_seconds = map(float, output.split())
+    return time.perf_counter() - start, load_seconds, steps_seconds
+
+
+if __name__ == '__main__':
+    scales = [int(scale) for scale in sys.argv[1:]] or DEFAULT_SCALES
+    template = load_template()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for scale in scales:
+            path = Path(tmp_dir) / f'schedule_{scale}x.json'
+            write_dataset(scale_dataset(template, scale), path)
+            print(f"{scale}x: {path.stat().st_size / 2**20:.1f} MB of JSON")
+            print(f"  {'loader':<16} {'process s':>9} {'load s':>8} {'steps s':>8}")
+            for label, loader in [('json.load', 'json.load'), ('stream', 'stream'),
+                                  ('snapshot, cold', 'snapshot'), ('snapshot, warm', 'snapshot')]:
+                process_seconds, load_seconds, steps_seconds = run(loader, path)
+                print(f"  {label:<16} {process_seconds:>9.2f} {load_seconds:>8.3f} {steps_seconds:>8.3f}")
+            print(f"  snapshot size: {snapshot_path(path).stat().st_size / 2**20:.1f} MB")
@@ -0,0 +1,42 @@
+import random
+import time
+from src.stops import StopRegistry
+from src.utils import find_stop_name_by_id
+
+"""
+Benchmarks stop name lookups on a 5,000-stop network: the linear
+find_stop_name_by_id scan over the stops list against the StopRegistry.
+
+Run from the repository root with `python -m benchmarks.bench_stop_registry`.
+"""
+
+STOP_COUNT = 5_000
+LOOKUPS = 200_000
+LINEAR_LOOKUPS = 2_000
+
+
+def per_lookup(function, stop_ids):
+    start = time.perf_counter()
+    for stop_id in stop_ids:
+        function(stop_id)
+    return (time.perf_counter() - start) / len(stop_ids)
+
+
+if __name__ == '__main__':
+    rng = random.Random(0)
+    stops = [{'stop_id': f"S{number}", 'stop_name': f"Stop {number}", 'is_depot': False} for number in range(STOP_COUNT)]
+    stop_ids = [f"S{rng.randrange(STOP_COUNT)}" for _ in range(LOOKUPS)]
+
+    start = time.perf_counter()
+    registry = StopRegistry(stops)
+    build_seconds = time.perf_counter() - start
+    codes = [registry.code(stop_id) for stop_id in stop_ids]
+
+    linear = per_lookup(lambda stop_id: find_stop_name_by_id(stop_id, stops), stop_ids[:LINEAR_LOOKUPS])
+    by_id = per_lookup(registry.name, stop_ids)
+    by_code = per_lookup(registry.name_of, codes)
+
+    print(f"{STOP_COUNT} stops, registry built in {build_seconds * 1e3:.1f} ms")
+    print(f"  find_stop_name_by_id (list)  {linear * 1e6:10.3f} us/lookup")
+    print(f"  StopRegistry.name (by ID)    {by_id * 1e6:10.3f} us/lookup")
+    print(f"  StopRegistry.name_of (code)  {by_code * 1e6:10.3f} us/lookup")
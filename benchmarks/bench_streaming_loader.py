@@ -0,0 +1,88 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from benchmarks.synthetic import load_template, scale_dataset, write_dataset
+from src.index import DutyEventIndex, TripIndex, resolve_service_trips
+from src.streaming import CHUNK_SIZE, load_json_stream, stream_report_inputs
+from src.utils import load_json_data
+
+"""
+Compares peak memory and load time of the schedule loaders.
+
+A synthetic schedule is written to a temporary file, then each loader runs in
+its own subprocess, once for timing and once under tracemalloc to record the
+peak memory it allocates (module imports, pandas included, are excluded):
+
+- json.load: load_json_data followed by trip resolution and the duty index.
+- compact: load_json_stream followed by the same stages.
+- stream: stream_report_inputs, feeding the index straight from the file.
+- validate: stream_report_inputs(validate=True), also passing every record
+  to the ScheduleValidator, as main does by default.
+
+Every loader ends with the timelines of the index resolved. The benchmark
+fails when the stream loader peaks above MAX_STREAM_PEAK_RATIO of the file
+size, or the validate loader above MAX_VALIDATE_PEAK_RATIO of it (the
+validator keeps the IDs and packed times later records may refer to), plus
+the read buffer of the streaming reader.
+
+Run from the repository root with `python -m benchmarks.bench_streaming_loader [scale]`.
+"""
+
+DEFAULT_SCALE = 50
+LOADERS = ('json.load', 'compact', 'stream', 'validate')
+MAX_STREAM_PEAK_RATIO = 0.75
+MAX_VALIDATE_PEAK_RATIO = 1.0
+
+
+"""Load the file with the given loader, build the duty index and resolve its timelines."""
+def run_loader(loader, filepath):
+    if loader in ('stream', 'validate'):
+        _, _, index = stream_report_inputs(filepath, validate=loader == 'validate')
+    else:
+        json_data = load_json_data(filepath) if loader == 'json.load' else load_json_stream(filepath)
+        resolve_service_trips(json_data['vehicles'], TripIndex(json_data['trips']))
+        index = DutyEventIndex(json_data['vehicles'], json_data['duties'])
+    index.timeline_arrays()
+
+"""Run a loader in a fresh interpreter; returns the number the child prints (seconds or peak MB)."""
+def measure(mode, loader, filepath):
+    output = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.bench_streaming_loader', mode, loader, str(filepath)],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return float(output)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--time']:
+        start = time.perf_counter()
+        run_loader(sys.argv[2], sys.argv[3])
+        print(time.perf_counter() - start)
+        sys.exit(0)
+    if sys.argv[1:2] == ['--memory']:
+        tracemalloc.start()
+        run_loader(sys.argv[2], sys.argv[3])
+        print(tracemalloc.get_traced_memory()[1] / 2**20)
+        sys.exit(0)
+
+    scale = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SCALE
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filepath = Path(tmp_dir) / f'schedule_{scale}x.json'
+        write_dataset(scale_dataset(load_template(), scale), filepath)
+        size_mb = os.path.getsize(filepath) / 2**20
+        print(f"{scale}x schedule: {size_mb:.1f} MB on disk")
+        print(f"{'loader':>10} {'seconds':>8} {'peak MB':>8}")
+        peaks = {}
+        for loader in LOADERS:
+            seconds = measure('--time', loader, filepath)
+            peaks[loader] = measure('--memory', loader, filepath)
+            print(f"{loader:>10} {seconds:>8.2f} {peaks[loader]:>8.1f}")
+    for loader, ratio in (('stream', MAX_STREAM_PEAK_RATIO), ('validate', MAX_VALIDATE_PEAK_RATIO)):
+        # The reader keeps up to one chunk of text and a copy of it while refilling.
+        limit_mb = ratio * size_mb + 2 * CHUNK_SIZE / 2**20
+        if peaks[loader] > limit_mb:
+            sys.exit(f"{loader} peaked at {peaks[loader]:.1f} MB, above the {limit_mb:.1f} MB limit")
@@ -0,0 +1,222 @@
+import argparse
+import contextlib
+import fnmatch
+import io
+import json
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+from benchmarks.synthetic import DEFAULT_SEED, load_template, write_scaled_dataset
+from src.index import DutyEventIndex
+from src.main import generate_reports, load_report_inputs
+from src.steps import generate_start_end_times, generate_stop_names, generate_breaks_info
+from src.utils import (calculate_breaks, compare_times, export_to_excel, find_stop_name_by_id, format_time,
+                       format_times, load_json_data, time_to_minutes, times_to_minutes)
+
+"""
+Benchmark suite: times each function of src/steps.py and src/utils.py, and the
+end-to-end flow of src/main.py, on seeded synthetic schedules (see
+benchmarks/synthetic.py) at several scales.
+
+Every benchmark gets fresh inputs before each run (e.g. a cold DutyEventIndex
+for the steps) and is run up to --repeat times, stopping early once it used
+MAX_SECONDS; the best wall time is kept. Results can be saved as a JSON
+baseline with --save and compared with a stored baseline with --compare: a
+benchmark slower than the baseline by more than --tolerance (a fraction) is a
+regression, and the suite then exits with status 1. Timings under MIN_SECONDS
+are too noisy to compare and are skipped.
+
+1000x needs about 8 GB of memory for the in-memory benchmarks, and the XLSX
+exports take minutes there; use --only to run a subset (glob patterns on the
+names, e.g. --only 'steps.*').
+
+Run from the repository root with
+`python -m benchmarks.bench_suite [--scales 10 100] [--save baseline.json] [--compare baseline.json]`.
+"""
+
+DEFAULT_SCALES = [10, 100]
+REPEAT = 3
+# A benchmark is not repeated once its runs took this many seconds in total.
+MAX_SECONDS = 10.0
+DEFAULT_TOLERANCE = 0.25
+MIN_SECONDS = 0.002
+
+
+"""The inputs shared by the benchmarks of one scale."""
+class Context:
+
+    def __init__(self, path, output_dir):
+        self.path = path
+        self.output_dir = output_dir
+        self.duties, self.vehicles, self.stops, index = load_report_inputs(path)
+        self.stop_list = load_json_data(path)['stops']
+        self.timelines = [index.events(duty_id) for duty_id in index.duty_ids()]
+        self.start_end_times = generate_start_end_times(self.duties, self.vehicles, index)
+        self.start_end_with_stop_names = generate_stop_names(self.start_end_times, self.stops)
+        self.full_report = generate_breaks_info(self.start_end_with_stop_names, self.vehicles, self.stops, index)
+        self.time_strs = [
+            event[field] for vehicle in self.vehicles for event in vehicle['vehicle_events']
+            for field in ('start_time', 'end_time') if event.get(field) is not None
+        ]
+        self.minutes = [time_to_minutes(time_str) for time_str in self.time_strs]
+        self.first_stop_ids = [duty_data['First Stop ID'] for duty_data in self.start_end_times]
+
+    def index(self):
+        """Return a new, cold DutyEventIndex of the schedule."""
+        return DutyEventIndex(self.vehicles, self.duties, self.stops)
+
+"""Prepare a run of step(context, index) on a new DutyEventIndex, so resolving the timelines is timed."""
+def cold_index(step):
+    def prepare(context):
+        index = context.index()
+        return (lambda: step(context, index)), len(context.duties)
+    return prepare
+
+# Each benchmark prepares a run from the Context (untimed) and returns
+# (function to time, number of items it processes).
+BENCHMARKS = [
+    ('utils.load_json_data', lambda c: (lambda: load_json_data(c.path), len(c.duties))),
+    ('main.load_report_inputs', lambda c: (lambda: load_report_inputs(c.path), len(c.duties))),
+    ('utils.time_to_minutes', lambda c: (lambda: [time_to_minutes(value) for value in c.time_strs], len(c.time_strs))),
+    ('utils.times_to_minutes', lambda c: (lambda: times_to_minutes(c.time_strs), len(c.time_strs))),
+    ('utils.format_time', lambda c: (lambda: [format_time(value) for value in c.minutes], len(c.minutes))),
+    ('utils.format_times', lambda c: (lambda: format_times(c.minutes), len(c.minutes))),
+    ('utils.compare_times', lambda c: (
+        lambda: [compare_times(a, b) for a, b in zip(c.time_strs, c.time_strs[1:])], len(c.time_strs) - 1)),
+    ('utils.find_stop_name_by_id', lambda c: (
+        lambda: [find_stop_name_by_id(stop_id, c.stop_list) for stop_id in c.first_stop_ids], len(c.first_stop_ids))),
+    ('utils.find_stop_name_by_id[registry]', lambda c: (
+        lambda: [find_stop_name_by_id(stop_id, c.stops) for stop_id in c.first_stop_ids], len(c.first_stop_ids))),
+    ('utils.calculate_breaks', lambda c: (
+        lambda: [calculate_breaks(timeline, c.stops) for timeline in c.timelines], len(c.timelines))),
+    ('steps.generate_start_end_times', cold_index(
+        lambda c, index: generate_start_end_times(c.duties, c.vehicles, index))),
+    ('steps.generate_stop_names', lambda c: (
+        lambda: generate_stop_names(c.start_end_times, c.stops), len(c.start_end_times))),
+    ('steps.generate_breaks_info', cold_index(
+        lambda c, index: generate_breaks_info(c.start_end_with_stop_names, c.vehicles, c.stops, index))),
+    ('steps.generate_breaks_info[pandas]', cold_index(
+        lambda c, index: generate_breaks_info(c.start_end_with_stop_names, c.vehicles, c.stops, index, 'pandas'))),
+    ('utils.export_to_excel[step1]', lambda c: (
+        lambda: export_to_excel(c.start_end_times, c.output_dir / 'step1', step=1), len(c.duties))),
+    ('utils.export_to_excel[step2]', lambda c: (
+        lambda: export_to_excel(c.start_end_with_stop_names, c.output_dir / 'step2', step=2), len(c.duties))),
+    ('utils.export_to_excel[step3]', lambda c: (
+        lambda: export_to_excel(c.full_report, c.output_dir / 'step3', step=3), len(c.duties))),
+    ('main.generate_reports', lambda c: (lambda: generate_reports(c.path, c.output_dir / 'main'), len(c.duties))),
+    ('main.generate_reports[csv]', lambda c: (
+        lambda: generate_reports(c.path, c.output_dir / 'main_csv', fmt='csv'), len(c.duties))),
+]
+
+
+"""Run a benchmark up to `repeat` times; returns its result: best seconds, items and items/s."""
+def run_benchmark(prepare, context, repeat=REPEAT):
+    best, spent = float('inf'), 0.0
+    for _ in range(repeat):
+        function, items = prepare(context)
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            function()
+            seconds = time.perf_counter() - start
+        best, spent = min(best, seconds), spent + seconds
+        if spent >= MAX_SECONDS:
+            break
+    return {'seconds': best, 'items': items, 'items_per_second': items / best if best else None}
+
+"""Run the selected benchmarks on a synthetic schedule of each scale; returns the results document."""
+def run_suite(scales, seed=DEFAULT_SEED, repeat=REPEAT, patterns=None):
+    selected = [
+        (name, prepare) for name, prepare in BENCHMARKS
+        if not patterns or any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns)
+    ]
+    results = {}
+    template = load_template()
+    for scale in scales:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / f'schedule_{scale}x.json'
+            write_scaled_dataset(template, scale, path, seed)
+            context = Context(path, Path(tmp_dir))
+            print(f"{scale}x: {len(context.duties)} duties", file=sys.stderr)
+            results[f'{scale}x'] = {}
+            for name, prepare in selected:
+                results[f'{scale}x'][name] = result = run_benchmark(prepare, context, repeat)
+                print(f"  {name:<40} {result['seconds']:>9.4f} s", file=sys.stderr)
+            del context
+    return {
+        'meta': {'python': platform.python_version(), 'platform': platform.platform(),
+                 'seed': seed, 'repeat': repeat, 'created': time.strftime('%Y-%m-%dT%H:%M:%S')},
+        'results': results,
+    }
+
+"""Compare results with a baseline; returns rows of (scale, name, baseline s, current s, ratio, status).
+
+The status is 'regression' when the current time exceeds the baseline by more
+than `tolerance`, 'faster' when it is below it by as much, 'noise' when both
+are under MIN_SECONDS, 'new' for benchmarks missing from the baseline, and
+'ok' otherwise.
+"""
+def compare(current, baseline, tolerance=DEFAULT_TOLERANCE):
+    rows = []
+    for scale, benchmarks in current['results'].items():
+        for name, result in benchmarks.items():
+            previous = baseline['results'].get(scale, {}).get(name)
+            if previous is None:
+                rows.append((scale, name, None, result['seconds'], None, 'new'))
+                continue
+            ratio = result['seconds'] / previous['seconds'] if previous['seconds'] else float('inf')
+            if max(result['seconds'], previous['seconds']) < MIN_SECONDS:
+                status = 'noise'
+            elif ratio > 1 + tolerance:
+                status = 'regression'
+            elif ratio < 1 / (1 + tolerance):
+                status = 'faster'
+            else:
+                status = 'ok'
+            rows.append((scale, name, previous['seconds'], result['seconds'], ratio, status))
+    return rows
+
+def print_results(document):
+    print(f"{'scale':>6} {'benchmark':<40} {'seconds':>9} {'items':>9} {'items/s':>12}")
+    for scale, benchmarks in document['results'].items():
+        for name, result in benchmarks.items():
+            rate = '-' if result['items_per_second'] is None else f"{result['items_per_second']:.0f}"
+            print(f"{scale:>6} {name:<40} {result['seconds']:>9.4f} {result['items']:>9} {rate:>12}")
+
+def print_comparison(rows, tolerance):
+    print(f"{'scale':>6} {'benchmark':<40} {'baseline s':>10} {'current s':>10} {'ratio':>7}  status")
+    for scale, name, previous, seconds, ratio, status in rows:
+        previous = '-' if previous is None else f"{previous:.4f}"
+        ratio = '-' if ratio is None else f"{ratio:.2f}"
+        print(f"{scale:>6} {name:<40} {previous:>10} {seconds:>10.4f} {ratio:>7}  {status}")
+    regressions = sum(row[5] == 'regression' for row in rows)
+    print(f"{regressions} regressions beyond {tolerance:.0%}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Time the report functions on synthetic schedules.")
+    parser.add_argument('--scales', nargs='+', type=int, default=DEFAULT_SCALES, help="sizes, as multiples of the template")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help="seed of the synthetic schedules")
+    parser.add_argument('--repeat', type=int, default=REPEAT, help="runs of each benchmark (the best is kept)")
+    parser.add_argument('--only', nargs='+', help="only run the benchmarks matching these glob patterns")
+    parser.add_argument('--save', type=Path, help="save the results as a JSON baseline")
+    parser.add_argument('--compare', type=Path, help="compare the results with this JSON baseline")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="slowdown over the baseline flagged as a regression, as a fraction")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+    document = run_suite(args.scales, args.seed, args.repeat, args.only)
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump(document, file, indent=2)
+    if baseline is None:
+        print_results(document)
+        raise SystemExit(0)
+    rows = compare(document, baseline, args.tolerance)
+    print_comparison(rows, args.tolerance)
+    raise SystemExit(1 if any(row[5] == 'regression' for row in rows) else 0)
@@ -0,0 +1,40 @@
+import random
+import time
+from src.utils import compare_times, format_time, format_times, time_to_minutes, times_to_minutes
+
+"""
+Microbenchmarks the time representation: parse, compare and format throughput
+for the 'day.HH:MM' strings against the integer-minute path.
+
+Run from the repository root with `python -m benchmarks.bench_times`.
+"""
+
+COUNT = 1_000_000
+
+
+def throughput(function, count=COUNT):
+    start = time.perf_counter()
+    function()
+    return count / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    rng = random.Random(0)
+    minutes = [rng.randrange(2 * 24 * 60) for _ in range(COUNT)]
+    time_strs = [format_time(value) for value in minutes]
+    pairs = list(zip(time_strs, reversed(time_strs)))
+    minute_pairs = list(zip(minutes, reversed(minutes)))
+
+    results = [
+        ('parse', 'time_to_minutes per string', throughput(lambda: [time_to_minutes(value) for value in time_strs])),
+        ('parse', 'times_to_minutes on the column', throughput(lambda: times_to_minutes(time_strs))),
+        ('compare', 'compare_times on strings', throughput(lambda: [compare_times(a, b) for a, b in pairs])),
+        ('compare', 'int <', throughput(lambda: [a < b for a, b in minute_pairs])),
+        ('sort', 'sorted(key=time_to_minutes)', throughput(lambda: sorted(time_strs, key=time_to_minutes))),
+        ('sort', 'sorted ints', throughput(lambda: sorted(minutes))),
+        ('format', 'format_time per value', throughput(lambda: [format_time(value) for value in minutes])),
+        ('format', 'format_times on the column', throughput(lambda: format_times(minutes))),
+    ]
+    print(f"{'operation':>9} {'implementation':<32} {'M items/s':>10}")
+    for operation, implementation, items_per_second in results:
+        print(f"{operation:>9} {implementation:<32} {items_per_second / 1e6:>10.2f}")
@@ -0,0 +1,75 @@
+import random
+import time
+from benchmarks.synthetic import load_template, scale_dataset
+from src.index import TripIndex, resolve_service_trips
+
+"""
+Benchmarks service trip resolution against the trips table.
+
+1. Lookup: TripIndex.get against a linear search of the trips list, with
+   500k trips built by copying the template trips.
+2. Enrichment: resolve_service_trips on synthetic datasets from 1x to 100x
+   the size of mini_json_dataset.json; the cost per event should stay flat.
+
+Run from the repository root with `python -m benchmarks.bench_trip_index`.
+"""
+
+TRIP_COUNT = 500_000
+LOOKUPS = 100_000
+LINEAR_LOOKUPS = 20
+FACTORS = [1, 10, 100]
+
+
+"""Copies the template trips, with suffixed IDs, until there are `count` trips."""
+def build_trips(template_trips, count):
+    trips = []
+    copy_number = 0
+    while len(trips) < count:
+        for trip in template_trips[:count - len(trips)]:
+            trips.append(dict(trip, trip_id=f"{trip['trip_id']}_{copy_number}"))
+        copy_number += 1
+    return trips
+
+def linear_lookup(trips, trip_id):
+    for trip in trips:
+        if trip['trip_id'] == trip_id:
+            return trip
+    return None
+
+
+if __name__ == '__main__':
+    template = load_template()
+    rng = random.Random(0)
+
+    trips = build_trips(template['trips'], TRIP_COUNT)
+    start = time.perf_counter()
+    trip_index = TripIndex(trips)
+    build_seconds = time.perf_counter() - start
+    trip_ids = [rng.choice(trips)['trip_id'] for _ in range(LOOKUPS)]
+
+    start = time.perf_counter()
+    for trip_id in trip_ids:
+        trip_index.get(trip_id)
+    indexed_seconds = (time.perf_counter() - start) / LOOKUPS
+
+    start = time.perf_counter()
+    for trip_id in trip_ids[:LINEAR_LOOKUPS]:
+        linear_lookup(trips, trip_id)
+    linear_seconds = (time.perf_counter() - start) / LINEAR_LOOKUPS
+
+    print(f"Lookup over {TRIP_COUNT} trips (index built in {build_seconds:.2f} s)")
+    print(f"  TripIndex.get   {indexed_seconds * 1e6:12.3f} us/lookup")
+    print(f"  linear search   {linear_seconds * 1e6:12.3f} us/lookup")
+    print()
+
+    print(f"{'scale':>6} {'service trips':>14} {'build+enrich s':>15} {'us/event':>9}")
+    for factor in FACTORS:
+        json_data = scale_dataset(template, factor)
+        service_trips = sum(
+            1 for vehicle in json_data['vehicles'] for event in vehicle['vehicle_events']
+            if event['vehicle_event_type'] == 'service_trip'
+        )
+        start = time.perf_counter()
+        resolve_service_trips(json_data['vehicles'], TripIndex(json_data['trips']))
+        seconds = time.perf_counter() - start
+        print(f"{factor:>5}x {service_trips:>14} {seconds:>15.3f} {seconds / service_trips * 1e6:>9.2f}")
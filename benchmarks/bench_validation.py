@@ -0,0 +1,68 @@
+import sys
+import tempfile
+import time
+from pathlib import Path
+from benchmarks.synthetic import DEFAULT_SEED, load_template, write_scaled_dataset
+from src.main import load_report_inputs
+from src.streaming import iter_schedule
+from src.validation import ScheduleValidator
+
+"""
+Benchmarks the validation pass of src/validation.py on seeded synthetic
+schedules, up to 1000x mini_json_dataset.json (about 1 GB of JSON).
+
+Every schedule is streamed record by record (see src/streaming.py) three
+times: once only parsing it, once also passing every record to a
+ScheduleValidator, so the difference is what validating costs, and once to a
+ScheduleValidator(fast_path=False), which checks every record field by field
+and shows what the fast path saves. Up to
+WHOLE_MAX_SCALE, load_report_inputs is also timed with and without
+validation, as every report run loads a schedule; larger schedules do not fit
+in memory as one document and are only streamed.
+
+Run from the repository root with `python -m benchmarks.bench_validation [scale ...]`.
+"""
+
+DEFAULT_SCALES = [10, 100, 1000]
+WHOLE_MAX_SCALE = 100
+
+
+"""Stream every record of a schedule into `validator`, if any; returns the record count and the seconds taken."""
+def stream(path, validator=None):
+    records = 0
+    start = time.perf_counter()
+    for section, record in iter_schedule(path):
+        if validator is not None:
+            validator.add(section, record)
+        records += 1
+    if validator is not None:
+        issues = validator.finish()
+        assert not issues, issues[:5]
+    return records, time.perf_counter() - start
+
+def timed_load(path, validate):
+    start = time.perf_counter()
+    load_report_inputs(path, validate=validate)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    scales = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SCALES
+    template = load_template()
+    print(f"{'scale':>6} {'records':>9} {'parse s':>8} {'validate s':>10} {'records/s':>10} {'overhead':>8} "
+          f"{'thorough s':>10} {'fast path':>9} {'load s':>7} {'validated':>9}")
+    for scale in scales:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / f'schedule_{scale}x.json'
+            write_scaled_dataset(template, scale, path, DEFAULT_SEED)
+            records, parse_seconds = stream(path)
+            _, streamed_seconds = stream(path, ScheduleValidator())
+            seconds = max(streamed_seconds - parse_seconds, 1e-9)
+            _, thorough_seconds = stream(path, ScheduleValidator(fast_path=False))
+            thorough_seconds = max(thorough_seconds - parse_seconds, 1e-9)
+            load = validated = '-'
+            if scale <= WHOLE_MAX_SCALE:
+                load, validated = f"{timed_load(path, False):.2f}", f"{timed_load(path, True):.2f}"
+        print(f"{scale:>6} {records:>9} {parse_seconds:>8.2f} {seconds:>10.2f} {records / seconds:>10.0f} "
+              f"{seconds / parse_seconds:>8.0%} {thorough_seconds:>10.2f} {thorough_seconds / seconds:>8.1f}x "
+              f"{load:>7} {validated:>9}")
@@ -0,0 +1,94 @@
+import gc
+import random
+import sys
+import time
+from src.breaks import BreakRule, BreakRules
+from src.index import DutyEventIndex
+from src.stops import StopRegistry
+from src.utils import BREAK_THRESHOLD, format_time
+from src.steps import generate_breaks_info
+from benchmarks.synthetic import load_template
+
+"""
+Benchmarks break detection at 1M duty events: the per-duty calculate_breaks
+path of generate_breaks_info against the vectorised pandas/NumPy engine.
+
+The events are generated straight into a DutyEventIndex (20 per duty, random
+durations and gaps, stops from mini_json_dataset.json). Both engines run end
+to end through generate_breaks_info, with the default threshold and with
+RULES, and must find the same breaks; the end-to-end ratio is what choosing
+the engine gains. Each engine is timed REPEAT times and the best run is kept.
+The benchmark fails when the vectorised engine is less than MIN_SPEEDUP times
+faster.
+
+Run from the repository root with `python -m benchmarks.bench_vectorized_breaks [events]`.
+"""
+
+DEFAULT_EVENTS = 1_000_000
+EVENTS_PER_DUTY = 20
+REPEAT = 3
+MIN_SPEEDUP = 10
+RULES = BreakRules([
+    BreakRule('depot meal', min_duration=30, depot=True, paid=True),
+    BreakRule('relief', max_duration=30),
+    BreakRule('break'),
+])
+
+
+"""Yield synthetic vehicles, one per duty, with timed events at random stops."""
+def generate_vehicles(event_count, stop_ids, rng):
+    for duty_number in range(event_count // EVENTS_PER_DUTY):
+        minute = rng.randrange(3 * 60, 8 * 60)
+        events = []
+        for _ in range(EVENTS_PER_DUTY):
+            duration = rng.randrange(5, 60)
+            events.append({
+                'start_time': format_time(minute),
+                'end_time': format_time(minute + duration),
+                'destination_stop_id': rng.choice(stop_ids),
+                'duty_id': str(duty_number),
+            })
+            minute += duration + rng.randrange(0, 40)
+        yield {'vehicle_id': str(duty_number), 'vehicle_events': events}
+
+"""Run generate_breaks_info REPEAT times on fresh copies of `duties`; returns the last report and the best time.
+
+The report of the previous run is freed and garbage collected first, so no
+run pays for the collection of what the setup or another run allocated.
+"""
+def timed_report(duties, *args):
+    best = report = None
+    for _ in range(REPEAT):
+        del report
+        records = [dict(duty) for duty in duties]
+        gc.collect()
+        start = time.perf_counter()
+        report = generate_breaks_info(records, None, *args)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return report, best
+
+
+if __name__ == '__main__':
+    event_count = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_EVENTS
+    rng = random.Random(0)
+    template_stops = load_template()['stops']
+    stops = StopRegistry(template_stops)
+    index = DutyEventIndex(stops=stops)
+    for vehicle in generate_vehicles(event_count, [stop['stop_id'] for stop in template_stops], rng):
+        index.add_vehicle(vehicle)
+    duty_ids = index.duty_ids()
+    print(f"{event_count} events in {len(duty_ids)} duties")
+
+    speedups = []
+    for label, rules in (('threshold', None), ('rules', RULES)):
+        duties = [{'Duty ID': duty_id} for duty_id in duty_ids]
+        python_report, python_seconds = timed_report(duties, stops, index, 'python', BREAK_THRESHOLD, rules)
+        pandas_report, pandas_seconds = timed_report(duties, stops, index, 'pandas', BREAK_THRESHOLD, rules)
+        assert pandas_report == python_report
+        speedups.append(python_seconds / pandas_seconds)
+        print(f"  end to end, {label:<9}        python {python_seconds:6.3f} s  pandas {pandas_seconds:6.3f} s  "
+              f"({speedups[-1]:.2f}x, {sum(len(duty['Breaks']) for duty in python_report)} breaks)")
+        del python_report, pandas_report
+    if min(speedups) < MIN_SPEEDUP:
+        sys.exit(f"the pandas engine is only {min(speedups):.2f}x faster, below {MIN_SPEEDUP}x")
@@ -0,0 +1,130 @@
+import argparse
+import copy
+import json
+import random
+from pathlib import Path
+from src.utils import format_time, load_json_data, time_to_minutes
+
+"""
+Synthetic schedules for the benchmarks, built from mini_json_dataset.json.
+
+A schedule `factor` times the size of the template holds `factor` copies of
+its trips, vehicles and duties, with the copy number appended to their IDs so
+the copies stay independent. Given a seed, every copy but the first is also
+moved in time by a random whole number of minutes (at most MAX_SHIFT either
+way), the same for all of its times, so the copies differ while each stays a
+valid schedule (events keep their order, gaps and breaks). The same seed always
+gives the same schedule.
+
+scale_dataset builds the schedule in memory; write_scaled_dataset writes it
+copy by copy, so even 1000x (about 1 GB of JSON) never has to fit in memory.
+
+Run from the repository root with `python -m benchmarks.synthetic 10 100 1000 --seed 0 --output-dir DIR`.
+"""
+
+TEMPLATE_PATH = Path(__file__).resolve().parent.parent / 'data' / 'mini_json_dataset.json'
+SCALES = (10, 100, 1000)
+DEFAULT_SEED = 0
+# Largest time shift of a copy, in minutes. The template starts at 0.03:15.
+MAX_SHIFT = 120
+TIME_FIELDS = ('start_time', 'end_time', 'departure_time', 'arrival_time')
+
+
+"""Load the dataset used as the template for the synthetic schedules."""
+def load_template():
+    return load_json_data(TEMPLATE_PATH)
+
+"""Return the time shift of each copy: all 0 without a seed, random from the seed otherwise (the first copy is never shifted)."""
+def copy_shifts(factor, seed=None):
+    if seed is None:
+        return [0] * factor
+    rng = random.Random(seed)
+    return [0] + [rng.randint(-MAX_SHIFT, MAX_SHIFT) for _ in range(factor - 1)]
+
+def _shift_times(record, shift):
+    for field in TIME_FIELDS:
+        if shift and record.get(field) is not None:
+            record[field] = format_time(time_to_minutes(record[field]) + shift)
+
+"""Return copy `copy_number` of the trips, vehicles or duties (`section`) of the template, moved `shift` minutes."""
+def copy_section(json_data, section, copy_number, shift=0):
+    suffix = f"_{copy_number}" if copy_number else ""
+    records = []
+    for record in json_data[section]:
+        record = copy.deepcopy(record)
+        if section == 'trips':
+            record['trip_id'] += suffix
+            _shift_times(record, shift)
+            for sub_trip in record.get('sub_trips', ()):
+                _shift_times(sub_trip, shift)
+        elif section == 'vehicles':
+            record['vehicle_id'] += suffix
+            for event in record['vehicle_events']:
+                if 'duty_id' in event:
+                    event['duty_id'] += suffix
+                if 'trip_id' in event:
+                    event['trip_id'] += suffix
+                _shift_times(event, shift)
+        else:
+            record['duty_id'] += suffix
+            for event in record['duty_events']:
+                if 'vehicle_id' in event:
+                    event['vehicle_id'] += suffix
+                _shift_times(event, shift)
+        records.append(record)
+    return records
+
+"""Builds a dataset `factor` times the size of the template.
+
+The stops are shared; every trip, vehicle and duty is copied `factor` times,
+with the copy number appended to its ID so the copies stay independent. With
+a seed, the copies are also moved in time (see copy_shifts).
+"""
+def scale_dataset(json_data, factor, seed=None):
+    shifts = copy_shifts(factor, seed)
+    scaled = {'stops': json_data['stops']}
+    for section in ('trips', 'vehicles', 'duties'):
+        scaled[section] = [
+            record for copy_number, shift in enumerate(shifts)
+            for record in copy_section(json_data, section, copy_number, shift)
+        ]
+    return scaled
+
+"""Write a dataset as JSON, the way the schedule exports are laid out."""
+def write_dataset(json_data, path):
+    with open(path, 'w') as file:
+        json.dump(json_data, file, indent=1)
+
+"""Write the dataset of scale_dataset(json_data, factor, seed) to `path`, one copy at a time.
+
+The file holds the same schedule as write_dataset would write, laid out on one
+line per record.
+"""
+def write_scaled_dataset(json_data, factor, path, seed=None):
+    shifts = copy_shifts(factor, seed)
+    with open(path, 'w') as file:
+        file.write('{"stops": ' + json.dumps(json_data['stops']))
+        for section in ('trips', 'vehicles', 'duties'):
+            file.write(f', "{section}": [')
+            separator = '\n'
+            for copy_number, shift in enumerate(shifts):
+                for record in copy_section(json_data, section, copy_number, shift):
+                    file.write(separator + json.dumps(record))
+                    separator = ',\n'
+            file.write('\n]')
+        file.write('}\n')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Write synthetic schedules scaled from mini_json_dataset.json.")
+    parser.add_argument('scales', nargs='*', type=int, default=SCALES, help="sizes, as multiples of the template")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help="seed of the time shifts of the copies")
+    parser.add_argument('--output-dir', type=Path, default=Path('.'), help="folder for the schedule_<scale>x.json files")
+    args = parser.parse_args()
+
+    template = load_template()
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    for scale in args.scales:
+        path = args.output_dir / f'schedule_{scale}x.json'
+        write_scaled_dataset(template, scale, path, args.seed)
+        print(f"{path}: {path.stat().st_size / 2**20:.1f} MB")
@@ -0,0 +1,196 @@
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from src.main import generate_reports
+from src.exporters import EXPORTERS
+from src.metrics import Metrics
+from src.steps import ENGINES
+
+"""
+Batch mode: generates the reports of many schedule files at once.
+
+Schedules are given as files, directories (every *.json file in them) or glob
+patterns. Each one is processed in its own worker process, at most --jobs at a
+time, so the reads and parses of some datasets overlap with the steps and the
+exports of others and the throughput grows with the cores. The outputs of
+every dataset go to their own folder, <output dir>/<file name>/. A dataset that
+fails (e.g. a malformed file) is recorded as failed without stopping the rest.
+A worker process that dies (e.g. out of memory) breaks the whole pool: the
+datasets it left unfinished are then run again, each in its own process, so
+only the one that crashes fails.
+
+A run summary with the status, the duty count and the time of each stage
+(load, steps, export, or steps+export when they are interleaved) of every
+dataset is printed and written to <output dir>/batch_summary.json.
+
+Run from the repository root with `python -m src.batch schedules/ [--jobs N] [--output-dir DIR]`.
+"""
+
+SUMMARY_FILE = 'batch_summary.json'
+STAGES = ('load', 'steps', 'export', 'steps+export')
+
+
+"""Return the schedule files matching files, directories and glob patterns, in order and without duplicates."""
+def find_schedules(sources):
+    schedules = []
+    for source in map(str, sources):
+        if os.path.isdir(source):
+            schedules.extend(sorted(Path(source).glob('*.json')))
+        elif glob.has_magic(source):
+            schedules.extend(sorted(Path(path) for path in glob.glob(source, recursive=True)))
+        else:
+            schedules.append(Path(source))
+    return list(dict.fromkeys(path.resolve() for path in schedules))
+
+"""Give every schedule its own output folder, named after the file (with a number appended on clashes)."""
+def output_dirs(schedules, output_root):
+    dirs, taken = [], set()
+    for schedule in schedules:
+        name, number = schedule.stem, 1
+        while name in taken:
+            number += 1
+            name = f"{schedule.stem}_{number}"
+        taken.add(name)
+        dirs.append(Path(output_root) / name)
+    return dirs
+
+"""Return the summary stage a stage of generate_reports counts towards: load, steps, export or steps+export."""
+def summary_stage(name):
+    if name in ('load', 'steps+export'):
+        return name
+    return 'export' if name.startswith('export') else 'steps'
+
+"""Return the summary entry of a dataset that failed with `error` before run_dataset could report it."""
+def failed_entry(filepath, output_dir, error):
+    return {'file': str(filepath), 'output_dir': str(output_dir), 'status': 'failed',
+            'error': f"{type(error).__name__}: {error}", 'duties': None, 'stages': {}, 'seconds': None}
+
+"""Worker entry point: generate the reports of one schedule into output_dir with generate_reports.
+
+Never raises: any error is recorded in the returned summary entry, a dict with
+the file, output folder, status ('ok' or 'failed'), error, duty count, and the
+seconds taken by each summary stage (up to the one that failed, see
+summary_stage) and in total. What the steps print is discarded.
+"""
+def run_dataset(filepath, output_dir, engine='python', fmt=None, stream=False, snapshot=False):
+    entry = {'file': str(filepath), 'output_dir': str(output_dir), 'status': 'ok', 'error': None,
+             'duties': None, 'stages': {}, 'seconds': None}
+    metrics = Metrics()
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            entry['duties'] = generate_reports(filepath, output_dir, stream, engine, fmt=fmt, snapshot=snapshot,
+                                               metrics=metrics)
+    except Exception as e:
+        entry['status'] = 'failed'
+        entry['error'] = f"{type(e).__name__}: {e}"
+    for stage in metrics.stages:
+        name = summary_stage(stage.name)
+        entry['stages'][name] = round(entry['stages'].get(name, 0) + stage.wall_seconds, 6)
+    entry['seconds'] = round(time.perf_counter() - start, 6)
+    return entry
+
+"""Run the datasets of `tasks` (position -> run_dataset arguments) in a pool of `jobs` processes.
+
+Their entries are stored in `entries` at their positions. Returns the
+positions left unfinished because a worker process died, which breaks the
+whole pool; their entries record the BrokenProcessPool error.
+"""
+def _run_pool(tasks, entries, jobs):
+    unfinished = set()
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(run_dataset, *arguments): position for position, arguments in tasks.items()}
+        for future in as_completed(futures):
+            position = futures[future]
+            try:
+                entries[position] = future.result()
+            except Exception as e:
+                if isinstance(e, BrokenProcessPool):
+                    unfinished.add(position)
+                entries[position] = failed_entry(*tasks[position][:2], e)
+    return unfinished
+
+"""Generate the reports of many schedules in a pool of `jobs` processes.
+
+When a worker process dies, the datasets the broken pool left unfinished are
+run again one at a time, each in a new process, so a dataset that crashes its
+process is recorded as failed and the others still run.
+
+Returns the run summary: the entries of run_dataset in the order of
+`schedules`, and the totals of the run. It is also written as JSON to
+<output_root>/batch_summary.json.
+"""
+def run_batch(schedules, output_root, jobs=None, engine='python', fmt=None, stream=False, snapshot=False):
+    output_root = Path(output_root)
+    output_root.mkdir(parents=True, exist_ok=True)
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(schedules) or 1))
+    start = time.perf_counter()
+
+    entries = [None] * len(schedules)
+    tasks = {
+        position: (schedule, output_dir, engine, fmt, stream, snapshot)
+        for position, (schedule, output_dir) in enumerate(zip(schedules, output_dirs(schedules, output_root)))
+    }
+    for position in sorted(_run_pool(tasks, entries, jobs)):
+        _run_pool({position: tasks[position]}, entries, 1)
+
+    seconds = time.perf_counter() - start
+    succeeded = sum(entry['status'] == 'ok' for entry in entries)
+    summary = {
+        'jobs': jobs,
+        'datasets': len(entries),
+        'succeeded': succeeded,
+        'failed': len(entries) - succeeded,
+        'duties': sum(entry['duties'] or 0 for entry in entries if entry['status'] == 'ok'),
+        'seconds': round(seconds, 6),
+        'datasets_per_second': round(len(entries) / seconds, 3) if seconds else None,
+        'stage_seconds': {
+            stage: round(sum(entry['stages'].get(stage, 0) for entry in entries), 6) for stage in STAGES
+        },
+        'entries': entries,
+    }
+    with open(output_root / SUMMARY_FILE, 'w') as file:
+        json.dump(summary, file, indent=2)
+    return summary
+
+"""Print a run summary as a table, one line per dataset."""
+def print_summary(summary):
+    print(f"{'dataset':<32} {'status':<7} {'duties':>7} " + ' '.join(f"{stage + ' s':>8}" for stage in STAGES)
+          + f" {'total s':>8}")
+    for entry in summary['entries']:
+        stages = ' '.join(
+            f"{entry['stages'][stage]:>8.3f}" if stage in entry['stages'] else f"{'-':>8}" for stage in STAGES
+        )
+        duties = entry['duties'] if entry['duties'] is not None else '-'
+        total = f"{entry['seconds']:>8.3f}" if entry['seconds'] is not None else f"{'-':>8}"
+        print(f"{Path(entry['file']).name:<32} {entry['status']:<7} {duties:>7} {stages} {total}")
+        if entry['error']:
+            print(f"    {entry['error']}")
+    print(f"{summary['succeeded']} of {summary['datasets']} datasets in {summary['seconds']:.2f} s with "
+          f"{summary['jobs']} jobs ({summary['datasets_per_second']} datasets/s)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate the duty reports of many schedule JSON files.")
+    parser.add_argument('sources', nargs='+', help="schedule files, directories of them or glob patterns")
+    parser.add_argument('--output-dir', default='batch_output', type=Path, help="folder for the dataset folders")
+    parser.add_argument('--jobs', type=int, help="datasets processed at the same time (default: CPU count)")
+    parser.add_argument('--engine', choices=ENGINES, default='python', help="break detection engine")
+    parser.add_argument('--format', choices=EXPORTERS, help="write one streamed report per dataset in this format")
+    parser.add_argument('--stream', action='store_true', help="stream the files instead of loading them whole")
+    parser.add_argument('--snapshot', action='store_true', help="read the schedules from their binary snapshots")
+    args = parser.parse_args()
+
+    schedules = find_schedules(args.sources)
+    if not schedules:
+        parser.error("no schedule files found")
+    summary = run_batch(schedules, args.output_dir, args.jobs, args.engine, args.format, args.stream, args.snapshot)
+    print_summary(summary)
+    raise SystemExit(1 if summary['failed'] else 0)
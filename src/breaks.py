@@ -0,0 +1,340 @@
+import json
+import numpy as np
+from src.stops import UNKNOWN_STOP, as_stop_registry
+from src.utils import BREAK_THRESHOLD
+from src.vectorized import break_arrays, index_events_frame
+
+"""
+Configurable break rules, and an index of the breaks of all duties for
+time-window and stop queries.
+
+A BreakRule turns the gaps between the events of a duty into breaks of one
+kind: gaps longer than min_duration (and at most max_duration), optionally
+only at some stops or only at (or away from) depots, count as paid or unpaid
+breaks named after the rule. BreakRules tries its rules in order and the first
+one that matches a gap wins; a gap no rule matches is not a break. Rules are
+read from JSON:
+
+    {"rules": [
+        {"name": "depot meal", "depot": true, "min_duration": 30},
+        {"name": "relief", "stops": ["MTC", "EMS"], "max_duration": 45, "paid": true},
+        {"name": "break"}
+    ]}
+
+min_duration defaults to BREAK_THRESHOLD, so a single {"name": "break"} rule
+finds the same breaks as the default threshold.
+
+BreakIndex keeps the breaks of every duty in sorted arrays, globally and per
+stop, and answers "who is on break (at stop X) between t0 and t1" without
+scanning the break lists of every duty.
+"""
+
+# The JSON fields of a break rule: the types each one accepts (when not null) and how they are described in errors.
+RULE_FIELD_TYPES = {
+    'name': (str, 'a string'),
+    'min_duration': ((int, float), 'a number of minutes'),
+    'max_duration': ((int, float), 'a number of minutes'),
+    'paid': (bool, 'true or false'),
+    'stops': (list, 'a list of stop IDs'),
+    'depot': (bool, 'true or false'),
+}
+# BreakIndex groups the breaks by start time into buckets of this many minutes for on_break.
+BUCKET_MINUTES = 60
+
+
+"""A kind of break: the gaps between two events of a duty that it turns into breaks.
+
+A gap matches when it is longer than min_duration minutes, at most
+max_duration minutes (no limit when None), and its stop (the destination of
+the event before the gap) is one of stop_ids (any stop when None) and is a
+depot or not as `depot` says (either when None).
+"""
+class BreakRule:
+    __slots__ = ('name', 'min_duration', 'max_duration', 'paid', 'stop_ids', 'depot')
+
+    def __init__(self, name='break', min_duration=BREAK_THRESHOLD, max_duration=None, paid=False, stop_ids=None,
+                 depot=None):
+        self.name = name
+        self.min_duration = min_duration
+        self.max_duration = max_duration
+        self.paid = paid
+        self.stop_ids = None if stop_ids is None else tuple(stop_ids)
+        self.depot = depot
+
+    @classmethod
+    def from_dict(cls, config, position=0):
+        """Build a rule from its JSON form (the 'stops' key holds the stop IDs).
+
+        Raises ValueError naming the rule (its `position` in the list) and the
+        field on unknown keys or on values of the wrong type.
+        """
+        if not isinstance(config, dict):
+            raise ValueError(f"Break rule {position}: expected an object, got {config!r}")
+        unknown = set(config) - set(RULE_FIELD_TYPES)
+        if unknown:
+            raise ValueError(f"Break rule {position}: unknown keys {', '.join(sorted(unknown))}")
+        for field, (types, description) in RULE_FIELD_TYPES.items():
+            value = config.get(field)
+            # bool is an int, but never a valid duration.
+            if value is not None and (not isinstance(value, types) or isinstance(value, bool) and types is not bool):
+                raise ValueError(f"Break rule {position}: {field} must be {description}, got {value!r}")
+        stop_ids = config.get('stops')
+        if stop_ids is not None and not all(isinstance(stop_id, str) for stop_id in stop_ids):
+            raise ValueError(f"Break rule {position}: stops must be a list of stop IDs, got {stop_ids!r}")
+        return cls(config.get('name', 'break'), config.get('min_duration', BREAK_THRESHOLD),
+                   config.get('max_duration'), config.get('paid', False), stop_ids, config.get('depot'))
+
+    def __repr__(self):
+        fields = ', '.join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"BreakRule({fields})"
+
+"""An ordered list of BreakRules; the first rule matching a gap classifies it."""
+class BreakRules:
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        if not self.rules:
+            raise ValueError("At least one break rule is needed")
+
+    @classmethod
+    def from_config(cls, config):
+        """Build the rules from their JSON form: {"rules": [...]} or the list of rules itself."""
+        if isinstance(config, dict):
+            config = config.get('rules', [])
+        return cls(BreakRule.from_dict(rule, position) for position, rule in enumerate(config))
+
+    @classmethod
+    def load(cls, filepath):
+        with open(filepath) as file:
+            return cls.from_config(json.load(file))
+
+    def __iter__(self):
+        return iter(self.rules)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def _stop_codes(self, rule, stops):
+        return None if rule.stop_ids is None else {stops.code(stop_id) for stop_id in rule.stop_ids} - {None}
+
+    def classifier(self, stops):
+        """Return a function (duration, stop code) -> matching BreakRule or None, for the stop codes of `stops`."""
+        stops = as_stop_registry(stops)
+        bound = [(rule, self._stop_codes(rule, stops)) for rule in self.rules]
+        shortest = min(rule.min_duration for rule in self.rules)
+
+        def classify(duration, code):
+            if duration <= shortest:
+                return None
+            for rule, codes in bound:
+                if (duration > rule.min_duration
+                        and (rule.max_duration is None or duration <= rule.max_duration)
+                        and (codes is None or code in codes)
+                        and (rule.depot is None or stops.is_depot_code(code) == rule.depot)):
+                    return rule
+            return None
+        return classify
+
+    def classify_codes(self, durations, destinations, stops):
+        """Vectorised classifier: the position of the rule matching each gap, -1 when none does.
+
+        `destinations` holds stop codes of `stops`, -1 for gaps without a stop.
+        """
+        stops = as_stop_registry(stops)
+        rule_codes = np.full(len(durations), -1, dtype=np.int64)
+        undecided = np.ones(len(durations), dtype=bool)
+        # Depot flags by stop code, with a last entry for code -1.
+        depots = np.array([stops.is_depot_code(code) for code in range(len(stops))] + [False], dtype=bool)
+        for position, rule in enumerate(self.rules):
+            matches = undecided & (durations > rule.min_duration)
+            if rule.max_duration is not None:
+                matches &= durations <= rule.max_duration
+            codes = self._stop_codes(rule, stops)
+            if codes is not None:
+                matches &= np.isin(destinations, list(codes))
+            if rule.depot is not None:
+                matches &= depots[destinations] == rule.depot
+            rule_codes[matches] = position
+            undecided &= ~matches
+        return rule_codes
+
+"""Break positions grouped by start-time bucket (per group, e.g. per stop), sorted by end time within each bucket.
+
+The breaks of a bucket that end after a time are a suffix of it. Buckets are
+keyed by group and bucket number, and each break by its bucket key and end
+time packed into one int64, so a single vectorised binary search finds those
+suffixes in every bucket of a range at once. Buckets are BUCKET_MINUTES wide,
+or twice that as many times as needed for the packed keys to fit.
+"""
+class _EndsByBucket:
+
+    def __init__(self, groups, starts, ends):
+        self._start_origin = int(starts.min()) if len(starts) else 0
+        self._end_origin = int(ends.min()) if len(ends) else 0
+        # End offsets are in [0, span - 2], so -1 and span - 1 stay within a bucket's range of packed keys.
+        self._span = (int(ends.max()) - self._end_origin if len(ends) else 0) + 2
+        group_count = int(groups.max()) + 1 if len(groups) else 1
+        start_range = int(starts.max()) - self._start_origin + 1 if len(starts) else 1
+        self._width = BUCKET_MINUTES
+        while group_count * (start_range // self._width + 1) * self._span >= 2**62:
+            self._width *= 2
+        self._bucket_count = start_range // self._width + 1
+
+        keys = groups * self._bucket_count + (starts - self._start_origin) // self._width
+        self._positions = np.lexsort((ends, keys))
+        keys = keys[self._positions]
+        self._packed = keys * self._span + (ends[self._positions] - self._end_origin)
+        self._keys, offsets = np.unique(keys, return_index=True)
+        self._offsets = np.append(offsets, len(keys))
+
+    def ending_after(self, group, time, first_start, last_start):
+        """Return the positions of the breaks of `group` starting in [first_start, last_start] and ending after `time`.
+
+        Whole buckets are searched, so breaks of the first and last buckets
+        outside the start range may be returned too.
+        """
+        first = max((first_start - self._start_origin) // self._width, 0)
+        last = min((last_start - self._start_origin) // self._width, self._bucket_count - 1)
+        base = group * self._bucket_count
+        low, high = np.searchsorted(self._keys, [base + first, base + last + 1])
+        offset = min(max(time - self._end_origin, -1), self._span - 1)
+        found = np.searchsorted(self._packed, self._keys[low:high] * self._span + offset, 'right')
+        lengths = self._offsets[low + 1:high + 1] - found
+        rows = np.repeat(found - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        return self._positions[rows]
+
+"""The breaks of many duties in sorted arrays, for time-window and stop queries.
+
+Breaks are kept sorted by start time, along with their end times sorted on
+their own, both for all stops and per stop (grouped by stop code). A window
+[start, end), with start < end, holds the breaks that start before `end` and
+end after `start`: count_on_break counts them with two binary searches,
+O(log n). on_break lists them from the breaks grouped by start time into
+BUCKET_MINUTES buckets (see _EndsByBucket): in each bucket from the longest
+break before the window up to its end, the breaks ending after `start` are
+found with one binary search. That is O(b log n + m) for b buckets and m
+breaks found, plus the breaks of the last bucket that start after the window.
+
+Times are in total minutes; a break lasts from its start to start + duration.
+"""
+class BreakIndex:
+
+    def __init__(self, duty_ids, duty_codes, starts, durations, stop_codes, stops, rule_codes=None, rules=None):
+        self.duty_ids = list(duty_ids)
+        self.stops = as_stop_registry(stops)
+        self.rules = rules
+        stop_codes = np.asarray(stop_codes, dtype=np.int64)
+        starts = np.asarray(starts, dtype=np.int64)
+        durations = np.asarray(durations, dtype=np.int64)
+        # Breaks without a stop are grouped under code len(stops), after every stop.
+        self._stop_count = len(self.stops)
+        stop_codes = np.where(stop_codes < 0, self._stop_count, stop_codes)
+
+        order = np.lexsort((starts, stop_codes))
+        self._duty_codes = np.asarray(duty_codes, dtype=np.int64)[order]
+        self._starts = starts[order]
+        self._durations = durations[order]
+        self._stop_codes = stop_codes[order]
+        self._rule_codes = None if rule_codes is None else np.asarray(rule_codes, dtype=np.int64)[order]
+        ends = self._starts + self._durations
+
+        # Per stop: the breaks of stop code c are positions offsets[c]:offsets[c + 1],
+        # by start time; stop_ends holds their end times, sorted within each stop.
+        self._offsets = np.searchsorted(self._stop_codes, np.arange(self._stop_count + 2))
+        self._stop_ends = ends[np.lexsort((ends, self._stop_codes))]
+        self._stop_longest = np.zeros(self._stop_count + 1, dtype=np.int64)
+        np.maximum.at(self._stop_longest, self._stop_codes, self._durations)
+
+        # All stops: positions by start time, and the end times sorted.
+        self._sorted_starts = np.sort(self._starts)
+        self._sorted_ends = np.sort(ends)
+        self._longest = int(self._durations.max()) if len(self._durations) else 0
+
+        # For on_break: the breaks by start-time bucket, per stop and all together (group 0).
+        self._stop_buckets = _EndsByBucket(self._stop_codes, self._starts, ends)
+        self._all_buckets = _EndsByBucket(np.zeros(len(ends), dtype=np.int64), self._starts, ends)
+
+    @classmethod
+    def from_index(cls, index, duty_ids=None, threshold=BREAK_THRESHOLD, rules=None):
+        """Find the breaks of the duties of a DutyEventIndex (all of them by default) and index them."""
+        duty_codes, duty_ids, starts, durations, destinations, rule_codes = break_arrays(
+            index_events_frame(index, duty_ids), index.stops, threshold, rules)
+        return cls(duty_ids, duty_codes, starts, durations, destinations, index.stops, rule_codes, rules)
+
+    def __len__(self):
+        return len(self._starts)
+
+    def _code(self, stop_id):
+        """Return the stop code of a stop with breaks, -1 for all stops, or None for a stop without breaks."""
+        if stop_id is None:
+            return -1
+        code = self.stops.code(stop_id)
+        return None if code is None or code >= self._stop_count else code
+
+    def _check_window(self, start, end):
+        if start >= end:
+            raise ValueError(f"The window [{start}, {end}) is empty: its start must be before its end")
+
+    def count_on_break(self, start, end, stop_id=None):
+        """Return the number of breaks (at a stop) overlapping the window [start, end), in O(log n).
+
+        Raises ValueError when start >= end.
+        """
+        self._check_window(start, end)
+        code = self._code(stop_id)
+        if code is None:
+            return 0
+        if code < 0:
+            starts, ends = self._sorted_starts, self._sorted_ends
+        else:
+            low, high = self._offsets[code], self._offsets[code + 1]
+            starts, ends = self._starts[low:high], self._stop_ends[low:high]
+        # Breaks ending by `start` also start before `end`, so they are a subset of the first count.
+        return int(np.searchsorted(starts, end, 'left') - np.searchsorted(ends, start, 'right'))
+
+    def _positions(self, start, end, stop_id):
+        """Return the positions of the breaks (at a stop) overlapping [start, end), by start time."""
+        self._check_window(start, end)
+        code = self._code(stop_id)
+        if code is None:
+            return np.empty(0, dtype=np.int64)
+        if code < 0:
+            positions = self._all_buckets.ending_after(0, start, start - self._longest, end - 1)
+        else:
+            positions = self._stop_buckets.ending_after(code, start, start - int(self._stop_longest[code]), end - 1)
+        positions = np.sort(positions[self._starts[positions] < end])
+        # Positions are by stop, then start time: order the breaks of all stops by start time, then stop.
+        return positions if code >= 0 else positions[np.argsort(self._starts[positions], kind='stable')]
+
+    def on_break(self, start, end, stop_id=None):
+        """Return the breaks (at a stop) overlapping the window [start, end), by start time.
+
+        Each break is a dict with the duty_id and the keys of calculate_breaks
+        (plus break_type and paid when the index was built with rules).
+        Raises ValueError when start >= end.
+        """
+        positions = self._positions(start, end, stop_id)
+        names = self.stops.names()[:self._stop_count] + [UNKNOWN_STOP]
+        breaks = [
+            {
+                'duty_id': self.duty_ids[duty_code],
+                'break_start_time': break_start,
+                'break_duration': duration,
+                'break_stop_name': names[stop_code],
+            }
+            for duty_code, break_start, duration, stop_code in zip(
+                self._duty_codes[positions].tolist(), self._starts[positions].tolist(),
+                self._durations[positions].tolist(), self._stop_codes[positions].tolist(),
+            )
+        ]
+        if self._rule_codes is not None:
+            for break_info, rule_code in zip(breaks, self._rule_codes[positions].tolist()):
+                rule = self.rules.rules[rule_code]
+                break_info['break_type'] = rule.name
+                break_info['paid'] = rule.paid
+        return breaks
+
+    def duties_on_break(self, start, end, stop_id=None):
+        """Return the IDs of the duties with a break (at a stop) overlapping [start, end), in order of their break."""
+        positions = self._positions(start, end, stop_id)
+        return list(dict.fromkeys(self.duty_ids[code] for code in self._duty_codes[positions].tolist()))
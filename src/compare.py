@@ -0,0 +1,206 @@
+from src.exporters import EXPORTERS
+from src.incremental import content_hash
+from src.utils import format_time
+
+"""
+Compares the reports of two versions of a schedule, duty by duty.
+
+The inputs of every duty (its timeline in the DutyEventIndex, see
+duty_input_hashes) are hashed first, and the duties whose inputs are the same
+in both versions are not run through the steps at all (see unchanged_duties).
+The per-duty results of the others (start and end times, first and last stops
+and breaks, as the steps compute them) are reduced to a ReportSummary: a
+compact tuple per duty along with a content hash of it. The two summaries are
+hash-joined on the duty ID, and only the duties whose hashes differ are
+compared field by field. A summary can be collected as the results stream out
+of the pipeline of src/pipeline.py, so neither report is held in memory.
+
+Every change is a row of DIFF_COLUMNS: a start/end time or first/last stop
+that differs (with the difference in minutes for times), or a break that was
+added, removed, moved, resized or reclassified (its break type or paid flag
+changed, see src/breaks.py). Breaks of the two versions are matched when they
+overlap at the same stop. A duty that only exists in one version has all
+its fields and breaks reported as added or removed.
+"""
+
+DIFF_COLUMNS = ['Duty ID', 'Change', 'Field', 'Old Value', 'New Value', 'Delta Minutes']
+DIFF_COLUMN_TYPES = {'Delta Minutes': 'int64'}
+DUTY_FIELDS = ('Start Time', 'End Time', 'First Stop', 'Last Stop')
+TIME_FIELDS = ('Start Time', 'End Time')
+
+
+"""Reduce the result of a duty to (start, end, first stop, last stop, breaks).
+
+Breaks are (start, duration, stop, break type, paid) tuples; the last two are
+None unless the breaks were found with BreakRules.
+"""
+def duty_summary(duty_data):
+    return (
+        duty_data['Start Time'], duty_data['End Time'], duty_data['First Stop'], duty_data['Last Stop'],
+        tuple((info['break_start_time'], info['break_duration'], info['break_stop_name'], info.get('break_type'),
+               info.get('paid'))
+              for info in duty_data['Breaks']),
+    )
+
+"""Digest of a StopRegistry: the ID, name and depot flag of every stop code, which is all the steps read of it."""
+def stops_digest(stops):
+    return content_hash([(stops.stop_id(code), name, stops.is_depot_code(code))
+                         for code, name in enumerate(stops.names())])
+
+"""Digest the inputs of each duty of `duty_ids`: its timeline in `index` (see DutyEventIndex.events).
+
+The steps compute the results of a duty from its timeline and the stops
+alone, so duties with the same digest under stops with the same stops_digest
+have the same results.
+"""
+def duty_input_hashes(index, duty_ids):
+    return {
+        duty_id: content_hash([(record.start, record.end, record.origin, record.destination)
+                               for record in index.events(duty_id)])
+        for duty_id in duty_ids
+    }
+
+"""Return the IDs of the duties of `new_duty_ids` whose inputs are the same in both indexes, before any step runs.
+
+Every duty counts as changed when the stops differ (see stops_digest).
+"""
+def unchanged_duties(old_index, old_duty_ids, new_index, new_duty_ids):
+    if stops_digest(old_index.stops) != stops_digest(new_index.stops):
+        return set()
+    old_hashes = duty_input_hashes(old_index, old_duty_ids)
+    return {duty_id for duty_id, digest in duty_input_hashes(new_index, new_duty_ids).items()
+            if old_hashes.get(duty_id) == digest}
+
+"""The per-duty results of a report, with a content hash of each, by duty ID.
+
+A push sink (see src/pipeline.py): duty results are sent to it one at a time
+and only their summary (see duty_summary) and its digest are kept. close()
+returns the ReportSummary itself.
+
+`unchanged` counts the duties known to be the same in the other version (see
+unchanged_duties), which are never summarised; len() includes them.
+"""
+class ReportSummary:
+
+    def __init__(self, results=(), unchanged=0):
+        self.duties = {}
+        self.unchanged = unchanged
+        for duty_data in results:
+            self.send(duty_data)
+
+    def __len__(self):
+        return len(self.duties) + self.unchanged
+
+    def send(self, duty_data):
+        summary = duty_summary(duty_data)
+        self.duties[duty_data['Duty ID']] = (content_hash(summary), summary)
+
+    def close(self):
+        return self
+
+"""Format a time in minutes, or None, for the diff."""
+def _format_time(minutes):
+    return None if minutes is None else format_time(minutes)
+
+"""Format a (start, duration, stop, break type, paid) break for the diff."""
+def _format_break(info):
+    start, duration, stop_name, *kind = info
+    text = f"{format_time(start)}-{format_time(start + duration)} at {stop_name}"
+    if kind and kind[0] is not None:
+        text += f" ({kind[0]}, {'paid' if kind[1] else 'unpaid'})"
+    return text
+
+"""Match the breaks of two versions of a duty; yields (change, old, new) for every break that differs.
+
+Both lists are sorted by start time and never overlap themselves, so they are
+merged in one pass: an old and a new break at the same stop that overlap are
+the same break, resized (its duration changed), moved (only its start did) or
+reclassified (only its break type or paid flag did). The other breaks were removed or added, and are given with None on the other
+side.
+"""
+def break_changes(old_breaks, new_breaks):
+    old_position = new_position = 0
+    while old_position < len(old_breaks) and new_position < len(new_breaks):
+        old, new = old_breaks[old_position], new_breaks[new_position]
+        old_end, new_end = old[0] + old[1], new[0] + new[1]
+        if old[2] == new[2] and old[0] < new_end and new[0] < old_end:
+            if old[1] != new[1]:
+                yield 'resized', old, new
+            elif old[0] != new[0]:
+                yield 'moved', old, new
+            elif old[3:] != new[3:]:
+                yield 'reclassified', old, new
+            old_position += 1
+            new_position += 1
+        elif old_end <= new_end:
+            yield 'removed', old, None
+            old_position += 1
+        else:
+            yield 'added', None, new
+            new_position += 1
+    for old in old_breaks[old_position:]:
+        yield 'removed', old, None
+    for new in new_breaks[new_position:]:
+        yield 'added', None, new
+
+"""Yield the diff rows (in DIFF_COLUMNS order) of one duty between two summaries, either of which can be None."""
+def duty_changes(duty_id, old, new):
+    change = 'added' if old is None else 'removed' if new is None else 'changed'
+    old_fields = (None,) * 4 + ((),) if old is None else old
+    new_fields = (None,) * 4 + ((),) if new is None else new
+    for field, before, after in zip(DUTY_FIELDS, old_fields, new_fields):
+        if before == after:
+            continue
+        if field in TIME_FIELDS:
+            delta = None if before is None or after is None else after - before
+            yield duty_id, change, field, _format_time(before), _format_time(after), delta
+        else:
+            yield duty_id, change, field, before, after, None
+    for break_change, before, after in break_changes(old_fields[4], new_fields[4]):
+        yield (
+            duty_id, break_change, 'Break',
+            None if before is None else _format_break(before),
+            None if after is None else _format_break(after),
+            (0 if after is None else after[1]) - (0 if before is None else before[1]),
+        )
+
+"""Hash-join two ReportSummary on the duty ID; yields (duty_id, change, rows) for every duty that differs.
+
+change is 'changed', 'added' or 'removed' and rows are its diff rows (see
+duty_changes). Duties whose digests match are skipped without comparing
+their fields. The duties of `new` come first, in its order, then the ones
+removed from `old`.
+"""
+def compare_reports(old, new):
+    old_duties = old.duties
+    for duty_id, (digest, summary) in new.duties.items():
+        previous = old_duties.get(duty_id)
+        if previous is None:
+            yield duty_id, 'added', list(duty_changes(duty_id, None, summary))
+        elif previous[0] != digest:
+            yield duty_id, 'changed', list(duty_changes(duty_id, previous[1], summary))
+    new_duties = new.duties
+    for duty_id, (_, summary) in old_duties.items():
+        if duty_id not in new_duties:
+            yield duty_id, 'removed', list(duty_changes(duty_id, summary, None))
+
+"""Write the changes between two ReportSummary to `path` (without extension) in `fmt`.
+
+The rows go to a 'changes' sheet of <path>.xlsx, or to <path>_changes.csv or
+.parquet (see src/exporters.py). Returns the number of duties changed, added,
+removed and unchanged, and the number of rows written.
+"""
+def write_diff(old, new, path, fmt='xlsx'):
+    counts = dict.fromkeys(('changed', 'added', 'removed', 'unchanged', 'rows'), 0)
+    writer = EXPORTERS[fmt](path)
+    try:
+        sheet = writer.open_sheet('changes', DIFF_COLUMNS, DIFF_COLUMN_TYPES)
+        for _, change, rows in compare_reports(old, new):
+            counts[change] += 1
+            counts['rows'] += len(rows)
+            for row in rows:
+                sheet.append(row)
+    finally:
+        writer.close()
+    counts['unchanged'] = len(new) - counts['changed'] - counts['added']
+    return counts
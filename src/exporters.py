@@ -0,0 +1,211 @@
+import csv
+from functools import lru_cache
+from pathlib import Path
+from src.utils import format_time
+
+STEP_COLUMNS = {
+    1: ['Duty ID', 'Start Time', 'End Time'],
+    2: ['Duty ID', 'Start Time', 'End Time', 'First Stop', 'Last Stop'],
+    3: ['Duty ID', 'Start Time', 'End Time', 'First Stop', 'Last Stop',
+        'Break Start Time', 'Break Duration', 'Break Stop Name'],
+}
+# Columns that do not hold strings, by name, for the exporters that store typed
+# columns (Parquet); every other column is a string column.
+STEP_COLUMN_TYPES = {'Break Duration': 'int64'}
+# Rows buffered per Parquet row group.
+PARQUET_BATCH_SIZE = 65536
+
+
+"""Format a time cell: minutes become 'day.HH:MM', None becomes `missing`, strings are kept."""
+@lru_cache(maxsize=None)
+def _format_cell(value, missing=None):
+    if value is None:
+        return missing
+    if isinstance(value, str):
+        return value
+    return format_time(value)
+
+"""Yield the rows of one duty for the given step, as tuples in STEP_COLUMNS order.
+
+Matches the rows export_to_excel writes: one row for steps 1 and 2, and one
+row per break for step 3 (a single row with empty break cells when the duty
+has no breaks).
+"""
+def duty_rows(duty_data, step):
+    row = (
+        duty_data['Duty ID'],
+        _format_cell(duty_data['Start Time'], "No Start Time Found"),
+        _format_cell(duty_data['End Time'], "No End Time Found"),
+    )
+    if step == 1:
+        yield row
+        return
+    row += (duty_data['First Stop'], duty_data['Last Stop'])
+    if step == 2:
+        yield row
+        return
+    if not duty_data['Breaks']:
+        yield row + (None, None, None)
+    for break_info in duty_data['Breaks']:
+        yield row + (
+            _format_cell(break_info['break_start_time']),
+            break_info['break_duration'],
+            break_info['break_stop_name'],
+        )
+
+"""Lazily yield every row of a step for an iterable of duty results."""
+def iter_step_rows(results, step):
+    for duty_data in results:
+        yield from duty_rows(duty_data, step)
+
+"""Writes sheets to an XLSX workbook in openpyxl write-only mode.
+
+Rows are streamed to disk as they are appended, so memory stays constant
+whatever the number of rows. Several sheets can be written at the same time.
+"""
+class XlsxWriter:
+    extension = '.xlsx'
+
+    def __init__(self, path):
+        from openpyxl import Workbook
+
+        self.path = Path(path).with_suffix(self.extension)
+        self.workbook = Workbook(write_only=True)
+
+    def open_sheet(self, name, columns, types=None):
+        sheet = self.workbook.create_sheet(name)
+        sheet.append(columns)
+        return sheet
+
+    def close(self):
+        self.workbook.save(self.path)
+
+"""Writes each sheet to its own CSV file, <path>_<sheet>.csv."""
+class CsvWriter:
+    extension = '.csv'
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.files = []
+
+    def open_sheet(self, name, columns, types=None):
+        file = open(self.path.with_name(f"{self.path.name}_{name}{self.extension}"), 'w', newline='')
+        self.files.append(file)
+        writer = csv.writer(file)
+        writer.writerow(columns)
+        return _CsvSheet(writer)
+
+    def close(self):
+        for file in self.files:
+            file.close()
+
+class _CsvSheet:
+
+    def __init__(self, writer):
+        self.append = writer.writerow
+
+"""Writes each sheet to its own Parquet file, <path>_<sheet>.parquet.
+
+The schema of a sheet is fixed when it is opened, from the declared types of
+its columns ('int64', 'bool' or 'string', the default), so a column can be
+empty in one row group and filled in the next. Rows are buffered and written
+as a row group every PARQUET_BATCH_SIZE rows. Requires pyarrow, which is
+optional.
+"""
+class ParquetWriter:
+    extension = '.parquet'
+
+    def __init__(self, path):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as e:
+            raise ImportError("The Parquet exporter requires pyarrow (pip install pyarrow).") from e
+        self.pyarrow = pyarrow
+        self.path = Path(path)
+        self.sheets = []
+
+    def open_sheet(self, name, columns, types=None):
+        sheet = _ParquetSheet(self.pyarrow, self.path.with_name(f"{self.path.name}_{name}{self.extension}"), columns,
+                              types or {})
+        self.sheets.append(sheet)
+        return sheet
+
+    def close(self):
+        for sheet in self.sheets:
+            sheet.close()
+
+class _ParquetSheet:
+
+    def __init__(self, pyarrow, path, columns, types):
+        arrow_types = {'int64': pyarrow.int64(), 'bool': pyarrow.bool_(), 'string': pyarrow.string()}
+        self.pyarrow = pyarrow
+        self.columns = columns
+        self.schema = pyarrow.schema([(column, arrow_types[types.get(column, 'string')]) for column in columns])
+        # Values of string columns that are not strings (e.g. numeric IDs) are written as text.
+        self.text_columns = [position for position, column in enumerate(columns)
+                             if types.get(column, 'string') == 'string']
+        self.rows = []
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def append(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= PARQUET_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        values = [list(column) for column in zip(*self.rows)] if self.rows else [[] for _ in self.columns]
+        for position in self.text_columns:
+            values[position] = [value if value is None or isinstance(value, str) else str(value)
+                                for value in values[position]]
+        self.writer.write_table(self.pyarrow.Table.from_pydict(dict(zip(self.columns, values)), schema=self.schema))
+        self.rows = []
+
+    def close(self):
+        if self.rows:
+            self.flush()
+        self.writer.close()
+
+EXPORTERS = {'xlsx': XlsxWriter, 'csv': CsvWriter, 'parquet': ParquetWriter}
+
+"""Push sink writing the step outputs of a report as duty results are sent to it.
+
+`path` is the output path without extension; XLSX writes one workbook with a
+step<n> sheet per step, CSV and Parquet write one <path>_step<n> file per step.
+Every step gets its own sheet and the rows of each duty sent are appended to
+all of them at once. close() finishes the files and returns the number of rows
+written per step.
+"""
+class ReportSink:
+
+    def __init__(self, path, fmt='xlsx', steps=(1, 2, 3)):
+        self.writer = EXPORTERS[fmt](path)
+        self.sheets = {step: self.writer.open_sheet(f'step{step}', STEP_COLUMNS[step], STEP_COLUMN_TYPES)
+                       for step in steps}
+        self.row_counts = dict.fromkeys(steps, 0)
+
+    def send(self, duty_data):
+        for step, sheet in self.sheets.items():
+            for row in duty_rows(duty_data, step):
+                sheet.append(row)
+                self.row_counts[step] += 1
+
+    def close(self):
+        self.writer.close()
+        return self.row_counts
+
+"""Write the step outputs of a report in a single pass over the duty results.
+
+`results` can be any iterable of duty results (e.g. a generator), it is only
+walked once and each duty is sent to a ReportSink as it goes by.
+
+Returns the number of rows written per step.
+"""
+def write_report(results, path, fmt='xlsx', steps=(1, 2, 3)):
+    sink = ReportSink(path, fmt, steps)
+    try:
+        for duty_data in results:
+            sink.send(duty_data)
+    finally:
+        row_counts = sink.close()
+    return row_counts
@@ -0,0 +1,150 @@
+import hashlib
+import marshal
+import os
+import pickle
+from pathlib import Path
+from src.index import DutyEventIndex
+from src.parallel import generate_report_parallel
+from src.stops import StopRegistry
+from src.utils import BREAK_THRESHOLD
+from src.steps import generate_start_end_times, generate_stop_names, generate_breaks_info
+
+# Bumped whenever the report or the cache layout changes, so older caches are ignored.
+CACHE_VERSION = 2
+CACHE_FILE = '.report_cache.pickle'
+
+
+"""Return a digest of the content of a JSON record.
+
+The record is serialised with marshal format 2, which writes every object in
+full (no back-references), so the digest only depends on the values and on the
+order of the keys. A record whose keys were merely reordered hashes differently
+and is recomputed, which is harmless.
+"""
+def content_hash(record):
+    return hashlib.blake2b(marshal.dumps(record, 2), digest_size=16).digest()
+
+"""Return the IDs of the duties a vehicle has events for, in event order."""
+def vehicle_duty_ids(vehicle):
+    return tuple(dict.fromkeys(
+        event['duty_id'] for event in vehicle['vehicle_events'] if event.get('duty_id') is not None
+    ))
+
+"""Content hashes of a schedule, and the report computed from it.
+
+`settings` covers everything besides the schedule that the report depends on
+(the cache version and the break threshold) and `stops` the stops table; when
+either differs between two runs every duty is recomputed. Vehicles are hashed
+by vehicle_id (after their service trips are resolved, so trip changes show up
+as vehicle changes) and duties by duty_id. `vehicle_duties` maps each vehicle
+to the duties it has events for, or whose duty events refer to it.
+"""
+class ReportCache:
+
+    def __init__(self, settings, stops, vehicles, duties, vehicle_duties, report=None):
+        self.settings = settings
+        self.stops = stops
+        self.vehicles = vehicles
+        self.duties = duties
+        self.vehicle_duties = vehicle_duties
+        self.report = report if report is not None else {}
+
+    @classmethod
+    def from_schedule(cls, duties, vehicles, stops):
+        """Hash the duties, vehicles and stops of a schedule (vehicles with resolved service trips)."""
+        vehicle_hashes, vehicle_duties = {}, {}
+        for vehicle in vehicles:
+            vehicle_id = vehicle.get('vehicle_id')
+            digest = content_hash(vehicle)
+            if vehicle_id in vehicle_hashes:
+                # Vehicles sharing an ID are tracked as one.
+                digest = hashlib.blake2b(vehicle_hashes[vehicle_id] + digest, digest_size=16).digest()
+            vehicle_hashes[vehicle_id] = digest
+            vehicle_duties.setdefault(vehicle_id, {}).update(dict.fromkeys(vehicle_duty_ids(vehicle)))
+        duty_hashes = {}
+        for duty in duties:
+            duty_hashes[duty['duty_id']] = content_hash(duty)
+            # Duty events refer to vehicle events by vehicle ID, whatever their duty_id.
+            for event in duty.get('duty_events', ()):
+                if event.get('vehicle_id') is not None:
+                    vehicle_duties.setdefault(event['vehicle_id'], {})[duty['duty_id']] = None
+        return cls(content_hash([CACHE_VERSION, BREAK_THRESHOLD]), content_hash(stops), vehicle_hashes, duty_hashes,
+                   {vehicle_id: tuple(duty_ids) for vehicle_id, duty_ids in vehicle_duties.items()})
+
+    @classmethod
+    def load(cls, path):
+        """Load a cache saved by save, or return None if there is none or it cannot be read."""
+        try:
+            with open(path, 'rb') as file:
+                cache = pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return None
+        return cache if isinstance(cache, cls) else None
+
+    def save(self, path):
+        """Write the cache to `path` atomically, so an interrupted run never leaves a broken cache."""
+        path = Path(path)
+        temp_path = path.with_name(path.name + '.tmp')
+        with open(temp_path, 'wb') as file:
+            pickle.dump(self, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+
+    def affected_duties(self, previous):
+        """Return the IDs of the duties whose results may differ from `previous`, or None for all of them.
+
+        A duty is affected when its own record changed or appeared, or when a
+        vehicle that has (or had) events for it changed, appeared or disappeared.
+        """
+        if previous is None or previous.settings != self.settings or previous.stops != self.stops:
+            return None
+        affected = {
+            duty_id for duty_id, digest in self.duties.items()
+            if previous.duties.get(duty_id) != digest or duty_id not in previous.report
+        }
+        for vehicle_id in self.vehicles.keys() | previous.vehicles.keys():
+            if self.vehicles.get(vehicle_id) != previous.vehicles.get(vehicle_id):
+                affected.update(self.vehicle_duties.get(vehicle_id, ()))
+                affected.update(previous.vehicle_duties.get(vehicle_id, ()))
+        return affected
+
+"""Run steps 1-3 on a schedule, recomputing only the duties that changed since the cached run.
+
+`vehicles` must have their service trips resolved already. The previous run is
+read from `cache_path`; its report is patched with the recomputed duties (the
+report of duties that were removed is dropped) and saved back along with the
+hashes of this schedule. Without a usable cache, or when the stops or settings
+changed, every duty is recomputed. Only the vehicles that have events for the
+affected duties are indexed, so the work is proportional to the change. The
+report is the same as a full recompute, in the order of `duties`.
+
+Returns (full_report, recomputed), where recomputed is the number of duties
+that were recomputed.
+"""
+def generate_report_incremental(duties, vehicles, stops, cache_path, engine='python', workers=None, shard_by='hash'):
+    current = ReportCache.from_schedule(duties, vehicles, stops)
+    previous = ReportCache.load(cache_path)
+    affected = current.affected_duties(previous)
+
+    if affected is None:
+        changed_duties, changed_vehicles = duties, vehicles
+    else:
+        changed_duties = [duty for duty in duties if duty['duty_id'] in affected]
+        changed_vehicles = [
+            vehicle for vehicle in vehicles
+            if not affected.isdisjoint(current.vehicle_duties.get(vehicle.get('vehicle_id'), ()))
+        ]
+
+    registry = StopRegistry(stops)
+    index = DutyEventIndex(changed_vehicles, changed_duties, registry)
+    if workers is not None:
+        recomputed = generate_report_parallel(changed_duties, index, workers, shard_by, engine)
+    else:
+        start_end_times = generate_start_end_times(changed_duties, None, index)
+        start_end_with_stop_names = generate_stop_names(start_end_times, registry)
+        recomputed = generate_breaks_info(start_end_with_stop_names, None, registry, index, engine)
+
+    report = {} if affected is None else previous.report
+    report.update((duty_data['Duty ID'], duty_data) for duty_data in recomputed)
+    current.report = {duty['duty_id']: report[duty['duty_id']] for duty in duties}
+    current.save(cache_path)
+    return [dict(current.report[duty['duty_id']]) for duty in duties], len(recomputed)
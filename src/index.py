@@ -0,0 +1,491 @@
+from array import array
+import numpy as np
+from src.stops import StopRegistry, as_stop_registry
+from src.utils import times_to_minutes
+
+# Number of buffered events that triggers a bulk time parse in DutyEventIndex.
+FLUSH_SIZE = 1 << 12
+# Number of duties whose events DutyEventIndex.iter_timed_columns reads together.
+EVENT_BATCH_SIZE = 1024
+# Stored in the event columns in place of a missing time or stop.
+MISSING_TIME = np.iinfo(np.int32).min
+NO_STOP = -1
+# Stands for the vehicle ID of a buffered standalone duty event (taxi, sign_on...).
+_STANDALONE = object()
+
+
+"""A timed event of a duty, with its times already parsed to total minutes.
+
+start and end are None when the event does not carry that time. origin and
+destination are the stop codes from the StopRegistry of the index (None when
+the event has no such stop).
+"""
+class EventRecord:
+    __slots__ = ('start', 'end', 'origin', 'destination')
+
+    def __init__(self, start, end, origin=None, destination=None):
+        self.start = start
+        self.end = end
+        self.origin = origin
+        self.destination = destination
+
+    def __eq__(self, other):
+        if not isinstance(other, EventRecord):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        fields = ', '.join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"EventRecord({fields})"
+
+"""Return the key of a vehicle event in the (vehicle_id, sequence) event map.
+
+Vehicles number their events with strings and duty events refer to them with
+integers, so the sequence is normalised to a string.
+"""
+def vehicle_event_key(vehicle_id, sequence):
+    return (vehicle_id, str(sequence))
+
+"""Return an int32 column with the values of `column` (None becoming `missing`)."""
+def _column(values, missing):
+    return np.fromiter((missing if value is None else value for value in values), dtype=np.int32, count=len(values))
+
+"""Return the EventRecords of rows start:end of timeline columns (starts, ends, origins, destinations).
+
+With `timed`, only the events that have both a start and an end time. Most
+events have every field, so missing values are only looked for column by column.
+"""
+def _event_records(columns, start, end, timed=False):
+    values = [column[start:end].tolist() for column in columns]
+    if timed and (MISSING_TIME in values[0] or MISSING_TIME in values[1]):
+        rows = [row for row in zip(*values) if row[0] != MISSING_TIME and row[1] != MISSING_TIME]
+        values = [list(column) for column in zip(*rows)] if rows else [[], [], [], []]
+    for column, missing in zip(values, (MISSING_TIME, MISSING_TIME, NO_STOP, NO_STOP)):
+        if missing in column:
+            column[:] = [None if value == missing else value for value in column]
+    return list(map(EventRecord, *values))
+
+"""Builds the timeline of every duty: its events, in order, as columns of integers.
+
+A duty that lists its duty_events is resolved from them, as the source of
+truth: vehicle_event entries are looked up by (vehicle_id, vehicle_event_sequence)
+among every vehicle event (service trips already resolved through the
+TripIndex, see resolve_service_trips), and standalone entries such as taxi and
+sign_on carry their own times and stops. A duty without duty_events gets the
+vehicle events whose duty_id refers to it. Either way the timeline is sorted
+by start time, with events that have no start time kept at the end, and ties
+keep the order of the duty events (or of the vehicles).
+
+The vehicles and the duties (to keep their order and to register duties
+without any events) are walked a single time, in any order.
+
+Stop IDs are interned in the StopRegistry given as `stops` (or a new, empty
+one), available as the `stops` attribute.
+
+Vehicles and duties can also be added one at a time with add_vehicle and
+add_duty, e.g. while streaming them from a file. Added events are buffered and
+their time strings parsed in bulk, either when FLUSH_SIZE events are waiting or
+at the next query.
+
+The index keeps no duty or vehicle dicts and no object per event: parsed
+events are rows of int32 columns (times in total minutes, stop codes, with
+MISSING_TIME and NO_STOP for missing values), vehicle event references are
+int64 keys, and duty events are (duty, key or row) entries in compact arrays.
+The first query after something was added resolves the references and sorts
+every timeline at once with NumPy, into per-event columns in timeline order
+with the event offsets of each duty (see timeline_arrays). EventRecords are
+only built, from a duty's slice of the columns, when its events are queried.
+"""
+class DutyEventIndex:
+
+    def __init__(self, vehicles=(), duties=(), stops=None):
+        self._stops = as_stop_registry(stops) if stops is not None else StopRegistry()
+        # Duty ID -> duty code, in the order the duties were first seen.
+        self._duty_codes = {}
+        # Codes of the duties whose timeline comes from their duty_events.
+        self._duty_event_duties = set()
+        # Codes making up the int64 keys of vehicle events: vehicle code << 32 | sequence code.
+        self._vehicle_codes = {}
+        self._sequence_codes = {}
+        # Buffered events, (vehicle_id, event), parsed into rows at the next flush; row numbers are given as they
+        # are buffered.
+        self._pending = []
+        self._row_count = 0
+        # Parsed rows, as chunks of columns (starts, ends, origins, destinations, duty codes, vehicle event keys).
+        self._chunks = []
+        # One entry per duty event: the duty code, the key of the vehicle event it refers to (-1 for a standalone
+        # event) and the row of a standalone event (-1 for a vehicle event).
+        self._references = (array('i'), array('q'), array('q'))
+        # (offsets, starts, ends, origins, destinations) and the duty summaries, built at the first query.
+        self._timelines = None
+        self._summaries = None
+        for duty in duties:
+            self.add_duty(duty)
+        for vehicle in vehicles:
+            self.add_vehicle(vehicle)
+
+    """Return an index over timelines already resolved and sorted, like the ones of timeline_arrays.
+
+    The columns are used as they are (e.g. memory-mapped arrays): nothing is
+    built per event until a duty is queried.
+    """
+    @classmethod
+    def from_timelines(cls, duty_ids, offsets, starts, ends, origins, destinations, stops=None):
+        index = cls(stops=stops)
+        index._duty_codes = {duty_id: code for code, duty_id in enumerate(duty_ids)}
+        index._timelines = (offsets, starts, ends, origins, destinations)
+        return index
+
+    def _duty_code(self, duty_id):
+        code = self._duty_codes.get(duty_id)
+        if code is None:
+            code = self._duty_codes[duty_id] = len(self._duty_codes)
+        return code
+
+    def _event_key(self, vehicle_id, sequence):
+        """Return the int64 key of a vehicle event (see vehicle_event_key), -1 when the vehicle has no ID."""
+        if vehicle_id is None:
+            return -1
+        vehicle_code = self._vehicle_codes.setdefault(vehicle_id, len(self._vehicle_codes))
+        sequence_code = self._sequence_codes.setdefault(str(sequence), len(self._sequence_codes))
+        return vehicle_code << 32 | sequence_code
+
+    def _changed(self):
+        """Drop the built timelines; an index made from_timelines first turns them into rows it can rebuild from."""
+        if self._timelines is not None and not self._chunks and not self._row_count:
+            offsets, starts, ends, origins, destinations = self._timelines
+            duties = np.repeat(np.arange(len(offsets) - 1, dtype=np.int32), np.diff(offsets))
+            self._chunks.append((np.asarray(starts, dtype=np.int32), np.asarray(ends, dtype=np.int32),
+                                 np.asarray(origins, dtype=np.int32), np.asarray(destinations, dtype=np.int32),
+                                 duties, np.full(len(duties), -1, dtype=np.int64)))
+            self._row_count = len(duties)
+        self._timelines = self._summaries = None
+
+    def add_duty(self, duty):
+        """Register a duty, so it is listed even if no vehicle event refers to it.
+
+        When the duty lists its duty_events, its timeline is resolved from them.
+        """
+        self._changed()
+        code = self._duty_code(duty['duty_id'])
+        if not duty.get('duty_events'):
+            return
+        self._duty_event_duties.add(code)
+        duties, keys, rows = self._references
+        for event in duty['duty_events']:
+            duties.append(code)
+            if event.get('duty_event_type') == 'vehicle_event':
+                keys.append(self._event_key(event.get('vehicle_id'), event.get('vehicle_event_sequence')))
+                rows.append(-1)
+            else:
+                # Standalone events carry their own times, parsed in bulk with the other pending events.
+                keys.append(-1)
+                rows.append(self._row_count)
+                self._pending.append((_STANDALONE, event))
+                self._row_count += 1
+        if len(self._pending) >= FLUSH_SIZE:
+            self._flush()
+
+    def add_vehicle(self, vehicle):
+        """Add the events of a vehicle, for the duty events that refer to them and the duties they belong to."""
+        self._changed()
+        vehicle_id = vehicle.get('vehicle_id')
+        events = vehicle['vehicle_events']
+        self._pending.extend((vehicle_id, event) for event in events)
+        self._row_count += len(events)
+        if len(self._pending) >= FLUSH_SIZE:
+            self._flush()
+
+    def add_records(self, duty_id, records):
+        """Add EventRecords whose stops are already interned in the registry of this index."""
+        self._changed()
+        self._flush()
+        self._chunks.append((
+            _column([record.start for record in records], MISSING_TIME),
+            _column([record.end for record in records], MISSING_TIME),
+            _column([record.origin for record in records], NO_STOP),
+            _column([record.destination for record in records], NO_STOP),
+            np.full(len(records), self._duty_code(duty_id), dtype=np.int32),
+            np.full(len(records), -1, dtype=np.int64),
+        ))
+        self._row_count += len(records)
+
+    def _flush(self):
+        """Parse the buffered events into a chunk of rows, in the order they were buffered."""
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        events = [event for _, event in pending]
+        columns = []
+        for field in ('start_time', 'end_time'):
+            times = np.full(len(events), MISSING_TIME, dtype=np.int32)
+            timed = np.fromiter((field in event for event in events), dtype=bool, count=len(events))
+            times[timed] = times_to_minutes([event[field] for event in events if field in event])
+            columns.append(times)
+        intern = self._stops.intern
+        for field in ('origin_stop_id', 'destination_stop_id'):
+            columns.append(_column([intern(event.get(field)) for event in events], NO_STOP))
+        duties, keys = np.full(len(events), -1, dtype=np.int32), np.full(len(events), -1, dtype=np.int64)
+        for row, (vehicle_id, event) in enumerate(pending):
+            if vehicle_id is _STANDALONE:
+                continue
+            if event.get('duty_id') is not None:
+                duties[row] = self._duty_code(event['duty_id'])
+            if 'vehicle_event_sequence' in event:
+                keys[row] = self._event_key(vehicle_id, event['vehicle_event_sequence'])
+        self._chunks.append((*columns, duties, keys))
+
+    def _build(self):
+        """Resolve the duty events and sort every timeline, returning (offsets, starts, ends, origins, destinations).
+
+        The rows of the duties without duty_events are the vehicle events with
+        their duty_id; the rows of the others are the standalone duty events
+        and the vehicle events their keys refer to (the last vehicle event with
+        a key, when several have it), duty events referring to no vehicle event
+        being left out. One stable sort by (duty, missing start, start) puts
+        them in timeline order.
+        """
+        self._flush()
+        if len(self._chunks) > 1:
+            self._chunks = [tuple(np.concatenate(column) for column in zip(*self._chunks))]
+        if self._chunks:
+            starts, ends, origins, destinations, row_duties, row_keys = self._chunks[0]
+        else:
+            starts, ends, origins, destinations, row_duties = (np.empty(0, dtype=np.int32) for _ in range(5))
+            row_keys = np.empty(0, dtype=np.int64)
+        reference_duties, reference_keys, reference_rows = (np.array(column) for column in self._references)
+        reference_duties = reference_duties.astype(np.int32)
+
+        keyed = np.flatnonzero(row_keys >= 0)
+        keyed = keyed[np.argsort(row_keys[keyed], kind='stable')]
+        vehicle_references = reference_keys >= 0
+        if len(keyed):
+            found = np.searchsorted(row_keys[keyed], reference_keys, side='right') - 1
+            found[found < 0] = 0
+            vehicle_rows = np.where(row_keys[keyed[found]] == reference_keys, keyed[found], -1)
+            reference_rows = np.where(vehicle_references, vehicle_rows, reference_rows)
+        else:
+            reference_rows[vehicle_references] = -1
+        referenced = reference_rows >= 0
+
+        duty_count = len(self._duty_codes)
+        event_duties = np.zeros(duty_count, dtype=bool)
+        event_duties[list(self._duty_event_duties)] = True
+        own = np.flatnonzero(row_duties >= 0)
+        own = own[~event_duties[row_duties[own]]]
+        duties = np.concatenate([row_duties[own], reference_duties[referenced]]).astype(np.int64)
+        rows = np.concatenate([own, reference_rows[referenced]])
+
+        row_starts = starts[rows].astype(np.int64)
+        missing_starts = (row_starts == MISSING_TIME).astype(np.int64)
+        order = np.argsort(duties << 33 | missing_starts << 32 | row_starts - MISSING_TIME, kind='stable')
+        rows = rows[order]
+        offsets = np.zeros(duty_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(duties, minlength=duty_count), out=offsets[1:])
+        return (offsets, starts[rows], ends[rows], origins[rows], destinations[rows])
+
+    def timeline_arrays(self, duty_ids=None):
+        """Return the timelines of `duty_ids` (all indexed duties by default) as columns.
+
+        (offsets, starts, ends, origins, destinations): the events of the i-th
+        duty are rows offsets[i]:offsets[i + 1] of the int32 columns, in timeline
+        order, with MISSING_TIME and NO_STOP for missing times and stops. A duty
+        that is not indexed has no rows. The columns of all the duties, in
+        duty_ids order, are the ones of the index, not copies.
+        """
+        if self._timelines is None:
+            self._timelines = self._build()
+        offsets, *columns = self._timelines
+        if duty_ids is None:
+            return (offsets, *columns)
+        if len(duty_ids) == len(offsets) - 1 and list(duty_ids) == list(self._duty_codes):
+            return (offsets, *columns)
+        positions = np.fromiter((self._duty_codes.get(duty_id, -1) for duty_id in duty_ids), dtype=np.int64,
+                                count=len(duty_ids))
+        known = positions >= 0
+        heads = np.where(known, offsets[positions], 0)
+        lengths = np.where(known, offsets[positions + 1] - heads, 0)
+        subset_offsets = np.zeros(len(positions) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=subset_offsets[1:])
+        rows = np.repeat(heads - subset_offsets[:-1], lengths) + np.arange(subset_offsets[-1])
+        return (subset_offsets, *(column[rows] for column in columns))
+
+    def _summary_arrays(self):
+        """Return (start, end, first_stop, last_stop) of every duty as columns, see summary."""
+        if self._summaries is None:
+            offsets, starts, ends, origins, destinations = self.timeline_arrays()
+            duty_count = len(offsets) - 1
+            summaries = [np.full(duty_count, missing, dtype=np.int32)
+                         for missing in (MISSING_TIME, MISSING_TIME, NO_STOP, NO_STOP)]
+            nonempty = np.flatnonzero(np.diff(offsets))
+            if len(nonempty):
+                heads = offsets[nonempty]
+                positions = np.arange(len(starts))
+                # Timelines are sorted with missing starts last: the first start is the earliest one, and an
+                # end that is missing (MISSING_TIME, the lowest int32) is never the latest unless all are.
+                summaries[0][nonempty] = starts[heads]
+                summaries[1][nonempty] = np.maximum.reduceat(ends, heads)
+                first = np.minimum.reduceat(np.where(origins != NO_STOP, positions, len(starts)), heads)
+                summaries[2][nonempty] = np.append(origins, NO_STOP)[first]
+                last = np.maximum.reduceat(np.where(destinations != NO_STOP, positions, -1), heads)
+                summaries[3][nonempty] = np.append(destinations, NO_STOP)[last]
+            self._summaries = summaries
+        return self._summaries
+
+    @property
+    def stops(self):
+        """The StopRegistry holding the stops of every event added so far."""
+        self._flush()
+        return self._stops
+
+    def __contains__(self, duty_id):
+        self._flush()
+        return duty_id in self._duty_codes
+
+    def __len__(self):
+        self._flush()
+        return len(self._duty_codes)
+
+    def duty_ids(self):
+        """Return the indexed duty IDs, in the order they were first seen."""
+        self._flush()
+        return list(self._duty_codes)
+
+    def events(self, duty_id):
+        """Return the timeline of a duty: its EventRecords sorted by start time."""
+        return self._duty_records(duty_id, timed=False)
+
+    def timed_events(self, duty_id):
+        """Return the EventRecords of a duty that have both a start and an end time."""
+        return self._duty_records(duty_id, timed=True)
+
+    def iter_timed_columns(self, duty_ids):
+        """Yield the timed events of each of `duty_ids`, in order, as (starts, ends, destinations) lists.
+
+        Like timed_events, without building EventRecords: destinations are stop
+        codes, None when an event has none. The events of EVENT_BATCH_SIZE
+        duties at a time are selected from timeline_arrays together.
+        """
+        for position in range(0, len(duty_ids), EVENT_BATCH_SIZE):
+            batch = duty_ids[position:position + EVENT_BATCH_SIZE]
+            offsets, starts, ends, _, destinations = self.timeline_arrays(batch)
+            timed = (starts != MISSING_TIME) & (ends != MISSING_TIME)
+            if not timed.all():
+                offsets = np.concatenate([[0], np.cumsum(timed)])[offsets]
+                starts, ends, destinations = starts[timed], ends[timed], destinations[timed]
+            starts, ends, destinations = starts.tolist(), ends.tolist(), destinations.tolist()
+            if NO_STOP in destinations:
+                destinations = [None if destination == NO_STOP else destination for destination in destinations]
+            bounds = offsets.tolist()
+            for start, end in zip(bounds, bounds[1:]):
+                yield starts[start:end], ends[start:end], destinations[start:end]
+
+    def _duty_records(self, duty_id, timed):
+        offsets, *columns = self.timeline_arrays()
+        code = self._duty_codes.get(duty_id)
+        if code is None:
+            return []
+        return _event_records(columns, offsets.item(code), offsets.item(code + 1), timed)
+
+    def start_end_times(self, duty_id):
+        """Return the earliest start and latest end time of a duty, in total minutes.
+
+        Either value is None when no event of the duty carries that time.
+        """
+        return self.summary(duty_id)[:2]
+
+    def summary(self, duty_id):
+        """Return (start, end, first_stop, last_stop) for a duty.
+
+        start and end are the earliest start and latest end time in total minutes;
+        first_stop is the origin of the first event that has one and last_stop
+        the destination of the last event that has one, as stop codes. Each is
+        None when no event carries it. The summaries of all the duties are
+        computed at once, the first time one is asked for.
+        """
+        summaries = self._summary_arrays()
+        code = self._duty_codes.get(duty_id)
+        if code is None:
+            return None, None, None, None
+        start, end, first_stop, last_stop = (column.item(code) for column in summaries)
+        return (None if start == MISSING_TIME else start, None if end == MISSING_TIME else end,
+                None if first_stop == NO_STOP else first_stop, None if last_stop == NO_STOP else last_stop)
+
+    def event_arrays(self, duty_ids):
+        """Return the timed events of `duty_ids` as columns: (duty_codes, starts, ends, destinations).
+
+        NumPy arrays with one entry per event that has both a start and an end
+        time, grouped by duty in the order of `duty_ids` (duty_codes are
+        positions in it) and sorted by start time within each duty, like
+        timed_events. destinations are stop codes, -1 when an event has none.
+        They are selected from timeline_arrays, without building any EventRecord.
+        """
+        offsets, starts, ends, _, destinations = self.timeline_arrays(duty_ids)
+        duty_codes = np.repeat(np.arange(len(offsets) - 1, dtype=np.int32), np.diff(offsets))
+        timed = (starts != MISSING_TIME) & (ends != MISSING_TIME)
+        if timed.all():
+            return duty_codes, starts, ends, destinations
+        return duty_codes[timed], starts[timed], ends[timed], destinations[timed]
+
+"""Hashed lookup of trip times and stops by trip ID.
+
+Built from json_data['trips'], or trip by trip with add. Trips split into sub-trips are also
+indexed by (trip_id, sub_trip_index), using the sub-trip times. Only the first
+sub-trip starts at the trip origin and only the last one ends at the trip
+destination; the stops in between are not part of the data and are left None.
+"""
+class TripIndex:
+
+    def __init__(self, trips=()):
+        self._trips = {}
+        for trip in trips:
+            self.add(trip)
+
+    def add(self, trip):
+        """Index a trip and its sub-trips, e.g. while streaming them from a file."""
+        trip_id = trip['trip_id']
+        self._trips[trip_id] = (trip['departure_time'], trip['arrival_time'],
+                                trip.get('origin_stop_id'), trip.get('destination_stop_id'))
+        sub_trips = trip.get('sub_trips', [])
+        for position, sub_trip in enumerate(sub_trips):
+            sub_trip_index = sub_trip['sub_trip_index'].rpartition('_')[2]
+            self._trips[(trip_id, sub_trip_index)] = (
+                sub_trip['departure_time'], sub_trip['arrival_time'],
+                trip.get('origin_stop_id') if position == 0 else None,
+                trip.get('destination_stop_id') if position == len(sub_trips) - 1 else None,
+            )
+
+    def __len__(self):
+        return len(self._trips)
+
+    def get(self, trip_id, sub_trip_index=None):
+        """Return (start_time, end_time, origin_stop_id, destination_stop_id) for a trip, or None if unknown."""
+        if sub_trip_index is not None:
+            return self._trips.get((trip_id, sub_trip_index)) or self._trips.get(trip_id)
+        return self._trips.get(trip_id)
+
+"""Fills in the times and stops of service_trip vehicle events from the trips table.
+
+service_trip events only carry a trip_id (and a sub_trip_index for split trips).
+Each one is resolved through the TripIndex and updated in place with start_time,
+end_time, origin_stop_id and destination_stop_id; keys the event already has are
+kept. Events referencing an unknown trip are left untouched.
+
+Returns the number of events that could not be resolved.
+"""
+def resolve_service_trips(vehicles, trip_index):
+    unresolved = 0
+    for vehicle in vehicles:
+        for event in vehicle['vehicle_events']:
+            if event.get('vehicle_event_type') != 'service_trip' or 'trip_id' not in event:
+                continue
+            trip = trip_index.get(event['trip_id'], event.get('sub_trip_index'))
+            if trip is None:
+                unresolved += 1
+                continue
+            start_time, end_time, origin_stop_id, destination_stop_id = trip
+            event.setdefault('start_time', start_time)
+            event.setdefault('end_time', end_time)
+            event.setdefault('origin_stop_id', origin_stop_id)
+            event.setdefault('destination_stop_id', destination_stop_id)
+    return unresolved
@@ -1,34 +1,314 @@
+import argparse
 from pathlib import Path
-from utils import export_to_excel, load_json_data
-from steps import generate_start_end_times, generate_stop_names, generate_breaks_info
+from src.breaks import BreakRules
+from src.compare import ReportSummary, unchanged_duties, write_diff
+from src.exporters import EXPORTERS, ReportSink, write_report
+from src.incremental import CACHE_FILE, generate_report_incremental
+from src.metrics import METRICS_FORMATS, NO_METRICS, Metrics
+from src.occupancy import Occupancy, write_occupancy
+from src.index import DutyEventIndex
+from src.parallel import SHARD_MODES, generate_report_parallel
+from src.pipeline import fan_out, fused, pipeline
+from src.snapshot import load_schedule_snapshot
+from src.stops import StopRegistry
+from src.validation import ScheduleValidationError
+from src.streaming import load_schedule, stream_report_inputs
+from src.utils import export_to_excel
+from src.steps import ENGINES, generate_start_end_times, generate_stop_names, generate_breaks_info
 
 """
 Generates a series of Excel reports from JSON data in 3 steps:
 
-1. Generate start and end times for duties and export 
+1. Generate start and end times for duties and export
 2. Add stop names and export
 3. Add break information and export full report
 
-The main steps call helper functions to generate and process 
-the data before exporting to Excel after each step.
+The main steps call helper functions to generate and process
+the data before exporting to Excel after each step. Service trip
+events are first resolved against the trips table, then the timeline
+of every duty is built once, up front, from its duty events (vehicle
+events, taxi and sign_on segments), and the steps read start/end
+times, first/last stops and breaks from that index.
+
+Run from the repository root with `python -m src.main [schedule.json]`.
+With --stream the schedule is streamed from the file straight into
+the index instead of being loaded as a whole, and --engine pandas
+finds the breaks with the vectorised engine. --workers N runs the
+steps over shards of the duties in N processes. --format xlsx|csv|parquet
+writes all three steps in one pass with the streaming exporters of
+src/exporters.py, into report.xlsx (one sheet per step) or
+report_step<n>.csv/.parquet files; the duties then flow through the
+fused pipeline of src/pipeline.py straight into the exporter, so the
+report is never held in memory. --incremental only recomputes the
+duties whose vehicles or duty events changed since the previous run,
+whose hashes and report are cached in the output folder. --snapshot
+reads the parsed schedule from a memory-mapped snapshot next to the
+file (<schedule>.snapshot), written on the first run and rebuilt when
+the file changes.
+
+--metrics table|json|prometheus reports the wall time, CPU time, peak
+resident set size of the stage (on Linux) and of the run so far, and
+items/s of every load, step and export stage (see src/metrics.py), on
+stdout or into
+--metrics-file. --profile also runs the stages under cProfile and
+tracemalloc, adds the peak memory growth of each stage, prints the hottest
+functions and allocation sites, and saves profile.pstats to the output
+folder.
+--break-rules rules.json decides which gaps are breaks with the rules
+of src/breaks.py (per-stop and depot thresholds, paid and unpaid
+kinds) instead of the fixed threshold. --occupancy also writes how many
+drivers idle and are on break at each stop and depot area, minute by
+minute, with dwell and break summaries (see src/occupancy.py), into
+occupancy.xlsx or occupancy_<sheet> files in the report format.
+
+Every schedule is validated and normalised as it is loaded (see
+src/validation.py): broken references, malformed times and events out of
+order are all reported with their locations before any step runs.
+--no-validate skips the checks; benchmarks/bench_validation.py measures
+what they cost.
+
+--compare old.json compares the report of the schedule with the one of an
+older version instead of writing it: only the duties whose start/end times,
+first/last stops or breaks changed are written, field by field, into
+report_diff.xlsx or report_diff_changes files in the report format (see
+src/compare.py).
 """
-if __name__ == '__main__':
-    root_dir = Path(__file__).resolve().parent.parent
-    data_dir = root_dir / 'data'
-    filepath = data_dir / 'mini_json_dataset.json'
-    json_data = load_json_data(filepath)
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+DATA_DIR = ROOT_DIR / 'data'
+DEFAULT_DATASET = DATA_DIR / 'mini_json_dataset.json'
+
+
+"""Load a schedule and build the inputs of the steps.
+
+Returns (duties, vehicles, stops, index), where stops is the StopRegistry the
+index interned its stops with; vehicles is None when streaming or reading
+the snapshot (see src/snapshot.py). With `validate`, the schedule is checked
+and normalised first (see src/validation.py). Raises ValueError when the file
+cannot be loaded, and ScheduleValidationError (a ValueError listing every
+problem found) when it is not valid.
+"""
+def load_report_inputs(filepath, stream=False, snapshot=False, validate=True):
+    if snapshot:
+        duties, stops, index = load_schedule_snapshot(filepath, validate)
+        return duties, None, stops, index
+    if stream:
+        duties, stops, index = stream_report_inputs(filepath, validate)
+        return duties, None, stops, index
+
+    json_data = load_schedule(filepath, validate)
+    stops = StopRegistry(json_data['stops'])
+    index = DutyEventIndex(json_data['vehicles'], json_data['duties'], stops)
+    return json_data['duties'], json_data['vehicles'], stops, index
+
+"""Export the three steps of a full report to output_dir.
+
+Without a format, each step goes to its own step<n>.xlsx file through
+export_to_excel; otherwise write_report writes them all in a single pass.
+"""
+def export_report(full_report, output_dir, fmt=None, metrics=NO_METRICS):
+    if fmt is not None:
+        print(f"Writing the {fmt} report...")
+        with metrics.stage('export', len(full_report)):
+            write_report(full_report, output_dir / 'report', fmt)
+        return
+    for step in (1, 2, 3):
+        print(f"Generating Step {step} XLSX file...")
+        with metrics.stage(f'export_step{step}', len(full_report)):
+            export_to_excel(full_report, output_dir / f'step{step}', step=step)
+
+"""Write the stop and depot occupancy of the duties of an index (see src/occupancy.py) to output_dir.
+
+The sheets go to occupancy.xlsx, or to occupancy_<sheet> files in `fmt`.
+"""
+def export_occupancy(index, output_dir, fmt=None, metrics=NO_METRICS, rules=None):
+    print("Writing the occupancy analytics...")
+    with metrics.stage('occupancy', len(index)):
+        write_occupancy(Occupancy.from_index(index, rules=rules), output_dir / 'occupancy', fmt or 'xlsx')
+
+"""Run the 3 steps on a schedule file, exporting step1/step2/step3 XLSX files to output_dir.
+
+When `workers` is given, the steps run in a process pool over shards of the
+duties (see src/parallel.py) and the steps are exported from the merged
+report. When `fmt` is given, the steps are exported together (see
+export_report); without workers the report is streamed duty by duty from the
+fused pipeline to the exporter, so it is never held in memory. With
+`incremental`, the report of the previous run cached in output_dir is patched with the duties that changed (see
+src/incremental.py); the schedule is then always loaded whole. Each stage is
+measured into `metrics` (see src/metrics.py). BreakRules given as `rules`
+replace the break threshold; they cannot be used with `incremental`. With
+`occupancy`, the stop and depot occupancy is exported too (see
+export_occupancy); it cannot be used with `incremental` either. The
+schedule is validated as it is loaded unless `validate` is False.
+
+Returns the number of duties in the report, whichever way it was produced.
+"""
+def generate_reports(filepath, output_dir, stream=False, engine='python', workers=None, shard_by='hash', fmt=None,
+                     incremental=False, snapshot=False, metrics=NO_METRICS, rules=None, occupancy=False,
+                     validate=True):
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    if incremental:
+        if rules is not None or occupancy:
+            raise ValueError("Break rules and occupancy cannot be used with the incremental mode")
+        with metrics.stage('load') as stage:
+            json_data = load_schedule(filepath, validate)
+            stage.items = len(json_data['duties'])
+        with metrics.stage('steps') as stage:
+            full_report, recomputed = generate_report_incremental(
+                json_data['duties'], json_data['vehicles'], json_data['stops'], output_dir / CACHE_FILE,
+                engine, workers, shard_by)
+            stage.items = recomputed
+        print(f"Recomputed {recomputed} of {len(full_report)} duties")
+        export_report(full_report, output_dir, fmt, metrics)
+        return len(full_report)
+
+    with metrics.stage('load') as stage:
+        duties, vehicles, stops, index = load_report_inputs(filepath, stream, snapshot, validate)
+        stage.items = len(duties)
+
+    if workers is not None:
+        print(f"Generating the report with {workers} workers...")
+        with metrics.stage('steps', len(duties)):
+            full_report = generate_report_parallel(duties, index, workers, shard_by, engine, rules)
+        export_report(full_report, output_dir, fmt, metrics)
+        if occupancy:
+            export_occupancy(index, output_dir, fmt, metrics, rules)
+        return len(full_report)
+
+    if fmt is not None:
+        print(f"Writing the {fmt} report...")
+        # The steps and the export are interleaved duty by duty, so they are measured as one stage.
+        with metrics.stage('steps+export', len(duties)):
+            sink = ReportSink(output_dir / 'report', fmt)
+            pipeline(duties) | fused(index, stops, engine, rules=rules) | fan_out(sink)
+        if occupancy:
+            export_occupancy(index, output_dir, fmt, metrics, rules)
+        return len(duties)
 
     # Step 1: Generate start and end times and export
     print("Generating Step 1 XLSX file...")
-    start_end_times = generate_start_end_times(json_data['duties'], json_data['vehicles'])
-    export_to_excel(start_end_times, data_dir / 'step1', step=1)
+    with metrics.stage('step1', len(duties)):
+        start_end_times = generate_start_end_times(duties, vehicles, index)
+    with metrics.stage('export_step1', len(start_end_times)):
+        export_to_excel(start_end_times, output_dir / 'step1', step=1)
 
     # Step 2: Add stop names and export
     print("Generating Step 2 XLSX file...")
-    start_end_with_stop_names = generate_stop_names(start_end_times, json_data['stops'])
-    export_to_excel(start_end_with_stop_names, data_dir / 'step2', step=2)
+    with metrics.stage('step2', len(start_end_times)):
+        start_end_with_stop_names = generate_stop_names(start_end_times, stops)
+    with metrics.stage('export_step2', len(start_end_with_stop_names)):
+        export_to_excel(start_end_with_stop_names, output_dir / 'step2', step=2)
 
     # Step 3: Add break information and export
     print("Generating Step 3 XLSX file...")
-    full_report = generate_breaks_info(start_end_with_stop_names, json_data['vehicles'], json_data['stops'])
-    export_to_excel(full_report, data_dir / 'step3', step=3)
\ No newline at end of file
+    with metrics.stage('step3', len(start_end_with_stop_names)):
+        full_report = generate_breaks_info(start_end_with_stop_names, vehicles, stops, index, engine, rules=rules)
+    with metrics.stage('export_step3', len(full_report)):
+        export_to_excel(full_report, output_dir / 'step3', step=3)
+    if occupancy:
+        export_occupancy(index, output_dir, fmt, metrics, rules)
+    return len(full_report)
+
+"""Run the steps on the duties of a loaded schedule and return the ReportSummary of their results (see src/compare.py).
+
+Duties in `unchanged` are skipped and only counted (see unchanged_duties).
+The results stream from the fused pipeline into the summary, so the report is
+never held in memory; the stage is measured into `metrics` with `label`
+appended to its name.
+"""
+def summarise_duties(duties, stops, index, engine='python', metrics=NO_METRICS, rules=None, unchanged=frozenset(),
+                     label=''):
+    duties = [duty for duty in duties if duty['duty_id'] not in unchanged]
+    with metrics.stage(f'steps{label}', len(duties)):
+        summary, = (pipeline(duties) | fused(index, stops, engine, rules=rules)
+                    | fan_out(ReportSummary(unchanged=len(unchanged))))
+    return summary
+
+"""Compare the reports of two versions of a schedule and write the changed duties to output_dir.
+
+Both schedules are loaded, and the inputs of every duty are hashed before any
+step runs (see src/compare.unchanged_duties): only the duties whose inputs
+differ, or that exist in one version only, are run through the steps (see
+summarise_duties). Their results are hash-joined on the duty ID and the
+changes are written to report_diff.xlsx, or to report_diff_changes files in
+`fmt` (see src/compare.write_diff). Returns the number of duties changed,
+added, removed and unchanged, and of rows written.
+"""
+def compare_schedules(old_filepath, new_filepath, output_dir, stream=False, snapshot=False, engine='python', fmt=None,
+                      metrics=NO_METRICS, rules=None, validate=True):
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    print("Loading both schedules...")
+    with metrics.stage('load_old') as stage:
+        old_duties, _, old_stops, old_index = load_report_inputs(old_filepath, stream, snapshot, validate)
+        stage.items = len(old_duties)
+    with metrics.stage('load_new') as stage:
+        new_duties, _, new_stops, new_index = load_report_inputs(new_filepath, stream, snapshot, validate)
+        stage.items = len(new_duties)
+    with metrics.stage('hash', len(old_duties) + len(new_duties)):
+        unchanged = unchanged_duties(old_index, [duty['duty_id'] for duty in old_duties],
+                                     new_index, [duty['duty_id'] for duty in new_duties])
+    print(f"Computing the report of the {len(new_duties) - len(unchanged)} duties whose inputs changed...")
+    old = summarise_duties(old_duties, old_stops, old_index, engine, metrics, rules, unchanged, '_old')
+    new = summarise_duties(new_duties, new_stops, new_index, engine, metrics, rules, unchanged, '_new')
+    with metrics.stage('compare', len(new)):
+        counts = write_diff(old, new, output_dir / 'report_diff', fmt or 'xlsx')
+    print(f"{counts['changed']} duties changed, {counts['added']} added, {counts['removed']} removed "
+          f"and {counts['unchanged']} unchanged")
+    return counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate the duty reports from a schedule JSON file.")
+    parser.add_argument('filepath', nargs='?', default=DEFAULT_DATASET, type=Path, help="schedule JSON file")
+    parser.add_argument('--output-dir', default=DATA_DIR, type=Path, help="folder for the step XLSX files")
+    parser.add_argument('--stream', action='store_true', help="stream the file instead of loading it whole")
+    parser.add_argument('--engine', choices=ENGINES, default='python', help="break detection engine")
+    parser.add_argument('--workers', type=int, help="run the steps in this many worker processes")
+    parser.add_argument('--shard-by', choices=SHARD_MODES, default='hash', help="how duties are split between workers")
+    parser.add_argument('--format', choices=EXPORTERS, help="write one streamed report in this format")
+    parser.add_argument('--incremental', action='store_true', help="only recompute the duties changed since the last run")
+    parser.add_argument('--snapshot', action='store_true', help="read the schedule from its binary snapshot")
+    parser.add_argument('--metrics', choices=METRICS_FORMATS, help="report per-stage timings in this format")
+    parser.add_argument('--metrics-file', type=Path, help="write the metrics to this file instead of stdout")
+    parser.add_argument('--profile', action='store_true', help="also profile the stages with cProfile and tracemalloc")
+    parser.add_argument('--break-rules', type=Path, help="JSON file of break rules replacing the break threshold")
+    parser.add_argument('--occupancy', action='store_true', help="also write the stop and depot occupancy")
+    parser.add_argument('--compare', type=Path, metavar='OLD',
+                        help="only write how the report changed since this older schedule")
+    parser.add_argument('--no-validate', dest='validate', action='store_false',
+                        help="skip the validation of the schedule")
+    args = parser.parse_args()
+    if args.incremental and (args.stream or args.snapshot or args.break_rules or args.occupancy):
+        parser.error("--incremental cannot be combined with --stream, --snapshot, --break-rules or --occupancy")
+    if args.compare and (args.incremental or args.workers or args.occupancy):
+        parser.error("--compare cannot be combined with --incremental, --workers or --occupancy")
+    try:
+        rules = BreakRules.load(args.break_rules) if args.break_rules else None
+    except (OSError, ValueError) as e:
+        parser.error(f"cannot read the break rules: {e}")
+
+    metrics_format = args.metrics or ('table' if args.profile or args.metrics_file else None)
+    metrics = Metrics(profile=args.profile) if metrics_format else NO_METRICS
+    try:
+        if args.compare:
+            compare_schedules(args.compare, args.filepath, args.output_dir, stream=args.stream, snapshot=args.snapshot,
+                              engine=args.engine, fmt=args.format, metrics=metrics, rules=rules,
+                              validate=args.validate)
+        else:
+            generate_reports(args.filepath, args.output_dir, stream=args.stream, engine=args.engine,
+                             workers=args.workers, shard_by=args.shard_by, fmt=args.format,
+                             incremental=args.incremental, snapshot=args.snapshot, metrics=metrics, rules=rules,
+                             occupancy=args.occupancy, validate=args.validate)
+    except ScheduleValidationError as e:
+        parser.exit(1, f"{e}\n")
+
+    if args.profile:
+        print(metrics.profile_report())
+        metrics.dump_profile(args.output_dir / 'profile.pstats')
+    if args.metrics_file:
+        metrics.write(args.metrics_file, metrics_format)
+    elif metrics_format:
+        print(metrics.format(metrics_format))
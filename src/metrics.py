@@ -0,0 +1,284 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import resource
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+"""
+Per-stage instrumentation of a report run.
+
+Each stage (loading the schedule, each step, each export) is wrapped in
+Metrics.stage, which records its wall time, CPU time, the peak resident set
+size during the stage and of the run so far, and the number of items (duties
+or rows) it processed:
+
+    metrics = Metrics()
+    with metrics.stage('step1') as stage:
+        start_end_times = generate_start_end_times(duties, vehicles, index)
+        stage.items = len(start_end_times)
+    print(metrics.format('table'))
+
+On Linux the peak resident set size of the process (VmHWM) is reset when a
+stage starts, by writing '5' to /proc/self/clear_refs, and read back when it
+ends, which costs tens of microseconds per stage (stage_peak_rss, None where
+that is not supported). peak_rss stays a running high-water mark of the whole
+run: a stage that allocates less than an earlier one leaves it unchanged.
+With profile=True, the stages also run under cProfile and tracemalloc, which
+records how much each stage grew the peak of the memory Python allocates
+(peak_memory_delta, None otherwise), at the cost of a much slower run. The
+stages can be formatted as JSON, as a table or in the Prometheus text
+exposition format. NO_METRICS is a disabled instance whose stages do nothing.
+"""
+
+METRICS_FORMATS = ('json', 'table', 'prometheus')
+PROMETHEUS_PREFIX = 'duty_report_stage'
+# Functions and allocation sites listed by Metrics.profile_report.
+PROFILE_LIMIT = 20
+# ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+MAXRSS_UNIT = 1 if sys.platform == 'darwin' else 1024
+# Writing '5' to it resets the peak resident set size of the process (Linux).
+CLEAR_REFS_PATH = '/proc/self/clear_refs'
+STATUS_PATH = '/proc/self/status'
+
+
+"""The measurements of one stage.
+
+peak_rss is the peak resident set size of the process so far when the stage
+ended and stage_peak_rss the peak during the stage, in bytes (None where it
+cannot be measured); peak_memory_delta is the growth of the traced peak during
+the stage, only measured when profiling.
+"""
+class StageMetrics:
+    __slots__ = ('name', 'wall_seconds', 'cpu_seconds', 'peak_rss', 'stage_peak_rss', 'peak_memory_delta', 'items')
+
+    def __init__(self, name, items=None):
+        self.name = name
+        self.wall_seconds = None
+        self.cpu_seconds = None
+        self.peak_rss = None
+        self.stage_peak_rss = None
+        self.peak_memory_delta = None
+        self.items = items
+
+    @property
+    def items_per_second(self):
+        if self.items is None or not self.wall_seconds:
+            return None
+        return self.items / self.wall_seconds
+
+    def to_dict(self):
+        return {
+            'stage': self.name,
+            'wall_seconds': self.wall_seconds,
+            'cpu_seconds': self.cpu_seconds,
+            'peak_rss_bytes': self.peak_rss,
+            'stage_peak_rss_bytes': self.stage_peak_rss,
+            'peak_memory_delta_bytes': self.peak_memory_delta,
+            'items': self.items,
+            'items_per_second': self.items_per_second,
+        }
+
+"""Stand-in for StageMetrics when metrics are disabled: a reusable context that records nothing."""
+class _NullStage:
+    items = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+"""Return the peak resident set size of the process so far (ru_maxrss), in bytes."""
+def _max_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * MAXRSS_UNIT
+
+"""Reset the peak resident set size of the process to its current size; returns False where that is not supported."""
+def _reset_peak_rss():
+    try:
+        with open(CLEAR_REFS_PATH, 'w') as file:
+            file.write('5')
+    except OSError:
+        return False
+    return True
+
+"""Return the peak resident set size since the last _reset_peak_rss (VmHWM), in bytes, or None."""
+def _peak_rss_since_reset():
+    try:
+        with open(STATUS_PATH) as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+"""Times a stage into a StageMetrics and appends it to its Metrics, also when the stage fails."""
+class _StageContext:
+    __slots__ = ('metrics', 'record', 'wall_start', 'cpu_start', 'memory_start', 'rss_reset')
+
+    def __init__(self, metrics, record):
+        self.metrics = metrics
+        self.record = record
+
+    def __enter__(self):
+        self.rss_reset = self.metrics._reset_rss()
+        self.memory_start = self.metrics._start()
+        self.cpu_start = time.process_time()
+        self.wall_start = time.perf_counter()
+        return self.record
+
+    def __exit__(self, *exc_info):
+        wall_end = time.perf_counter()
+        cpu_end = time.process_time()
+        record = self.record
+        record.peak_memory_delta = self.metrics._stop(self.memory_start)
+        record.stage_peak_rss = _peak_rss_since_reset() if self.rss_reset else None
+        record.peak_rss = self.metrics._peak_rss = max(self.metrics._peak_rss, _max_rss(), record.stage_peak_rss or 0)
+        record.wall_seconds = wall_end - self.wall_start
+        record.cpu_seconds = cpu_end - self.cpu_start
+        self.metrics.stages.append(record)
+        return False
+
+"""Format a number of bytes in MB for the table, or '-' when it was not measured."""
+def _megabytes(size):
+    return '-' if size is None else f"{size / 2**20:.1f}"
+
+"""Collects the StageMetrics of a run, in stage order."""
+class Metrics:
+
+    def __init__(self, enabled=True, profile=False):
+        self.enabled = enabled or profile
+        self.profile = profile
+        self.stages = []
+        self.profiler = cProfile.Profile() if profile else None
+        self.allocations = None
+        # Running peak RSS of the run, as resetting the peak of the process for a stage also resets ru_maxrss.
+        self._peak_rss = 0
+
+    def stage(self, name, items=None):
+        """Return a context manager measuring a stage; set `items` on the StageMetrics it yields."""
+        if not self.enabled:
+            return _NULL_STAGE
+        return _StageContext(self, StageMetrics(name, items))
+
+    def _reset_rss(self):
+        """Fold the peak RSS so far into the running peak and reset the peak of the process for a stage."""
+        self._peak_rss = max(self._peak_rss, _max_rss())
+        return _reset_peak_rss()
+
+    def _start(self):
+        if self.profile:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            self.profiler.enable()
+            return tracemalloc.get_traced_memory()[0]
+        return None
+
+    def _stop(self, memory_start):
+        if self.profile:
+            self.profiler.disable()
+            peak = tracemalloc.get_traced_memory()[1]
+            self.allocations = tracemalloc.take_snapshot()
+            return max(peak - memory_start, 0)
+        return None
+
+    def totals(self):
+        """Return the summed wall and CPU seconds, the peak RSS and the largest stage peak and peak memory growth."""
+        stage_peaks = [stage.stage_peak_rss for stage in self.stages if stage.stage_peak_rss is not None]
+        deltas = [stage.peak_memory_delta for stage in self.stages if stage.peak_memory_delta is not None]
+        return {
+            'wall_seconds': sum(stage.wall_seconds for stage in self.stages),
+            'cpu_seconds': sum(stage.cpu_seconds for stage in self.stages),
+            'peak_rss_bytes': max((stage.peak_rss for stage in self.stages), default=0),
+            'stage_peak_rss_bytes': max(stage_peaks) if stage_peaks else None,
+            'peak_memory_delta_bytes': max(deltas) if deltas else None,
+        }
+
+    def to_dict(self):
+        return {'profile': self.profile, 'stages': [stage.to_dict() for stage in self.stages], 'totals': self.totals()}
+
+    def format(self, fmt='table'):
+        """Format the stages as 'json', 'table' or 'prometheus'."""
+        if fmt == 'json':
+            return json.dumps(self.to_dict(), indent=2)
+        if fmt == 'table':
+            return self._format_table()
+        if fmt == 'prometheus':
+            return self._format_prometheus()
+        raise ValueError(f"Unknown metrics format {fmt!r}; expected one of {', '.join(METRICS_FORMATS)}")
+
+    def _format_table(self):
+        lines = [f"{'stage':<16} {'wall s':>9} {'cpu s':>9} {'peak rss MB':>12} {'stage rss MB':>12} "
+                 f"{'stage peak MB':>13} {'items':>9} {'items/s':>11}"]
+        for stage in self.stages:
+            items = '-' if stage.items is None else stage.items
+            rate = '-' if stage.items_per_second is None else f"{stage.items_per_second:.0f}"
+            lines.append(f"{stage.name:<16} {stage.wall_seconds:>9.4f} {stage.cpu_seconds:>9.4f} "
+                         f"{stage.peak_rss / 2**20:>12.1f} {_megabytes(stage.stage_peak_rss):>12} "
+                         f"{_megabytes(stage.peak_memory_delta):>13} {items:>9} {rate:>11}")
+        totals = self.totals()
+        lines.append(f"{'total':<16} {totals['wall_seconds']:>9.4f} {totals['cpu_seconds']:>9.4f} "
+                     f"{totals['peak_rss_bytes'] / 2**20:>12.1f} {_megabytes(totals['stage_peak_rss_bytes']):>12} "
+                     f"{_megabytes(totals['peak_memory_delta_bytes']):>13}")
+        return '\n'.join(lines)
+
+    def _format_prometheus(self):
+        series = [
+            ('wall_seconds', 'Wall-clock time of a report stage, in seconds.', 'wall_seconds'),
+            ('cpu_seconds', 'CPU time of a report stage, in seconds.', 'cpu_seconds'),
+            ('peak_rss_bytes', 'Peak resident set size of the process when a report stage ended, in bytes '
+             '(a running high-water mark of the whole run).', 'peak_rss'),
+            ('stage_peak_rss_bytes', 'Peak resident set size of the process during a report stage, in bytes.',
+             'stage_peak_rss'),
+            ('peak_memory_delta_bytes', 'Growth of the traced peak memory during a report stage, in bytes '
+             '(only when profiling).', 'peak_memory_delta'),
+            ('items', 'Items (duties or rows) processed by a report stage.', 'items'),
+            ('items_per_second', 'Throughput of a report stage, in items per second.', 'items_per_second'),
+        ]
+        lines = []
+        for suffix, help_text, attribute in series:
+            name = f"{PROMETHEUS_PREFIX}_{suffix}"
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            for stage in self.stages:
+                value = getattr(stage, attribute)
+                if value is not None:
+                    label = stage.name.replace('\\', '\\\\').replace('"', '\\"')
+                    lines.append(f'{name}{{stage="{label}"}} {value!r}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path, fmt='json'):
+        """Write the formatted stages to `path` atomically (a Prometheus textfile collector may read it at any time)."""
+        path = Path(path)
+        temp_path = path.with_name(path.name + '.tmp')
+        with open(temp_path, 'w') as file:
+            file.write(self.format(fmt))
+            if fmt != 'prometheus':
+                file.write('\n')
+        os.replace(temp_path, path)
+
+    def profile_report(self, limit=PROFILE_LIMIT):
+        """Return the hottest functions (by cumulative time) and allocation sites of a profiled run, as text."""
+        if not self.profile:
+            return ''
+        output = io.StringIO()
+        pstats.Stats(self.profiler, stream=output).sort_stats('cumulative').print_stats(limit)
+        if self.allocations is not None:
+            output.write(f"Top {limit} allocation sites still held after the last stage:\n")
+            for statistic in self.allocations.statistics('lineno')[:limit]:
+                output.write(f"  {statistic}\n")
+        return output.getvalue()
+
+    def dump_profile(self, path):
+        """Save the cProfile statistics of a profiled run, for pstats or a viewer like snakeviz."""
+        self.profiler.dump_stats(path)
+
+
+_NULL_STAGE = _NullStage()
+NO_METRICS = Metrics(enabled=False)
@@ -0,0 +1,275 @@
+import numpy as np
+from src.exporters import EXPORTERS
+from src.stops import UNKNOWN_STOP
+from src.utils import BREAK_THRESHOLD, format_time
+from src.vectorized import break_mask, gap_arrays, index_events_frame
+
+"""
+Stop and depot occupancy: how many drivers are idling, and how many are on
+break, at each stop and in each depot area at every minute of the schedule.
+
+A driver idles at a stop during every gap between two events of their duty,
+at the destination of the event before the gap (the stop a break is reported
+at); the gaps that are breaks (longer than the threshold, or matching the
+BreakRules of src/breaks.py) also count as drivers on break. Every stop
+belongs to the area of its nearest depot, by great-circle distance between
+their coordinates; stops without coordinates only belong to an area when they
+are a depot themselves.
+
+Occupancy finds every gap of every duty at once (see gap_arrays) and counts
+them with one sweep: each gap adds +1 to its stop at its first minute and -1
+after its last one, these change points are sorted by stop and minute, and a
+cumulative sum over them gives the number of drivers at each stop from each
+change point to the next (see change_points). Only the change points are
+stored, so building it costs O(gaps log gaps) time and O(gaps) memory, however
+many stops and minutes the schedule spans, instead of one pass over the breaks
+per stop and minute. The depot areas are swept the same way from the gaps of
+their stops. A gap from `start` to `end` covers minutes start to end - 1, the
+same window BreakIndex.count_on_break(minute, minute + 1) counts.
+
+write_occupancy exports the time series and summaries as four sheets:
+stop_occupancy and depot_occupancy (the minutes with drivers idling, per stop
+or depot area) and stop_summary and depot_summary (dwell and break totals and
+peaks), in any format of src/exporters.py.
+"""
+
+OCCUPANCY_COLUMNS = ['Time', 'Stop ID', 'Stop Name', 'Drivers Idle', 'Drivers On Break']
+DEPOT_OCCUPANCY_COLUMNS = ['Time', 'Depot ID', 'Depot Name', 'Drivers Idle', 'Drivers On Break']
+SUMMARY_COLUMNS = ['Dwells', 'Dwell Minutes', 'Breaks', 'Break Minutes', 'Peak Drivers Idle', 'Peak Idle Time',
+                   'Peak Drivers On Break', 'Peak Break Time']
+STOP_SUMMARY_COLUMNS = ['Stop ID', 'Stop Name', 'Is Depot', 'Depot'] + SUMMARY_COLUMNS
+DEPOT_SUMMARY_COLUMNS = ['Depot ID', 'Depot Name', 'Stops'] + SUMMARY_COLUMNS
+# The columns that do not hold strings (see src/exporters.py).
+COLUMN_TYPES = dict.fromkeys(['Drivers Idle', 'Drivers On Break', 'Stops', 'Dwells', 'Dwell Minutes', 'Breaks',
+                              'Break Minutes', 'Peak Drivers Idle', 'Peak Drivers On Break'], 'int64')
+COLUMN_TYPES['Is Depot'] = 'bool'
+
+
+"""Sweep weighted intervals to the change points of their sums, per row.
+
+Interval i covers [starts[i], ends[i]) in row rows[i] and adds weights[i] (a
+row of one weight per count kept) to it. Returns (point_rows, times, counts),
+sorted by row then time: from times[j] until the next change point of its
+row, the sums of row point_rows[j] are counts[j]. The last change point of a
+row has all sums back at zero.
+"""
+def change_points(rows, starts, ends, weights):
+    point_rows = np.concatenate([rows, rows])
+    times = np.concatenate([starts, ends])
+    deltas = np.concatenate([weights, -weights])
+    order = np.lexsort((times, point_rows))
+    point_rows, times, deltas = point_rows[order], times[order], deltas[order]
+    if not len(times):
+        return point_rows, times, deltas
+    # Merge the changes of a row at the same minute, and drop the ones that cancel out.
+    firsts = np.flatnonzero(np.concatenate([[True], (point_rows[1:] != point_rows[:-1]) | (times[1:] != times[:-1])]))
+    point_rows, times, deltas = point_rows[firsts], times[firsts], np.add.reduceat(deltas, firsts, axis=0)
+    changed = deltas.any(axis=1)
+    point_rows, times, deltas = point_rows[changed], times[changed], deltas[changed]
+    # The changes of every row add up to zero, so one running sum over all rows restarts at zero on each row.
+    return point_rows, times, np.cumsum(deltas, axis=0)
+
+"""Step functions of counts over the minutes, one per row, stored as their change points (see change_points).
+
+Column 0 of the counts is the drivers idling and column 1 the drivers on break.
+"""
+class _StepSeries:
+
+    def __init__(self, rows, starts, ends, weights, row_count):
+        point_rows, self.times, self.counts = change_points(rows, starts, ends, weights)
+        self.offsets = np.searchsorted(point_rows, np.arange(row_count + 1))
+
+    def at(self, row, minute):
+        """Return the counts of a row at a minute."""
+        first, last = self.offsets[row], self.offsets[row + 1]
+        point = first + int(np.searchsorted(self.times[first:last], minute, side='right')) - 1
+        return self.counts[point] if point >= first else np.zeros(self.counts.shape[1], dtype=np.int64)
+
+    def peak(self, row, column):
+        """Return the highest count of a row and the first minute it is reached, or (0, None)."""
+        first, last = self.offsets[row], self.offsets[row + 1]
+        counts = self.counts[first:last, column]
+        if not counts.size or not counts.max():
+            return 0, None
+        point = int(np.argmax(counts))
+        return int(counts[point]), format_time(int(self.times[first + point]))
+
+    def minutes(self, row):
+        """Yield (minute, counts) for every minute of a row with drivers idling, in time order."""
+        first, last = self.offsets[row], self.offsets[row + 1]
+        times = self.times[first:last].tolist()
+        counts = self.counts[first:last].tolist()
+        for start, end, point_counts in zip(times, times[1:], counts):
+            if point_counts[0]:
+                for minute in range(start, end):
+                    yield minute, point_counts
+
+"""Return the position in `depot_codes` of the nearest depot of every stop code of `stops`, -1 when none.
+
+Distances are great-circle distances between the coordinates of the stops.
+"""
+def nearest_depots(stops, depot_codes):
+    assignment = np.full(len(stops), -1, dtype=np.int64)
+    for position, code in enumerate(depot_codes):
+        assignment[code] = position
+    located = [(position, stops.coordinates(stops.stop_id(code))) for position, code in enumerate(depot_codes)]
+    located = [(position, coordinates) for position, coordinates in located if coordinates is not None]
+    if not located:
+        return assignment
+    positions = np.array([position for position, _ in located], dtype=np.int64)
+    depot_points = np.radians([coordinates for _, coordinates in located])
+    for code in range(len(stops)):
+        coordinates = stops.coordinates(stops.stop_id(code))
+        if assignment[code] >= 0 or coordinates is None:
+            continue
+        latitude, longitude = np.radians(coordinates)
+        # Haversine formula; the constant factors do not change which depot is the nearest.
+        half_chords = (np.sin((depot_points[:, 0] - latitude) / 2) ** 2
+                       + np.cos(latitude) * np.cos(depot_points[:, 0])
+                       * np.sin((depot_points[:, 1] - longitude) / 2) ** 2)
+        assignment[code] = positions[np.argmin(half_chords)]
+    return assignment
+
+"""The drivers idling and on break at every stop and depot area, minute by minute.
+
+`start` is the first minute covered and `span` the number of minutes from
+it. Rows are the stop codes, plus a last row gathering the gaps without a
+stop. `depot_codes` holds the stop codes of the depots and `stop_depots` the
+position in it of the depot area of each row (-1 for none). Per row,
+`dwells` and `dwell_minutes` count the gaps and their minutes, and `breaks`
+and `break_minutes` the breaks. The drivers idling and on break over time are
+kept as step series of change points per row, per depot area and overall.
+"""
+class Occupancy:
+
+    def __init__(self, stops, gap_codes, gap_starts, gap_durations, is_break):
+        self.stops = stops
+        # The registry can grow later on; the rows are the stops known now.
+        self.stop_count = len(stops)
+        row_count = self.stop_count + 1
+        # Gaps without a stop go to the last row; touching or overlapping events leave no gap.
+        idle = gap_durations > 0
+        codes = np.where(gap_codes < 0, row_count - 1, gap_codes)[idle]
+        starts, durations, is_break = gap_starts[idle], gap_durations[idle], is_break[idle]
+        ends = starts + durations
+        self.start = int(starts.min()) if len(starts) else 0
+        self._span = int(ends.max()) - self.start if len(ends) else 0
+
+        weights = np.column_stack([np.ones(len(codes), dtype=np.int64), is_break.astype(np.int64)])
+        self.stop_series = _StepSeries(codes, starts, ends, weights, row_count)
+        self.total_series = _StepSeries(np.zeros(len(codes), dtype=np.int64), starts, ends, weights, 1)
+        self.dwells = np.bincount(codes, minlength=row_count)
+        self.dwell_minutes = np.bincount(codes, weights=durations, minlength=row_count).astype(np.int64)
+        self.breaks = np.bincount(codes[is_break], minlength=row_count)
+        self.break_minutes = np.bincount(codes[is_break], weights=durations[is_break],
+                                         minlength=row_count).astype(np.int64)
+
+        self.depot_codes = [code for code in range(self.stop_count) if stops.is_depot_code(code)]
+        self.stop_depots = np.append(nearest_depots(stops, self.depot_codes), -1)
+        gap_depots = self.stop_depots[codes]
+        in_area = gap_depots >= 0
+        self.depot_series = _StepSeries(gap_depots[in_area], starts[in_area], ends[in_area], weights[in_area],
+                                        len(self.depot_codes))
+
+    @classmethod
+    def from_index(cls, index, duty_ids=None, threshold=BREAK_THRESHOLD, rules=None):
+        """Count the gaps and breaks of the duties of a DutyEventIndex (all of them by default)."""
+        _, _, starts, durations, destinations = gap_arrays(index_events_frame(index, duty_ids))
+        is_break, _ = break_mask(durations, destinations, index.stops, threshold, rules)
+        return cls(index.stops, destinations, starts, durations, is_break)
+
+    @property
+    def span(self):
+        """Number of minutes covered, from `start`."""
+        return self._span
+
+    def _count(self, column, minute, stop_id):
+        if stop_id is None:
+            return int(self.total_series.at(0, minute)[column])
+        code = self.stops.code(stop_id)
+        if code is None or code >= self.stop_count:
+            return 0
+        return int(self.stop_series.at(code, minute)[column])
+
+    def drivers_idle(self, minute, stop_id=None):
+        """Return the number of drivers idling at a stop (anywhere by default) at a minute."""
+        return self._count(0, minute, stop_id)
+
+    def drivers_on_break(self, minute, stop_id=None):
+        """Return the number of drivers on break at a stop (anywhere by default) at a minute."""
+        return self._count(1, minute, stop_id)
+
+    def _stop_label(self, row):
+        if row == self.stop_count:
+            return None, UNKNOWN_STOP
+        return self.stops.stop_id(row), self.stops.name_of(row)
+
+    def _summary(self, rows, series, row):
+        return (
+            int(self.dwells[rows].sum()), int(self.dwell_minutes[rows].sum()),
+            int(self.breaks[rows].sum()), int(self.break_minutes[rows].sum()),
+            *series.peak(row, 0), *series.peak(row, 1),
+        )
+
+    def stop_summary_rows(self):
+        """Yield a STOP_SUMMARY_COLUMNS row per named stop, and for the gaps without a known stop if there are any."""
+        names = self.stops.names()
+        for row in range(self.stop_count + 1):
+            unnamed = row == self.stop_count or self.stops.name_of(row) == UNKNOWN_STOP
+            if unnamed and not self.dwells[row]:
+                continue
+            stop_id, stop_name = self._stop_label(row)
+            depot = self.stop_depots[row]
+            yield (stop_id, stop_name, bool(row < self.stop_count and self.stops.is_depot_code(row)),
+                   names[self.depot_codes[depot]] if depot >= 0 else None,
+                   *self._summary([row], self.stop_series, row))
+
+    def depot_summary_rows(self):
+        """Yield a DEPOT_SUMMARY_COLUMNS row per depot, over all the stops of its area."""
+        for position, code in enumerate(self.depot_codes):
+            rows = np.flatnonzero(self.stop_depots == position)
+            yield (self.stops.stop_id(code), self.stops.name_of(code), len(rows),
+                   *self._summary(rows, self.depot_series, position))
+
+    def stop_occupancy_rows(self):
+        """Yield an OCCUPANCY_COLUMNS row per stop and minute with drivers idling, by stop then time."""
+        for row in range(self.stop_count + 1):
+            label = self._stop_label(row)
+            for minute, (idle, on_break) in self.stop_series.minutes(row):
+                yield format_time(minute), *label, idle, on_break
+
+    def depot_occupancy_rows(self):
+        """Yield a DEPOT_OCCUPANCY_COLUMNS row per depot area and minute with drivers idling, by depot then time."""
+        for position, code in enumerate(self.depot_codes):
+            depot_id, depot_name = self.stops.stop_id(code), self.stops.name_of(code)
+            for minute, (idle, on_break) in self.depot_series.minutes(position):
+                yield format_time(minute), depot_id, depot_name, idle, on_break
+
+    def sheets(self):
+        """Return the (sheet name, columns, rows) of every sheet written by write_occupancy."""
+        return [
+            ('stop_occupancy', OCCUPANCY_COLUMNS, self.stop_occupancy_rows()),
+            ('depot_occupancy', DEPOT_OCCUPANCY_COLUMNS, self.depot_occupancy_rows()),
+            ('stop_summary', STOP_SUMMARY_COLUMNS, self.stop_summary_rows()),
+            ('depot_summary', DEPOT_SUMMARY_COLUMNS, self.depot_summary_rows()),
+        ]
+
+"""Write the time series and summaries of an Occupancy with an exporter of src/exporters.py.
+
+`path` is the output path without extension: XLSX writes one workbook with a
+sheet each, CSV and Parquet one <path>_<sheet> file each. Returns the number
+of rows written per sheet.
+"""
+def write_occupancy(occupancy, path, fmt='xlsx'):
+    writer = EXPORTERS[fmt](path)
+    row_counts = {}
+    try:
+        for name, columns, rows in occupancy.sheets():
+            sheet = writer.open_sheet(name, columns, COLUMN_TYPES)
+            row_counts[name] = 0
+            for row in rows:
+                sheet.append(row)
+                row_counts[name] += 1
+    finally:
+        writer.close()
+    return row_counts
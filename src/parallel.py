@@ -0,0 +1,97 @@
+import os
+import pickle
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from src.index import DutyEventIndex
+from src.steps import generate_start_end_times, generate_stop_names, generate_breaks_info
+
+SHARD_MODES = ('hash', 'depot')
+# Shards per worker in hash mode, so a slow shard does not leave the other workers idle.
+SHARDS_PER_WORKER = 4
+
+
+"""Return the shard of a duty by hashing its ID (crc32, so it is the same in every process)."""
+def hash_shard(duty_id, shard_count):
+    return zlib.crc32(str(duty_id).encode()) % shard_count
+
+"""Return the stop ID of the depot a duty pulls out of, or None.
+
+That is the origin of the first event of the duty starting at a depot stop.
+"""
+def duty_depot(index, duty_id):
+    for record in index.events(duty_id):
+        if index.stops.is_depot_code(record.origin):
+            return index.stops.stop_id(record.origin)
+    return None
+
+"""Partition duty IDs into shards, by hash of the duty ID or by depot.
+
+Returns a list of non-empty lists of duty IDs; each duty keeps its relative
+order within its shard.
+"""
+def partition_duties(duty_ids, index, shard_count, shard_by='hash'):
+    shards = {}
+    for duty_id in duty_ids:
+        key = hash_shard(duty_id, shard_count) if shard_by == 'hash' else duty_depot(index, duty_id)
+        shards.setdefault(key, []).append(duty_id)
+    return list(shards.values())
+
+"""Pickle the part of the index a shard needs.
+
+Only the duty IDs and the timeline columns of the shard's duties travel, as
+the int32 arrays of DutyEventIndex.timeline_arrays; the stop registry is sent
+once per worker (see _init_worker) and the schedule dict never leaves the parent.
+"""
+def pack_shard(duty_ids, index):
+    return pickle.dumps((duty_ids, index.timeline_arrays(duty_ids)), protocol=pickle.HIGHEST_PROTOCOL)
+
+# The stop registry of the report, set in each worker process by _init_worker.
+_worker_stops = None
+
+"""Pool initializer: keep the stop registry for the shards this worker runs."""
+def _init_worker(stops):
+    global _worker_stops
+    _worker_stops = stops
+
+"""Run steps 1-3 on a duty event index, as the serial flow does."""
+def _report(duties, index, stops, engine, rules):
+    start_end_times = generate_start_end_times(duties, None, index)
+    start_end_with_stop_names = generate_stop_names(start_end_times, stops)
+    return generate_breaks_info(start_end_with_stop_names, None, stops, index, engine, rules=rules)
+
+"""Worker entry point: run steps 1-3 on a packed shard and return the duty results.
+
+`stops` defaults to the registry the pool initializer gave this worker.
+"""
+def run_shard(payload, engine='python', rules=None, stops=None):
+    stops = stops if stops is not None else _worker_stops
+    duty_ids, timelines = pickle.loads(payload)
+    index = DutyEventIndex.from_timelines(duty_ids, *timelines, stops=stops)
+    return _report([{'duty_id': duty_id} for duty_id in duty_ids], index, stops, engine, rules)
+
+"""Run steps 1-3 over shards of the duties in a process pool.
+
+Duties are partitioned by hash of their ID or by the depot they pull out of,
+each shard is packed with pack_shard and processed by run_shard in one of
+`workers` processes, which get the stop registry once when they start. The
+results are merged back in the order of `duties`, so the report is the same
+as the serial one. With workers=1 the steps run serially in this process,
+without sharding. BreakRules given as `rules` are sent along to the workers.
+
+Returns the full report (the list generate_breaks_info returns).
+"""
+def generate_report_parallel(duties, index, workers=None, shard_by='hash', engine='python', rules=None):
+    if shard_by not in SHARD_MODES:
+        raise ValueError(f"Unknown shard mode {shard_by!r}, expected one of {SHARD_MODES}")
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        return _report(duties, index, index.stops, engine, rules)
+
+    duty_ids = [duty['duty_id'] for duty in duties]
+    shards = partition_duties(dict.fromkeys(duty_ids), index, workers * SHARDS_PER_WORKER, shard_by)
+    payloads = [pack_shard(shard, index) for shard in shards]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(index.stops,)) as executor:
+        shard_results = list(executor.map(run_shard, payloads, [engine] * len(payloads), [rules] * len(payloads)))
+
+    results = {duty_data['Duty ID']: duty_data for shard_result in shard_results for duty_data in shard_result}
+    return [dict(results[duty_id]) for duty_id in duty_ids]
@@ -0,0 +1,104 @@
+from collections.abc import Iterator
+from itertools import islice
+from src.utils import BREAK_THRESHOLD
+from src.steps import generate_start_end_times, generate_stop_names, generate_breaks_info
+
+# Duties a stage hands to the step functions at a time. Only one batch per stage
+# is held in memory; batch_size=1 runs the pipeline strictly duty by duty.
+BATCH_SIZE = 1024
+
+
+"""Yield lists of up to `size` items from an iterable."""
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+"""A lazy chain of stages over per-duty records.
+
+Stages are callables taking an iterable of records. A stage returning an
+iterator (e.g. a generator) extends the pipeline; any other result, like the
+one of a sink, ends it and is returned as is. Nothing runs until a sink (or
+iterating the pipeline) pulls the records through:
+
+    pipeline(duties) | start_end(index) | stop_names(stops) | breaks(index, stops) | fan_out(sink)
+"""
+class Pipeline:
+
+    def __init__(self, records):
+        self.records = records
+
+    def __or__(self, stage):
+        result = stage(self.records)
+        return Pipeline(result) if isinstance(result, Iterator) else result
+
+    def __iter__(self):
+        return iter(self.records)
+
+"""Start a pipeline from the duties of a schedule (anything iterable, such as a generator)."""
+def pipeline(duties):
+    return Pipeline(iter(duties))
+
+"""Stage turning duties into step 1 records (see steps.generate_start_end_times)."""
+def start_end(index, batch_size=BATCH_SIZE):
+    def stage(duties):
+        for batch in batched(duties, batch_size):
+            yield from generate_start_end_times(batch, None, index)
+    return stage
+
+"""Stage adding the first and last stop names to step 1 records (see steps.generate_stop_names)."""
+def stop_names(stops, batch_size=BATCH_SIZE):
+    def stage(records):
+        for batch in batched(records, batch_size):
+            yield from generate_stop_names(batch, stops)
+    return stage
+
+"""Stage adding the breaks to step 2 records (see steps.generate_breaks_info)."""
+def breaks(index, stops, engine='python', threshold=BREAK_THRESHOLD, batch_size=BATCH_SIZE, rules=None):
+    def stage(records):
+        for batch in batched(records, batch_size):
+            yield from generate_breaks_info(batch, None, stops, index, engine, threshold, rules)
+    return stage
+
+"""Stage computing the full report of each batch of duties in one traversal.
+
+Gives the same records as start_end | stop_names | breaks, running the three
+steps back to back on a batch instead of passing every record through three
+generators.
+"""
+def fused(index, stops, engine='python', threshold=BREAK_THRESHOLD, batch_size=BATCH_SIZE, rules=None):
+    def stage(duties):
+        for batch in batched(duties, batch_size):
+            start_end_times = generate_start_end_times(batch, None, index)
+            start_end_with_stop_names = generate_stop_names(start_end_times, stops)
+            yield from generate_breaks_info(start_end_with_stop_names, None, stops, index, engine, threshold, rules)
+    return stage
+
+"""Sink stage sending every record to each of `sinks` as it goes by.
+
+A sink is an object with send(record) and close(), such as
+exporters.ReportSink. The sinks are closed once the records run out (or the
+pipeline fails). Returns the list of their close() results.
+"""
+def fan_out(*sinks):
+    def stage(records):
+        try:
+            for record in records:
+                for sink in sinks:
+                    sink.send(record)
+        finally:
+            results = [sink.close() for sink in sinks]
+        return results
+    return stage
+
+"""Sink keeping the records it is sent, for callers that need the report in memory."""
+class ListSink:
+
+    def __init__(self):
+        self.records = []
+
+    def send(self, record):
+        self.records.append(record)
+
+    def close(self):
+        return self.records
@@ -0,0 +1,320 @@
+import argparse
+import asyncio
+import json
+import os
+from collections import OrderedDict
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlsplit
+from src.breaks import BreakIndex
+from src.streaming import stream_report_inputs
+from src.utils import BREAK_THRESHOLD, format_time, time_to_minutes
+from src.steps import generate_start_end_times, generate_stop_names, generate_breaks_info
+
+"""
+Resident report service: loads a schedule once, keeps its DutyEventIndex warm
+and answers report queries over HTTP (on a TCP port or a Unix socket).
+
+    GET /duties/<duty_id>[?threshold=N]   start/end time, first/last stop and breaks of a duty
+    GET /report[?threshold=N]             the full report, in duty order
+    GET /breaks?start=T&end=T[&stop=ID][&threshold=N]
+                                          the breaks overlapping a time window (at a stop)
+    GET /status                           dataset version, duty count and cache statistics
+
+Responses are JSON, with times formatted like in the exports ('day.HH:MM',
+null when missing). Encoded responses are kept in an LRU cache keyed by
+(dataset version, duty ID, break threshold). The schedule file is polled and,
+when it changes, loaded again in a worker thread and swapped in at once;
+queries keep being answered from the previous dataset meanwhile.
+
+Run from the repository root with `python -m src.service [schedule.json] [--port N | --unix PATH]`.
+"""
+
+DEFAULT_DATASET = Path(__file__).resolve().parent.parent / 'data' / 'mini_json_dataset.json'
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8080
+CACHE_SIZE = 4096
+# Seconds between two checks of the schedule file for changes.
+RELOAD_INTERVAL = 1.0
+# Largest request head accepted, in bytes.
+MAX_REQUEST_SIZE = 8192
+
+HTTP_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed'}
+
+
+"""Return the version of a schedule file: its modification time and size."""
+def file_version(filepath):
+    stat = os.stat(filepath)
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+"""Convert a duty result of the steps to its JSON form, with formatted times."""
+def duty_json(duty_data):
+    return {
+        'duty_id': duty_data['Duty ID'],
+        'start_time': None if duty_data['Start Time'] is None else format_time(duty_data['Start Time']),
+        'end_time': None if duty_data['End Time'] is None else format_time(duty_data['End Time']),
+        'first_stop': duty_data['First Stop'],
+        'last_stop': duty_data['Last Stop'],
+        'breaks': [break_json(break_info) for break_info in duty_data['Breaks']],
+    }
+
+"""Convert a break dict of calculate_breaks or BreakIndex to its JSON form."""
+def break_json(break_info):
+    result = {
+        'start_time': format_time(break_info['break_start_time']),
+        'duration': break_info['break_duration'],
+        'stop_name': break_info['break_stop_name'],
+    }
+    if 'duty_id' in break_info:
+        result = {'duty_id': break_info['duty_id'], **result}
+    if 'break_type' in break_info:
+        result['type'] = break_info['break_type']
+        result['paid'] = break_info['paid']
+    return result
+
+"""A bounded mapping that evicts the least recently used entry when full."""
+class LRUCache:
+
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return the value cached under key (marking it as recently used), or None."""
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+"""A loaded schedule: its duties, StopRegistry and DutyEventIndex.
+
+Every duty is sorted in the index at load time, so the steps only read it
+afterwards and a Dataset can be shared by queries without locking. The
+schedule is validated while it is streamed (see src/validation.py), so a
+malformed file raises ScheduleValidationError instead of being served. The
+BreakIndex of each break threshold is built on first use.
+"""
+class Dataset:
+
+    def __init__(self, version, duties, stops, index):
+        self.version = version
+        self.duties = duties
+        self.duty_ids = set(duty['duty_id'] for duty in duties)
+        self.stops = stops
+        self.index = index
+        self.break_indexes = {}
+
+    @classmethod
+    def load(cls, filepath):
+        version = file_version(filepath)
+        duties, stops, index = stream_report_inputs(filepath, validate=True)
+        for duty_id in index.duty_ids():
+            index.events(duty_id)
+        return cls(version, duties, stops, index)
+
+    def report(self, duties, threshold=BREAK_THRESHOLD):
+        """Run steps 1-3 on some of the duties of the dataset."""
+        start_end_times = generate_start_end_times(duties, None, self.index)
+        start_end_with_stop_names = generate_stop_names(start_end_times, self.stops)
+        return generate_breaks_info(start_end_with_stop_names, None, self.stops, self.index, threshold=threshold)
+
+    def break_index(self, threshold=BREAK_THRESHOLD):
+        """Return the BreakIndex of the duties of the dataset for a break threshold."""
+        break_index = self.break_indexes.get(threshold)
+        if break_index is None:
+            duty_ids = list(dict.fromkeys(duty['duty_id'] for duty in self.duties))
+            break_index = self.break_indexes[threshold] = BreakIndex.from_index(self.index, duty_ids, threshold)
+        return break_index
+
+    def duty(self, duty_id, threshold=BREAK_THRESHOLD):
+        """Return the report of one duty; raises KeyError for a duty that is not in the dataset."""
+        if duty_id not in self.duty_ids:
+            raise KeyError(duty_id)
+        return self.report([{'duty_id': duty_id}], threshold)[0]
+
+"""Answers report queries from a warm Dataset, reloading it when the schedule file changes."""
+class ReportService:
+
+    def __init__(self, filepath, cache_size=CACHE_SIZE, reload_interval=RELOAD_INTERVAL):
+        self.filepath = Path(filepath)
+        self.reload_interval = reload_interval
+        self.cache = LRUCache(cache_size)
+        self.dataset = Dataset.load(self.filepath)
+        self.reloads = 0
+
+    async def reload_if_changed(self):
+        """Load the schedule again if its file changed, then swap the new Dataset in.
+
+        The file is parsed in a worker thread; a file that cannot be loaded (e.g.
+        while it is being written) leaves the current Dataset in place. Returns
+        True when the Dataset was replaced.
+        """
+        try:
+            if file_version(self.filepath) == self.dataset.version:
+                return False
+            dataset = await asyncio.to_thread(Dataset.load, self.filepath)
+        except (OSError, ValueError, KeyError):
+            return False
+        self.dataset = dataset
+        self.reloads += 1
+        return True
+
+    async def watch(self):
+        """Check the schedule file for changes every reload_interval seconds."""
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            await self.reload_if_changed()
+
+    def duty_body(self, duty_id, threshold=BREAK_THRESHOLD):
+        """Return the encoded JSON report of a duty, from the cache when possible."""
+        dataset = self.dataset
+        key = (dataset.version, duty_id, threshold)
+        body = self.cache.get(key)
+        if body is None:
+            body = json.dumps(duty_json(dataset.duty(duty_id, threshold))).encode()
+            self.cache.put(key, body)
+        return body
+
+    async def report_body(self, threshold=BREAK_THRESHOLD):
+        """Return the encoded JSON full report, computed in a worker thread on a cache miss."""
+        dataset = self.dataset
+        key = (dataset.version, None, threshold)
+        body = self.cache.get(key)
+        if body is None:
+            report = await asyncio.to_thread(dataset.report, dataset.duties, threshold)
+            body = json.dumps([duty_json(duty_data) for duty_data in report]).encode()
+            self.cache.put(key, body)
+        return body
+
+    async def breaks_body(self, start, end, stop_id=None, threshold=BREAK_THRESHOLD):
+        """Return the encoded JSON breaks overlapping [start, end) (at a stop), from the cache when possible."""
+        dataset = self.dataset
+        key = (dataset.version, ('breaks', start, end, stop_id), threshold)
+        body = self.cache.get(key)
+        if body is None:
+            break_index = dataset.break_indexes.get(threshold)
+            if break_index is None:
+                break_index = await asyncio.to_thread(dataset.break_index, threshold)
+            breaks = break_index.on_break(start, end, stop_id)
+            body = json.dumps({'count': len(breaks), 'breaks': [break_json(info) for info in breaks]}).encode()
+            self.cache.put(key, body)
+        return body
+
+    def status_body(self):
+        return json.dumps({
+            'dataset': str(self.filepath),
+            'version': self.dataset.version,
+            'duties': len(self.dataset.duties),
+            'reloads': self.reloads,
+            'cache': {'size': len(self.cache), 'maxsize': self.cache.maxsize,
+                      'hits': self.cache.hits, 'misses': self.cache.misses},
+        }).encode()
+
+    async def respond(self, method, target):
+        """Route a request, returning (status, body)."""
+        if method != 'GET':
+            return 405, json.dumps({'error': f"Method {method} not allowed"}).encode()
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+        try:
+            threshold = int(query['threshold'][0]) if 'threshold' in query else BREAK_THRESHOLD
+        except ValueError:
+            return 400, json.dumps({'error': "threshold must be an integer"}).encode()
+
+        if url.path.startswith('/duties/'):
+            duty_id = unquote(url.path[len('/duties/'):])
+            try:
+                return 200, self.duty_body(duty_id, threshold)
+            except KeyError:
+                return 404, json.dumps({'error': f"Unknown duty {duty_id!r}"}).encode()
+        if url.path == '/report':
+            return 200, await self.report_body(threshold)
+        if url.path == '/breaks':
+            try:
+                start, end = time_to_minutes(query['start'][0]), time_to_minutes(query['end'][0])
+            except (KeyError, ValueError):
+                return 400, json.dumps({'error': "start and end must be times like 0.12:00"}).encode()
+            if start >= end:
+                return 400, json.dumps({'error': "start must be before end"}).encode()
+            stop_id = query['stop'][0] if 'stop' in query else None
+            return 200, await self.breaks_body(start, end, stop_id, threshold)
+        if url.path == '/status':
+            return 200, self.status_body()
+        return 404, json.dumps({'error': f"Unknown path {url.path!r}"}).encode()
+
+    async def handle_connection(self, reader, writer):
+        """Serve the HTTP/1.1 requests of a connection (kept alive unless the client closes it)."""
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                request_line, *header_lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, target, version = request_line.split(' ')
+                except ValueError:
+                    status, body, version = 400, json.dumps({'error': "Malformed request"}).encode(), 'HTTP/1.0'
+                else:
+                    status, body = await self.respond(method, target)
+                headers = {}
+                for line in header_lines:
+                    name, _, value = line.partition(':')
+                    headers[name.strip().lower()] = value.strip().lower()
+                connection = headers.get('connection', 'keep-alive' if version == 'HTTP/1.1' else 'close')
+                writer.write(
+                    f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(body)}\r\n"
+                    f"Connection: {connection}\r\n\r\n".encode() + body
+                )
+                await writer.drain()
+                if connection == 'close':
+                    break
+        finally:
+            writer.close()
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT, unix_path=None):
+        """Start the server and the file watcher; returns the asyncio Server."""
+        if unix_path is not None:
+            server = await asyncio.start_unix_server(self.handle_connection, unix_path, limit=MAX_REQUEST_SIZE)
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_REQUEST_SIZE)
+        self.watcher = asyncio.create_task(self.watch())
+        return server
+
+async def main(filepath, host, port, unix_path, cache_size):
+    service = ReportService(filepath, cache_size)
+    server = await service.serve(host, port, unix_path)
+    address = unix_path or '{}:{}'.format(*server.sockets[0].getsockname()[:2])
+    print(f"Serving {filepath} ({len(service.dataset.duties)} duties) on {address}", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve duty reports from a schedule JSON file.")
+    parser.add_argument('filepath', nargs='?', default=DEFAULT_DATASET, type=Path, help="schedule JSON file")
+    parser.add_argument('--host', default=DEFAULT_HOST, help="address to listen on")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="TCP port to listen on")
+    parser.add_argument('--unix', help="listen on this Unix socket instead of a TCP port")
+    parser.add_argument('--cache-size', type=int, default=CACHE_SIZE, help="number of responses kept in the cache")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(main(args.filepath, args.host, args.port, args.unix, args.cache_size))
+    except KeyboardInterrupt:
+        pass
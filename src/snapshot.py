@@ -0,0 +1,185 @@
+import hashlib
+import json
+import mmap
+import os
+from pathlib import Path
+import numpy as np
+from src.index import DutyEventIndex
+from src.stops import StopRegistry
+from src.streaming import load_schedule
+
+# Bumped whenever the layout or the meaning of the snapshot changes, so older snapshots are rebuilt.
+SNAPSHOT_VERSION = 1
+SNAPSHOT_SUFFIX = '.snapshot'
+MAGIC = b'DUTYSNAP'
+# Arrays start on multiples of this many bytes.
+ALIGNMENT = 64
+# Bytes read at a time when hashing the source file.
+HASH_CHUNK_SIZE = 1 << 20
+
+# The arrays of a snapshot: per-event columns in timeline order, the event offsets
+# of each indexed duty (offsets[i]:offsets[i + 1]), and the positions of the
+# duties of the report among the indexed duties.
+ARRAYS = {
+    'offsets': np.int64,
+    'report_duties': np.int32,
+    'starts': np.int32,
+    'ends': np.int32,
+    'origins': np.int32,
+    'destinations': np.int32,
+}
+
+
+"""Return the path of the snapshot of a schedule file: <schedule file>.snapshot, next to it."""
+def snapshot_path(filepath):
+    filepath = Path(filepath)
+    return filepath.with_name(filepath.name + SNAPSHOT_SUFFIX)
+
+"""Return the blake2b digest of a file's content, as hex."""
+def file_digest(filepath):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(filepath, 'rb') as file:
+        while chunk := file.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+"""A DutyEventIndex over the memory-mapped arrays of a snapshot (see DutyEventIndex.from_timelines).
+
+Nothing is created per event when the snapshot is opened: the EventRecords of
+a duty are only built from its slice of the arrays when the duty is queried.
+Events are stored already resolved and sorted, so they are never sorted again.
+"""
+class SnapshotIndex(DutyEventIndex):
+    pass
+
+"""Write the parsed schedule of `filepath` to its snapshot (see snapshot_path).
+
+The header records the source file's modification time, size and content
+hash, whether the schedule was validated (see src/validation.py), the stop
+IDs in code order with the named stops, and the duty IDs; the event columns, duty offsets and report duties follow as aligned little-endian
+arrays. The file is written under a temporary name and renamed, so readers
+never see half of it.
+"""
+def write_snapshot(filepath, duties, index, validated=False):
+    stops = index.stops
+    duty_ids = index.duty_ids()
+    positions = {duty_id: position for position, duty_id in enumerate(duty_ids)}
+    offsets, starts, ends, origins, destinations = index.timeline_arrays()
+    arrays = {
+        'offsets': offsets,
+        'report_duties': [positions[duty['duty_id']] for duty in duties],
+        'starts': starts,
+        'ends': ends,
+        'origins': origins,
+        'destinations': destinations,
+    }
+    arrays = {name: np.asarray(values, dtype=np.dtype(ARRAYS[name]).newbyteorder('<')) for name, values in arrays.items()}
+
+    stat = os.stat(filepath)
+    header = {
+        'version': SNAPSHOT_VERSION,
+        'source': {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'hash': file_digest(filepath)},
+        'validated': validated,
+        'stop_ids': [stops.stop_id(code) for code in range(len(stops))],
+        'stops': list(stops),
+        'duty_ids': duty_ids,
+        'arrays': {},
+    }
+    # The array offsets depend on the header length, which depends on the offsets:
+    # lay the arrays out after a header padded to ALIGNMENT, growing it until it fits.
+    header_size = ALIGNMENT
+    while True:
+        offset = header_size
+        for name, array in arrays.items():
+            header['arrays'][name] = [offset, len(array)]
+            offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+        encoded = json.dumps(header).encode()
+        if len(MAGIC) + 8 + len(encoded) <= header_size:
+            break
+        header_size = -(-(len(MAGIC) + 8 + len(encoded)) // ALIGNMENT) * ALIGNMENT
+
+    path = snapshot_path(filepath)
+    temp_path = path.with_name(path.name + '.tmp')
+    with open(temp_path, 'wb') as file:
+        file.write(MAGIC + len(encoded).to_bytes(8, 'little') + encoded)
+        for name, array in arrays.items():
+            file.seek(header['arrays'][name][0])
+            file.write(array.tobytes())
+        file.truncate(offset)
+    os.replace(temp_path, path)
+    return path
+
+"""Open the snapshot of `filepath` if it is valid, memory-mapping its arrays.
+
+A snapshot is valid when it has the current SNAPSHOT_VERSION and the source
+file has the recorded size and either the recorded modification time or, if
+it was only touched, the recorded content hash. With `validate`, a snapshot
+written without validating the schedule is not valid either.
+
+Returns (duties, stops, index) like streaming.stream_report_inputs, with a
+SnapshotIndex, or None when there is no valid snapshot.
+"""
+def read_snapshot(filepath, validate=False):
+    try:
+        stat = os.stat(filepath)
+        with open(snapshot_path(filepath), 'rb') as file:
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    try:
+        if buffer[:len(MAGIC)] != MAGIC:
+            return None
+        header_length = int.from_bytes(buffer[len(MAGIC):len(MAGIC) + 8], 'little')
+        header = json.loads(buffer[len(MAGIC) + 8:len(MAGIC) + 8 + header_length])
+        source = header['source']
+        if header['version'] != SNAPSHOT_VERSION or source['size'] != stat.st_size:
+            return None
+        if validate and not header.get('validated'):
+            return None
+        if source['mtime_ns'] != stat.st_mtime_ns and source['hash'] != file_digest(filepath):
+            return None
+        arrays = {
+            name: np.frombuffer(buffer, dtype=np.dtype(dtype).newbyteorder('<'), count=header['arrays'][name][1],
+                                offset=header['arrays'][name][0])
+            for name, dtype in ARRAYS.items()
+        }
+    except (ValueError, KeyError, TypeError):
+        return None
+
+    # Intern every stop ID first so the codes are the ones the events were stored with.
+    stops = StopRegistry()
+    for stop_id in header['stop_ids']:
+        stops.intern(stop_id)
+    stops.update(header['stops'])
+    duty_ids = header['duty_ids']
+    index = SnapshotIndex.from_timelines(duty_ids, arrays['offsets'], arrays['starts'], arrays['ends'],
+                                         arrays['origins'], arrays['destinations'], stops)
+    duties = [{'duty_id': duty_ids[position]} for position in arrays['report_duties'].tolist()]
+    return duties, stops, index
+
+"""Load the inputs of the report steps from the snapshot of a schedule file, building it if needed.
+
+When the snapshot is missing or stale, the schedule is loaded with
+load_schedule (see src/streaming.py) and its duty timelines indexed,
+and the snapshot is written for the next run (a snapshot that cannot be
+written is skipped). With `validate`, the schedule is checked with
+validate_schedule (see src/validation.py) before the snapshot is built, and
+the snapshot records it; a snapshot written without validation is rebuilt,
+and the schedule validated, the next time `validate` is set. Raises ValueError when the
+file cannot be loaded, ScheduleValidationError when it is not valid.
+
+Returns (duties, stops, index), ready for the steps with vehicles=None.
+"""
+def load_schedule_snapshot(filepath, validate=False):
+    inputs = read_snapshot(filepath, validate)
+    if inputs is not None:
+        return inputs
+
+    json_data = load_schedule(filepath, validate)
+    stops = StopRegistry(json_data['stops'])
+    index = DutyEventIndex(json_data['vehicles'], json_data['duties'], stops)
+    try:
+        write_snapshot(filepath, json_data['duties'], index, validate)
+    except OSError:
+        pass
+    return json_data['duties'], stops, index
@@ -1,46 +1,54 @@
-from src.utils import calculate_breaks, time_to_minutes, find_stop_name_by_id, compare_times
+from src.index import DutyEventIndex
+from src.stops import as_stop_registry
+from src.utils import BREAK_THRESHOLD, calculate_breaks_columns
+from src.vectorized import generate_breaks_info_vectorized
 
+ENGINES = ('python', 'pandas')
 
-"""Generates start and end times for each duty by looking at all vehicle events.
 
-For each duty, finds the earliest start time and latest end time from events with a matching duty ID.
-Returns a list of dicts with duty ID, start time, and end time for each duty.
+"""Generates start and end times for each duty from its timeline.
+
+For each duty, finds the earliest start time and latest end time of its timeline, along with the
+IDs of its first and last stops, in one pass (see DutyEventIndex.summary). The timeline comes from
+the duty events of the duty (vehicle events, taxi and sign_on segments), or from the vehicle events
+with a matching duty ID when the duty lists none. The timelines are looked up in a DutyEventIndex,
+which is built from the vehicles and duties when none is given.
+Returns a list of dicts with duty ID, start time, end time and first/last stop IDs for each duty.
+Times are in total minutes (None when not found) and are formatted on export.
 """
-def generate_start_end_times(duties, vehicles):
+def generate_start_end_times(duties, vehicles, index=None):
+    if index is None:
+        index = DutyEventIndex(vehicles, duties)
+
+    stops = index.stops
     start_end_times = []
     for duty in duties:
         duty_id = duty['duty_id']
-        earliest_start, latest_end = "23.59:59", "0.00:00"
-
-        for vehicle in vehicles:
-            for event in vehicle['vehicle_events']:
-                if event.get('duty_id') == duty_id:
-                    if 'start_time' in event:
-                        if compare_times(event['start_time'], earliest_start) or earliest_start == "23.59:59":
-                            earliest_start = event['start_time']
-                    if 'end_time' in event:
-                        if compare_times(latest_end, event['end_time']) or latest_end == "0.00:00":
-                            latest_end = event['end_time']
+        earliest_start, latest_end, first_stop, last_stop = index.summary(duty_id)
 
         start_end_times.append({
             'Duty ID': duty_id,
-            'Start Time': earliest_start if earliest_start != "23.59:59" else "No Start Time Found",
-            'End Time': latest_end if latest_end != "0.00:00" else "No End Time Found",
+            'Start Time': earliest_start,
+            'End Time': latest_end,
+            'First Stop ID': None if first_stop is None else stops.stop_id(first_stop),
+            'Last Stop ID': None if last_stop is None else stops.stop_id(last_stop),
         })
     return start_end_times
 
 """Generates stop names for each duty by looking up the stop IDs.
 
-For each duty, finds the stop name corresponding to the first and last stop IDs.
+For each duty, finds the stop name corresponding to the first and last stop IDs found in step 1.
+`stops` is a StopRegistry or a list of stop dicts, which is turned into one so every lookup is O(1).
 Returns the updated start/end times list with stop names added.
 """
 def generate_stop_names(start_end_times, stops):
+    stops = as_stop_registry(stops)
     for duty_data in start_end_times:
         first_stop_id = duty_data.get('First Stop ID')
         last_stop_id = duty_data.get('Last Stop ID')
         
-        first_stop_name = find_stop_name_by_id(first_stop_id, stops) if first_stop_id else "Unknown Stop"
-        last_stop_name = find_stop_name_by_id(last_stop_id, stops) if last_stop_id else "Unknown Stop"
+        first_stop_name = stops.name(first_stop_id) if first_stop_id else "Unknown Stop"
+        last_stop_name = stops.name(last_stop_id) if last_stop_id else "Unknown Stop"
         
         duty_data['First Stop'] = first_stop_name
         duty_data['Last Stop'] = last_stop_name
@@ -48,18 +56,31 @@ def generate_stop_names(start_end_times, stops):
 
 """Generates break details for each duty.
 
-For each duty, finds the vehicle events matching the duty ID, sorts them, calculates the breaks between the events, and adds the break details to the duty data.
+For each duty, takes the timed events of the duty timeline from the DutyEventIndex (already sorted by start time,
+and read as columns for many duties at once, see DutyEventIndex.iter_timed_columns), calculates the breaks between
+the events (see calculate_breaks_columns), and adds the break details to the duty data.
+The index is built from the vehicles when none is given. Break stops are named through the
+StopRegistry of the index, which `stops` (a StopRegistry or a list of stop dicts) is added to.
+
+With engine='pandas' the breaks of all duties are found at once by the vectorised engine in
+src/vectorized.py, which gives the same breaks. Gaps longer than `threshold` minutes are breaks,
+unless BreakRules (see src/breaks.py) are given as `rules`.
 
 Returns the updated start/end times list with break details added for each duty.
 """
-def generate_breaks_info(start_end_with_stop_names, vehicles, stops):
-    for duty_data in start_end_with_stop_names:
-        duty_id = duty_data['Duty ID']
-        vehicle_events = [
-            event for vehicle in vehicles for event in vehicle['vehicle_events']
-            if event.get('duty_id') == duty_id and 'start_time' in event and 'end_time' in event
-        ]
-        vehicle_events_sorted = sorted(vehicle_events, key=lambda x: time_to_minutes(x['start_time']))
-        breaks = calculate_breaks(vehicle_events_sorted, stops)
-        duty_data['Breaks'] = breaks
+def generate_breaks_info(start_end_with_stop_names, vehicles, stops, index=None, engine='python',
+                         threshold=BREAK_THRESHOLD, rules=None):
+    if engine == 'pandas':
+        return generate_breaks_info_vectorized(start_end_with_stop_names, vehicles, stops, index, threshold, rules)
+    if engine != 'python':
+        raise ValueError(f"Unknown engine {engine!r}, expected one of {ENGINES}")
+
+    if index is None:
+        index = DutyEventIndex(vehicles, stops=stops)
+    elif stops is not index.stops:
+        index.stops.update(stops)
+
+    duty_ids = [duty_data['Duty ID'] for duty_data in start_end_with_stop_names]
+    for duty_data, columns in zip(start_end_with_stop_names, index.iter_timed_columns(duty_ids)):
+        duty_data['Breaks'] = calculate_breaks_columns(*columns, index.stops, threshold, rules)
     return start_end_with_stop_names
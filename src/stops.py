@@ -0,0 +1,99 @@
+UNKNOWN_STOP = "Unknown Stop"
+
+
+"""Hashed stop lookup table, built once from json_data['stops'].
+
+Every stop ID is interned to a small integer code (its position in the table),
+so event records can refer to stops by code instead of by string. Names,
+depot flags and coordinates are looked up in O(1) by stop ID or by code.
+
+Stop IDs that are not part of the stops list can still be interned (e.g. a
+destination referenced by an event); they have no name and report as
+"Unknown Stop".
+"""
+class StopRegistry:
+
+    def __init__(self, stops=()):
+        self._codes = {}
+        self._stop_ids = []
+        self._names = []
+        self._depots = []
+        self._coordinates = []
+        self.update(stops)
+
+    def update(self, stops):
+        """Add or replace the given stop dicts (or the stops of another registry)."""
+        for stop in stops:
+            code = self.intern(stop['stop_id'])
+            self._names[code] = stop.get('stop_name')
+            self._depots[code] = bool(stop.get('is_depot', False))
+            if stop.get('latitude') is not None and stop.get('longitude') is not None:
+                self._coordinates[code] = (stop['latitude'], stop['longitude'])
+
+    def intern(self, stop_id):
+        """Return the code of a stop ID, registering it if needed. None stays None."""
+        if stop_id is None:
+            return None
+        code = self._codes.get(stop_id)
+        if code is None:
+            code = self._codes[stop_id] = len(self._stop_ids)
+            self._stop_ids.append(stop_id)
+            self._names.append(None)
+            self._depots.append(False)
+            self._coordinates.append(None)
+        return code
+
+    def code(self, stop_id):
+        """Return the code of a stop ID without registering it, or None if unknown."""
+        return self._codes.get(stop_id)
+
+    def stop_id(self, code):
+        return self._stop_ids[code]
+
+    def name(self, stop_id):
+        """Return the name of the stop with the given ID, or "Unknown Stop"."""
+        return self.name_of(self._codes.get(stop_id))
+
+    def name_of(self, code):
+        """Return the name of the stop with the given code, or "Unknown Stop"."""
+        if code is None or self._names[code] is None:
+            return UNKNOWN_STOP
+        return self._names[code]
+
+    def is_depot(self, stop_id):
+        code = self._codes.get(stop_id)
+        return code is not None and self._depots[code]
+
+    def is_depot_code(self, code):
+        return code is not None and self._depots[code]
+
+    def coordinates(self, stop_id):
+        """Return the (latitude, longitude) of a stop, or None if unknown."""
+        code = self._codes.get(stop_id)
+        return self._coordinates[code] if code is not None else None
+
+    def names(self):
+        """Return the stop names indexed by code, "Unknown Stop" for stops without one."""
+        return [name if name is not None else UNKNOWN_STOP for name in self._names]
+
+    def __contains__(self, stop_id):
+        return stop_id in self._codes
+
+    def __len__(self):
+        return len(self._stop_ids)
+
+    def __iter__(self):
+        """Yield the named stops back as stop dicts."""
+        for code, stop_id in enumerate(self._stop_ids):
+            if self._names[code] is None:
+                continue
+            stop = {'stop_id': stop_id, 'stop_name': self._names[code], 'is_depot': self._depots[code]}
+            if self._coordinates[code] is not None:
+                stop['latitude'], stop['longitude'] = self._coordinates[code]
+            yield stop
+
+"""Return `stops` as a StopRegistry, building one if it is a list of stop dicts."""
+def as_stop_registry(stops):
+    if isinstance(stops, StopRegistry):
+        return stops
+    return StopRegistry(stops or ())
@@ -0,0 +1,235 @@
+import json
+import sys
+from src.index import DutyEventIndex, TripIndex, resolve_service_trips
+from src.stops import StopRegistry
+from src.utils import load_json_data
+from src.validation import ScheduleValidationError, ScheduleValidator, validate_schedule
+
+CHUNK_SIZE = 1 << 20
+SECTIONS = ('stops', 'trips', 'vehicles', 'duties')
+
+# Fields the report steps and analytics read (stop coordinates place the stops
+# in depot areas). Everything else (route numbers, duty event sequence
+# numbers...) is dropped while streaming.
+REPORT_FIELDS = {
+    'stops': ('stop_id', 'stop_name', 'is_depot', 'latitude', 'longitude'),
+    'trips': ('trip_id', 'origin_stop_id', 'destination_stop_id', 'departure_time', 'arrival_time'),
+    'sub_trips': ('departure_time', 'arrival_time', 'sub_trip_index'),
+    'vehicles': ('vehicle_id',),
+    'vehicle_events': ('vehicle_event_sequence', 'vehicle_event_type', 'start_time', 'end_time', 'origin_stop_id',
+                       'destination_stop_id', 'duty_id', 'trip_id', 'sub_trip_index'),
+    'duties': ('duty_id',),
+    'duty_events': ('duty_event_type', 'vehicle_id', 'vehicle_event_sequence', 'start_time', 'end_time',
+                    'origin_stop_id', 'destination_stop_id'),
+}
+
+# Fields whose values repeat across many records and are worth interning.
+INTERNED_FIELDS = {'stop_id', 'origin_stop_id', 'destination_stop_id', 'duty_id', 'vehicle_id',
+                   'vehicle_event_type', 'duty_event_type', 'start_time', 'end_time', 'departure_time', 'arrival_time'}
+
+
+"""Reads JSON values one at a time from a file opened in text mode.
+
+Keeps a buffer of at most one chunk plus the value being decoded, so the
+memory used does not depend on the size of the file.
+"""
+class _JsonReader:
+
+    def __init__(self, file, chunk_size=CHUNK_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        chunk = self.file.read(self.chunk_size)
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        self.eof = not chunk
+
+    def peek(self):
+        """Return the next non-whitespace character without consuming it, or '' at the end of the file."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\n\r':
+                self.pos += 1
+            if self.pos < len(self.buffer) or self.eof:
+                return self.buffer[self.pos:self.pos + 1]
+            self._fill()
+
+    def expect(self, chars):
+        """Consume the next character, which must be one of `chars`, and return it."""
+        char = self.peek()
+        if not char or char not in chars:
+            raise json.JSONDecodeError(f"Expected one of {chars!r}", self.buffer, self.pos)
+        self.pos += 1
+        return char
+
+    def decode(self):
+        """Decode and consume the next complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                self._fill()
+                continue
+            # A value that runs up to the end of the buffer (e.g. a number) may continue in the next chunk.
+            if end == len(self.buffer) and not self.eof:
+                self._fill()
+                continue
+            self.pos = end
+            return value
+
+    def iter_array(self):
+        """Consume a JSON array, yielding its items one at a time."""
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.decode()
+            if self.expect(',]') == ']':
+                return
+
+"""Keep only the report fields of a record, interning the repeated strings."""
+def _compact(record, fields):
+    compact = {}
+    for field in fields:
+        if field in record:
+            value = record[field]
+            compact[field] = sys.intern(value) if field in INTERNED_FIELDS and isinstance(value, str) else value
+    return compact
+
+"""Reduce a record of the given section to the fields the report steps need."""
+def compact_record(section, record):
+    compact = _compact(record, REPORT_FIELDS[section])
+    if section == 'trips' and 'sub_trips' in record:
+        compact['sub_trips'] = [_compact(sub_trip, REPORT_FIELDS['sub_trips']) for sub_trip in record['sub_trips']]
+    elif section == 'vehicles':
+        compact['vehicle_events'] = [_compact(event, REPORT_FIELDS['vehicle_events']) for event in record['vehicle_events']]
+    elif section == 'duties' and 'duty_events' in record:
+        compact['duty_events'] = [_compact(event, REPORT_FIELDS['duty_events']) for event in record['duty_events']]
+    return compact
+
+"""Stream the records of a schedule file section by section.
+
+Reads the top-level object incrementally and yields (section, record) pairs for
+every item of the requested sections, in file order. Other top-level keys are
+skipped item by item. With compact=True (the default) each record is reduced
+to the fields the report steps read.
+
+Raises FileNotFoundError or json.JSONDecodeError for missing or invalid files.
+"""
+def iter_schedule(filepath, sections=SECTIONS, compact=True, chunk_size=CHUNK_SIZE):
+    with open(filepath, 'r') as file:
+        reader = _JsonReader(file, chunk_size)
+        reader.expect('{')
+        if reader.peek() == '}':
+            return
+        while True:
+            section = reader.decode()
+            reader.expect(':')
+            if reader.peek() == '[':
+                for record in reader.iter_array():
+                    if section in sections:
+                        yield section, compact_record(section, record) if compact else record
+            else:
+                reader.decode()
+            if reader.expect(',}') == '}':
+                return
+
+"""Load a schedule file into the same dict shape as load_json_data, keeping only the report fields.
+
+Records are streamed and compacted one at a time, so the full document is never
+held in memory.
+"""
+def load_json_stream(filepath):
+    json_data = {section: [] for section in SECTIONS}
+    for section, record in iter_schedule(filepath):
+        json_data[section].append(record)
+    return json_data
+
+"""Load a whole schedule file with load_json_data and resolve its service trips.
+
+The counterpart of stream_report_inputs for the loaders that need the whole
+document. With `validate`, the schedule is checked and normalised first (see
+src/validation.py). Raises ValueError when the file cannot be loaded, and
+ScheduleValidationError when it is not valid.
+
+Returns the schedule dict, its service trip events filled in from the trips.
+"""
+def load_schedule(filepath, validate=True):
+    json_data = load_json_data(filepath)
+    if json_data is None:
+        raise ValueError(f"Could not load the schedule {filepath}")
+    if validate:
+        issues = validate_schedule(json_data)
+        if issues:
+            raise ScheduleValidationError(issues)
+    resolve_service_trips(json_data['vehicles'], TripIndex(json_data['trips']))
+    return json_data
+
+"""Build the inputs of the report steps straight from a schedule file.
+
+Stops go into a StopRegistry and duties into a list of their IDs, each also
+added to the DutyEventIndex for its duty events; trips go straight into
+a TripIndex, and each vehicle is resolved against it and added to a
+DutyEventIndex as soon as it is read, so neither the document nor the trips
+or vehicles lists are ever built, and the TripIndex is dropped once the
+vehicles have been read. Vehicles that come before the trips section are resolved
+once the trips have been read.
+
+With `validate`, every record is checked and normalised by a ScheduleValidator
+(see src/validation.py) before it is compacted, so fields the steps do not
+read (duty event sequences, coordinates) are checked too, and
+ScheduleValidationError is raised at the end of the file if any problem was
+found.
+
+Returns (duties, stops, index), ready for the steps with vehicles=None; stops
+is the StopRegistry of the index.
+"""
+def stream_report_inputs(filepath, validate=False):
+    duties = []
+    trip_index = TripIndex()
+    pending_vehicles = []
+    stops = StopRegistry()
+    index = DutyEventIndex(stops=stops)
+    validator = ScheduleValidator() if validate else None
+    current_section = None
+    for section, record in iter_schedule(filepath, compact=validator is None):
+        if section != current_section:
+            if current_section == 'vehicles' and not pending_vehicles:
+                # Every vehicle is resolved: the trips are not needed any more.
+                trip_index = TripIndex()
+            current_section = section
+        if validator is not None:
+            validator.add(section, record)
+            if validator.issues:
+                # The schedule will be rejected: only check the rest of it.
+                continue
+            record = compact_record(section, record)
+        if section == 'stops':
+            stops.update([record])
+        elif section == 'trips':
+            trip_index.add(record)
+        elif section == 'vehicles':
+            if not len(trip_index):
+                pending_vehicles.append(record)
+            else:
+                resolve_service_trips([record], trip_index)
+                index.add_vehicle(record)
+        elif section == 'duties':
+            # The index keeps what it needs of the duty events; the steps only read the duty ID.
+            duties.append({'duty_id': record['duty_id']})
+            index.add_duty(record)
+    if pending_vehicles:
+        resolve_service_trips(pending_vehicles, trip_index)
+        for vehicle in pending_vehicles:
+            index.add_vehicle(vehicle)
+    if validator is not None and validator.finish():
+        raise ScheduleValidationError(validator.issues)
+    return duties, stops, index
@@ -1,5 +1,10 @@
 import json
+import numpy as np
 import pandas as pd
+from src.stops import StopRegistry, as_stop_registry
+
+# Gaps between two events longer than this many minutes are breaks.
+BREAK_THRESHOLD = 15
 
 """Load JSON data from a file.
 
@@ -48,17 +53,57 @@ def format_time(minutes):
     minutes = remaining_minutes % 60
     return f"{days}.{hours:02d}:{minutes:02d}"
 
+"""Convert a whole column of time strings to total minutes at once.
+
+The distinct time strings are found with a hashed factorize and each of them is
+parsed a single time, which is much faster than parsing every entry when the
+same times repeat, as they do throughout a schedule.
+
+Args:
+  time_strs: A sequence of time strings in 'day.offset.hours:minutes' format.
+
+Returns:
+  numpy.ndarray: The total minutes of each time string, as int64.
+"""
+def times_to_minutes(time_strs):
+    codes, uniques = pd.factorize(np.asarray(time_strs, dtype=object))
+    minutes = np.fromiter((time_to_minutes(time_str) for time_str in uniques), dtype=np.int64, count=len(uniques))
+    return minutes[codes]
+
+"""Convert a whole column of total minutes back into 'day.offset.hours:minutes' strings.
+
+Each distinct value is formatted once. Missing values (None or NaN) become `missing`
+and strings are kept as they are.
+
+Args:
+  minutes: A sequence of total minutes.
+  missing: The value to use for missing entries.
+
+Returns:
+  list: The formatted time strings.
+"""
+def format_times(minutes, missing=None):
+    codes, uniques = pd.factorize(np.asarray(minutes, dtype=object))
+    labels = [value if isinstance(value, str) else format_time(int(value)) for value in uniques]
+    labels.append(missing)
+    return [labels[code] for code in codes]
+
 """
 Return the stop name given a stop ID by searching through a list of stops.
 
+A StopRegistry can be given instead of the list, in which case the name is
+looked up in O(1) instead of scanning the stops.
+
 Args:
   stop_id: The ID of the stop to search for.
-  stops: The list of stops to search through.
+  stops: The list of stops to search through, or a StopRegistry.
 
 Returns:
   The name of the stop with the given ID if found, otherwise 'Unknown Stop'.
 """
 def find_stop_name_by_id(stop_id, stops):
+    if isinstance(stops, StopRegistry):
+        return stops.name(stop_id)
     for stop in stops:
         if stop['stop_id'] == stop_id:
             return stop['stop_name']
@@ -79,30 +124,67 @@ Calculates all breaks longer than 15 minutes from a list of vehicle events.
 Breaks are found by looking at the duration between the end time of one event 
 and the start time of the next event. If the duration is over 15 minutes, it is 
 considered a break. Information about each break is collected into a dictionary 
-and the list of break dictionaries is returned.
+and the list of break dictionaries is returned. Break start times are kept in 
+total minutes and only formatted when the report is exported.
 
 Args:
-  vehicle_events: List of vehicle event dicts with start_time and end_time keys. 
-  stops: List of stop dicts with stop_id and stop_name keys.
+  vehicle_events: List of event records (see src.index.EventRecord) with start, end 
+    and destination, sorted by start time. Stops are referenced by their code in `stops`.
+  stops: The StopRegistry the events were interned with (a list of stop dicts with 
+    stop_id and stop_name keys is turned into one).
+  threshold: Gaps longer than this many minutes are breaks (BREAK_THRESHOLD by default).
+  rules: Optional BreakRules (see src.breaks) deciding which gaps are breaks instead of
+    the threshold; each break then also has the break_type and paid of its rule.
 
 Returns: 
   list: List of dicts containing info about each detected break.
 """
-def calculate_breaks(vehicle_events, stops):
+def calculate_breaks(vehicle_events, stops, threshold=BREAK_THRESHOLD, rules=None):
+    return calculate_breaks_columns([event.start for event in vehicle_events], [event.end for event in vehicle_events],
+                                    [event.destination for event in vehicle_events], stops, threshold, rules)
+
+"""calculate_breaks over the events of a duty given as columns.
+
+starts, ends and destinations are lists with the start time, end time and
+destination stop code (None when none) of each event, sorted by start time.
+
+The python engine of steps.generate_breaks_info reads the timelines of the
+DutyEventIndex this way, without building an EventRecord per event.
+"""
+def calculate_breaks_columns(starts, ends, destinations, stops, threshold=BREAK_THRESHOLD, rules=None):
+    stops = as_stop_registry(stops)
     breaks = []
-    for i in range(len(vehicle_events) - 1):
-        end_current_event = time_to_minutes(vehicle_events[i]['end_time'])
-        start_next_event = time_to_minutes(vehicle_events[i + 1]['start_time'])
-        duration = start_next_event - end_current_event
-        if duration > 15:  # Breaks longer than 15 minutes
-            break_info = {
-                'break_start_time': format_time(end_current_event),
-                'break_duration': duration,
-                'break_stop_name': find_stop_name_by_id(vehicle_events[i]['destination_stop_id'], stops)
-            }
-            breaks.append(break_info)
+    # (end of an event, start of the next one, destination of the event) for each gap.
+    gaps = zip(ends, starts[1:], destinations)
+    if rules is not None:
+        classify = rules.classifier(stops)
+        for end, next_start, destination in gaps:
+            duration = next_start - end
+            rule = classify(duration, destination)
+            if rule is not None:
+                breaks.append(_break_info(end, duration, destination, stops, rule))
+        return breaks
+    for end, next_start, destination in gaps:
+        duration = next_start - end
+        if duration > threshold:  # Breaks longer than 15 minutes by default
+            breaks.append(_break_info(end, duration, destination, stops))
     return breaks
 
+"""Build the dict of a break of `duration` minutes from `start` at stop code `destination`.
+
+With a BreakRule, the dict also has the break_type and paid of the rule.
+"""
+def _break_info(start, duration, destination, stops, rule=None):
+    break_info = {
+        'break_start_time': start,
+        'break_duration': duration,
+        'break_stop_name': stops.name_of(destination)
+    }
+    if rule is not None:
+        break_info['break_type'] = rule.name
+        break_info['paid'] = rule.paid
+    return break_info
+
 """Exports the given report data to an Excel file.
 
 The data structure and columns exported depends on the provided 
@@ -114,6 +196,9 @@ step number:
 
 3. Exports duty info along with a separate row for each break.
 
+Times given in total minutes are formatted here, column by column; missing
+start and end times are written as "No Start Time Found" / "No End Time Found".
+
 Handles errors writing the Excel file.
 """
 def export_to_excel(data, filename, step):
@@ -155,10 +240,17 @@ def export_to_excel(data, filename, step):
                     'Break Stop Name': None
                 })
         df = pd.DataFrame(rows)
+        if not df.empty:
+            df['Break Start Time'] = format_times(df['Break Start Time'])
     
     else:
         print("Invalid step number. Please enter a number between 1 and 3.")
-    
+        return
+
+    if not df.empty:
+        df['Start Time'] = format_times(df['Start Time'], "No Start Time Found")
+        df['End Time'] = format_times(df['End Time'], "No End Time Found")
+
     # Write the DataFrame to an Excel file.
     try:
         df.to_excel(f"{filename}.xlsx", index=False)
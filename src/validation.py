@@ -0,0 +1,534 @@
+import re
+from array import array
+from src.index import vehicle_event_key
+from src.utils import format_time
+
+"""
+Validation and normalisation of a schedule, in one pass at load time.
+
+ScheduleValidator takes the records of a schedule one at a time, section by
+section (stops, trips, vehicles, duties), so it works on a loaded document as
+well as on the records streamed from a file. It checks:
+
+- the shape of every record: required fields, duplicate IDs and sequence numbers;
+- time formats: 'day.HH:MM', with hours under 24 and minutes under 60, and
+  end times that are not before their start times;
+- sequence ordering: the events of a vehicle or a duty are listed in sequence
+  order and none starts before the previous one ends (service trips take the
+  times of their trip);
+- referential integrity: duty events refer to vehicle events, service trips
+  to trips and every stop ID to a stop.
+
+Every problem is collected as a ValidationIssue with its location in the
+document (e.g. vehicles[3].vehicle_events[5].start_time) instead of stopping
+at the first one. References to records that come later in the file are
+checked at the end.
+
+Records are normalised in place as they go by: times are rewritten in the
+canonical 'day.HH:MM' form the exporters write (so '0.7:05' becomes '0.07:05')
+and the vehicle_event_sequence of duty events becomes a string like in the
+vehicle events. Each distinct time string is parsed once.
+
+validate_schedule checks a whole document; load_schedule in src/streaming.py
+runs it on every whole-document load and raises ScheduleValidationError before
+any step runs.
+"""
+
+SECTIONS = ('stops', 'trips', 'vehicles', 'duties')
+TIME_PATTERN = re.compile(r'(\d+)\.(\d{1,2}):(\d{2})')
+# Issues listed in the message of a ScheduleValidationError.
+MAX_REPORTED = 20
+# Times are stored as int32 minutes (see src/index.py), so later ones are invalid.
+MAX_MINUTES = 2**31 - 1
+# Stands for a missing time in packed (start, end) minutes, see _pack_times.
+NO_MINUTES = 0xFFFFFFFF
+
+
+"""A problem found in a schedule, at a location like vehicles[3].vehicle_events[5].start_time."""
+class ValidationIssue:
+    __slots__ = ('location', 'message')
+
+    def __init__(self, location, message):
+        self.location = location
+        self.message = message
+
+    def __eq__(self, other):
+        if not isinstance(other, ValidationIssue):
+            return NotImplemented
+        return (self.location, self.message) == (other.location, other.message)
+
+    def __repr__(self):
+        return f"ValidationIssue({self.location!r}, {self.message!r})"
+
+    def __str__(self):
+        return f"{self.location}: {self.message}"
+
+"""Raised when a schedule fails validation; `issues` holds every ValidationIssue found."""
+class ScheduleValidationError(ValueError):
+
+    def __init__(self, issues):
+        self.issues = list(issues)
+        lines = [f"{len(self.issues)} problem(s) in the schedule:"]
+        lines.extend(f"  {issue}" for issue in self.issues[:MAX_REPORTED])
+        if len(self.issues) > MAX_REPORTED:
+            lines.append(f"  ... and {len(self.issues) - MAX_REPORTED} more")
+        super().__init__('\n'.join(lines))
+
+"""Format a location from its path, e.g. ('vehicles', 3, 'start_time') as 'vehicles[3].start_time'."""
+def format_location(path):
+    location = ''
+    for part in path:
+        location += f"[{part}]" if isinstance(part, int) else (f".{part}" if location else part)
+    return location
+
+"""Parse a time string; returns (minutes, canonical form), or None when it is not a valid 'day.HH:MM' time."""
+def _parse_time(value):
+    match = TIME_PATTERN.fullmatch(value)
+    if match is None:
+        return None
+    day, hours, minutes = (int(group) for group in match.groups())
+    total = day * 24 * 60 + hours * 60 + minutes
+    if hours >= 24 or minutes >= 60 or total > MAX_MINUTES:
+        return None
+    canonical = format_time(total)
+    return total, value if canonical == value else canonical
+
+def _sequence_number(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+"""Pack the (start, end) minutes of a record into one int, a missing time as NO_MINUTES."""
+def _pack_times(start, end):
+    return (NO_MINUTES if start is None else start) << 32 | (NO_MINUTES if end is None else end)
+
+"""Unpack the (start, end) minutes of _pack_times, a missing time as None."""
+def _unpack_times(times):
+    start, end = times >> 32, times & NO_MINUTES
+    return None if start == NO_MINUTES else start, None if end == NO_MINUTES else end
+
+"""The (start, end) minutes of the vehicle events, by vehicle_event_key, for the duty events to refer to.
+
+Vehicles nearly always number their events '0', '1', '2'..., so each vehicle
+keeps one run (first number, first position, count) into a single array of
+packed times (see _pack_times) instead of a dict entry per event. Any other
+sequence, and an event repeating a key, goes to a dict, which is looked up first.
+"""
+class _VehicleEventTimes:
+
+    def __init__(self):
+        self._runs = {}
+        self._times = array('Q')
+        self._other = {}
+
+    def _position(self, vehicle_id, sequence):
+        """Return the position of an event in the runs, or None."""
+        run = self._runs.get(vehicle_id)
+        if run is None or not sequence.isdigit():
+            return None
+        first, position, count = run
+        number = int(sequence)
+        if first <= number < first + count and str(number) == sequence:
+            return position + number - first
+        return None
+
+    def __contains__(self, key):
+        return key in self._other or self._position(*key) is not None
+
+    def get(self, key):
+        """Return the (start, end) minutes of a vehicle event, or None when unknown."""
+        times = self._other.get(key)
+        if times is None:
+            position = self._position(*key)
+            if position is None:
+                return None
+            times = self._times[position]
+        return _unpack_times(times)
+
+    def add(self, key, start, end):
+        vehicle_id, sequence = key
+        run = self._runs.get(vehicle_id)
+        times = self._times
+        if run is not None and run[1] + run[2] == len(times) and sequence == str(run[0] + run[2]):
+            run[2] += 1
+        elif run is None and sequence.isdigit() and str(int(sequence)) == sequence:
+            self._runs[vehicle_id] = [int(sequence), len(times), 1]
+        else:
+            self._other[key] = _pack_times(start, end)
+            return
+        times.append(_pack_times(start, end))
+
+"""Raised in the fast paths of ScheduleValidator when a record needs the thorough checks."""
+class _Recheck(Exception):
+    pass
+
+# Errors a fast path may run into on a malformed record, which is then re-checked thoroughly.
+_RECHECK = (_Recheck, KeyError, TypeError, ValueError, AttributeError)
+
+"""Checks and normalises the records of a schedule, one at a time; see the module docstring.
+
+add(section, record) takes the records in file order and finish() returns
+the issues once every record was added. Records and events that pass every
+check, as nearly all do, go through an inlined fast path; anything else (a
+missing field, a time not seen before, an unknown reference...) is re-checked
+field by field, which records the issues with their locations.
+fast_path=False checks every record field by field; it finds the same issues,
+and benchmarks/bench_validation.py measures what the fast path saves.
+"""
+class ScheduleValidator:
+
+    def __init__(self, fast_path=True):
+        self.issues = []
+        self._positions = dict.fromkeys(SECTIONS, 0)
+        # Canonical time strings seen so far -> minutes.
+        self._minutes = {}
+        self._stop_ids = set()
+        # trip_id or (trip_id, sub_trip_index) -> packed (start, end) minutes, see _pack_times.
+        self._trip_times = {}
+        self._vehicle_ids = set()
+        self._duty_ids = set()
+        self._vehicle_events = _VehicleEventTimes()
+        # References to records not seen yet: (path, kind, key), checked by finish().
+        self._deferred = []
+        if fast_path:
+            self._checks = {'stops': self._add_stop, 'trips': self._add_trip, 'vehicles': self._add_vehicle,
+                            'duties': self._add_duty}
+        else:
+            self._checks = {'stops': self._add_stop, 'trips': self._check_trip, 'vehicles': self._check_vehicle,
+                            'duties': self._check_duty}
+
+    def _issue(self, path, message):
+        self.issues.append(ValidationIssue(format_location(path), message))
+
+    def add(self, section, record):
+        """Check and normalise the next record of a section."""
+        position = self._positions[section]
+        self._positions[section] += 1
+        path = (section, position)
+        if not isinstance(record, dict):
+            self._issue(path, f"expected an object, got {type(record).__name__}")
+            return
+        self._checks[section](record, path)
+
+    def finish(self):
+        """Check the references to records that came later in the schedule, and return every issue found."""
+        known = {'stop': self._stop_ids, 'trip': self._trip_times, 'vehicle event': self._vehicle_events}
+        for path, kind, key in self._deferred:
+            if key not in known[kind]:
+                self._issue(path, f"unknown {kind} {self._describe(kind, key)}")
+        self._deferred = []
+        return self.issues
+
+    def _describe(self, kind, key):
+        if kind == 'vehicle event':
+            return f"{key[1]!r} of vehicle {key[0]!r}"
+        return repr(key)
+
+    def _id(self, record, field, path, seen):
+        """Check the ID of a record: present, a string or integer, and not in `seen` (which the caller updates)."""
+        value = record.get(field)
+        if value is None:
+            self._issue(path + (field,), "missing")
+            return None
+        if not isinstance(value, (str, int)) or isinstance(value, bool):
+            self._issue(path + (field,), f"expected a string or integer, got {value!r}")
+            return None
+        if value in seen:
+            self._issue(path + (field,), f"duplicate {field} {value!r}")
+        return value
+
+    def _time(self, record, field, path, required=True):
+        """Return a time of a record in minutes, rewritten in canonical form; None when missing or invalid."""
+        value = record.get(field)
+        if value is None:
+            if required:
+                self._issue(path + (field,), "missing")
+            return None
+        parsed = _parse_time(value) if isinstance(value, str) else None
+        if parsed is None:
+            self._issue(path + (field,), f"invalid time {value!r}, expected 'day.HH:MM'")
+            return None
+        minutes, canonical = parsed
+        if canonical == value:
+            self._minutes[value] = minutes
+        else:
+            record[field] = canonical
+        return minutes
+
+    def _interval(self, record, path, start_field, end_field, required=True):
+        """Return the (start, end) minutes of a record, checking that it does not end before it starts."""
+        start = self._time(record, start_field, path, required)
+        end = self._time(record, end_field, path, required)
+        if start is not None and end is not None and end < start:
+            self._issue(path + (end_field,), f"{record[end_field]!r} is before {start_field} {record[start_field]!r}")
+        return start, end
+
+    def _stop(self, record, field, path, required=False):
+        value = record.get(field)
+        if value is None:
+            if required:
+                self._issue(path + (field,), "missing")
+        elif not isinstance(value, (str, int)) or isinstance(value, bool):
+            self._issue(path + (field,), f"expected a string or integer, got {value!r}")
+        elif value not in self._stop_ids:
+            # Stops usually come first; anything else is checked once every stop was seen.
+            self._deferred.append((path + (field,), 'stop', value))
+
+    def _order(self, path, start, end, previous_end):
+        """Check that an event does not start before the previous one ends; returns the end the next one must follow."""
+        if start is not None and previous_end is not None and start < previous_end:
+            self._issue(path, f"starts at {format_time(start)}, before the previous event ends at "
+                              f"{format_time(previous_end)}")
+        return end if end is not None else previous_end
+
+    def _sequence(self, record, field, path, previous):
+        """Check that a sequence number follows the previous one; returns it (None when not a number)."""
+        number = _sequence_number(record.get(field))
+        if number is not None and previous is not None and number <= previous:
+            self._issue(path + (field,), f"{record[field]!r} is out of sequence order (after {previous})")
+        return number if number is not None else previous
+
+    def _add_stop(self, stop, path):
+        stop_id = self._id(stop, 'stop_id', path, self._stop_ids)
+        if stop_id is not None:
+            self._stop_ids.add(stop_id)
+        for field in ('latitude', 'longitude'):
+            value = stop.get(field)
+            if value is not None and (not isinstance(value, (int, float)) or isinstance(value, bool)):
+                self._issue(path + (field,), f"expected a number, got {value!r}")
+
+    def _add_trip(self, trip, path):
+        stop_ids = self._stop_ids
+        try:
+            trip_id = trip['trip_id']
+            start, end = self._minutes[trip['departure_time']], self._minutes[trip['arrival_time']]
+            origin, destination = trip.get('origin_stop_id'), trip.get('destination_stop_id')
+            if (type(trip_id) is not str and type(trip_id) is not int or trip_id in self._trip_times or end < start
+                    or 'sub_trips' in trip or (origin is not None and origin not in stop_ids)
+                    or (destination is not None and destination not in stop_ids)):
+                raise _Recheck
+        except _RECHECK:
+            self._check_trip(trip, path)
+            return
+        self._trip_times[trip_id] = start << 32 | end
+
+    def _check_trip(self, trip, path):
+        trip_id = self._id(trip, 'trip_id', path, self._trip_times)
+        times = self._interval(trip, path, 'departure_time', 'arrival_time')
+        self._stop(trip, 'origin_stop_id', path)
+        self._stop(trip, 'destination_stop_id', path)
+        if trip_id is not None:
+            self._trip_times[trip_id] = _pack_times(*times)
+        sub_trips = trip.get('sub_trips', [])
+        if not isinstance(sub_trips, list):
+            self._issue(path + ('sub_trips',), "expected a list")
+            return
+        for position, sub_trip in enumerate(sub_trips):
+            sub_path = path + ('sub_trips', position)
+            if not isinstance(sub_trip, dict):
+                self._issue(sub_path, f"expected an object, got {type(sub_trip).__name__}")
+                continue
+            times = self._interval(sub_trip, sub_path, 'departure_time', 'arrival_time')
+            sub_trip_index = sub_trip.get('sub_trip_index')
+            if not isinstance(sub_trip_index, str):
+                self._issue(sub_path + ('sub_trip_index',), "missing" if sub_trip_index is None else
+                            f"expected a string, got {sub_trip_index!r}")
+            elif trip_id is not None:
+                self._trip_times[(trip_id, sub_trip_index.rpartition('_')[2])] = _pack_times(*times)
+
+    def _add_vehicle(self, vehicle, path):
+        try:
+            vehicle_id, events = vehicle['vehicle_id'], vehicle['vehicle_events']
+            if (type(vehicle_id) is not str and type(vehicle_id) is not int or vehicle_id in self._vehicle_ids
+                    or type(events) is not list):
+                raise _Recheck
+        except _RECHECK:
+            self._check_vehicle(vehicle, path)
+            return
+        self._vehicle_ids.add(vehicle_id)
+        minutes, stop_ids, trip_times, vehicle_events = (self._minutes, self._stop_ids, self._trip_times,
+                                                         self._vehicle_events)
+        previous_sequence = previous_end = None
+        for position, event in enumerate(events):
+            try:
+                sequence = event.get('vehicle_event_sequence')
+                if event.get('vehicle_event_type') == 'service_trip':
+                    if 'start_time' in event or 'end_time' in event:
+                        raise _Recheck
+                    trip_id, sub_trip_index = event['trip_id'], event.get('sub_trip_index')
+                    times = trip_times.get((trip_id, sub_trip_index)) if sub_trip_index is not None else None
+                    start, end = _unpack_times(trip_times[trip_id] if times is None else times)
+                    origin, destination = event.get('origin_stop_id'), event.get('destination_stop_id')
+                    if ((origin is not None and origin not in stop_ids)
+                            or (destination is not None and destination not in stop_ids)):
+                        raise _Recheck
+                else:
+                    start, end = minutes[event['start_time']], minutes[event['end_time']]
+                    if (end < start or event['origin_stop_id'] not in stop_ids
+                            or event['destination_stop_id'] not in stop_ids):
+                        raise _Recheck
+                if start is None or end is None or (previous_end is not None and start < previous_end):
+                    raise _Recheck
+                # The vehicle is new and its numbers increase, so its keys cannot repeat.
+                if sequence is not None:
+                    number = int(sequence)
+                    if type(sequence) is not str or (previous_sequence is not None and number <= previous_sequence):
+                        raise _Recheck
+            except _RECHECK:
+                previous_sequence, previous_end = self._check_vehicle_event(
+                    event, path + ('vehicle_events', position), vehicle_id, previous_sequence, previous_end)
+                continue
+            if sequence is not None:
+                vehicle_events.add((vehicle_id, sequence), start, end)
+                previous_sequence = number
+            previous_end = end
+
+    def _check_vehicle(self, vehicle, path):
+        vehicle_id = self._id(vehicle, 'vehicle_id', path, self._vehicle_ids)
+        if vehicle_id is not None:
+            self._vehicle_ids.add(vehicle_id)
+        events = vehicle.get('vehicle_events')
+        if not isinstance(events, list):
+            self._issue(path + ('vehicle_events',), "missing" if events is None else "expected a list")
+            return
+        previous_sequence = previous_end = None
+        for position, event in enumerate(events):
+            previous_sequence, previous_end = self._check_vehicle_event(
+                event, path + ('vehicle_events', position), vehicle_id, previous_sequence, previous_end)
+
+    def _service_trip_times(self, event, path):
+        """Return the times of a service trip event: its own, or those of its trip."""
+        trip_id = event.get('trip_id')
+        if trip_id is None:
+            self._issue(path + ('trip_id',), "missing")
+            return None, None
+        if 'start_time' in event or 'end_time' in event:
+            return self._interval(event, path, 'start_time', 'end_time', required=False)
+        sub_trip_index = event.get('sub_trip_index')
+        times = self._trip_times.get((trip_id, sub_trip_index)) if sub_trip_index is not None else None
+        times = self._trip_times.get(trip_id) if times is None else times
+        if times is None:
+            # Trips usually come before the vehicles; anything else is checked at the end, without the ordering.
+            self._deferred.append((path + ('trip_id',), 'trip', trip_id))
+            return None, None
+        return _unpack_times(times)
+
+    def _check_vehicle_event(self, event, path, vehicle_id, previous_sequence, previous_end):
+        """Check a vehicle event field by field; returns the sequence number and end the next event must follow."""
+        if not isinstance(event, dict):
+            self._issue(path, f"expected an object, got {type(event).__name__}")
+            return previous_sequence, previous_end
+        service_trip = event.get('vehicle_event_type') == 'service_trip'
+        if service_trip:
+            start, end = self._service_trip_times(event, path)
+        else:
+            start, end = self._interval(event, path, 'start_time', 'end_time')
+        self._stop(event, 'origin_stop_id', path)
+        self._stop(event, 'destination_stop_id', path, required=not service_trip)
+        # Only events referred to by duty events need a sequence number.
+        if event.get('vehicle_event_sequence') is not None:
+            previous_sequence = self._sequence(event, 'vehicle_event_sequence', path, previous_sequence)
+            if vehicle_id is not None:
+                key = vehicle_event_key(vehicle_id, event['vehicle_event_sequence'])
+                if key in self._vehicle_events:
+                    self._issue(path + ('vehicle_event_sequence',),
+                                f"duplicate vehicle_event_sequence {event['vehicle_event_sequence']!r}")
+                self._vehicle_events.add(key, start, end)
+        return previous_sequence, self._order(path, start, end, previous_end)
+
+    def _add_duty(self, duty, path):
+        try:
+            duty_id, events = duty['duty_id'], duty.get('duty_events', [])
+            if (type(duty_id) is not str and type(duty_id) is not int or duty_id in self._duty_ids
+                    or type(events) is not list):
+                raise _Recheck
+        except _RECHECK:
+            self._check_duty(duty, path)
+            return
+        self._duty_ids.add(duty_id)
+        minutes, stop_ids, vehicle_events = self._minutes, self._stop_ids, self._vehicle_events
+        previous_sequence = previous_end = None
+        for position, event in enumerate(events):
+            try:
+                number = event.get('duty_event_sequence')
+                if number is not None:
+                    number = int(number)
+                if event.get('duty_event_type') == 'vehicle_event':
+                    sequence = event['vehicle_event_sequence']
+                    if type(sequence) is not str:
+                        if sequence is None:
+                            raise _Recheck
+                        sequence = event['vehicle_event_sequence'] = str(sequence)
+                    times = vehicle_events.get((event['vehicle_id'], sequence))
+                    if times is None:
+                        raise _Recheck
+                    start, end = times
+                else:
+                    start, end = minutes[event['start_time']], minutes[event['end_time']]
+                    if (end < start or event['origin_stop_id'] not in stop_ids
+                            or event['destination_stop_id'] not in stop_ids):
+                        raise _Recheck
+                if (start is None or end is None or (previous_end is not None and start < previous_end)
+                        or (number is not None and previous_sequence is not None and number <= previous_sequence)):
+                    raise _Recheck
+            except _RECHECK:
+                previous_sequence, previous_end = self._check_duty_event(
+                    event, path + ('duty_events', position), previous_sequence, previous_end)
+                continue
+            previous_sequence = number if number is not None else previous_sequence
+            previous_end = end
+
+    def _check_duty(self, duty, path):
+        duty_id = self._id(duty, 'duty_id', path, self._duty_ids)
+        if duty_id is not None:
+            self._duty_ids.add(duty_id)
+        events = duty.get('duty_events', [])
+        if not isinstance(events, list):
+            self._issue(path + ('duty_events',), "expected a list")
+            return
+        previous_sequence = previous_end = None
+        for position, event in enumerate(events):
+            previous_sequence, previous_end = self._check_duty_event(
+                event, path + ('duty_events', position), previous_sequence, previous_end)
+
+    def _check_duty_event(self, event, path, previous_sequence, previous_end):
+        """Check a duty event field by field; returns the sequence number and end the next event must follow."""
+        if not isinstance(event, dict):
+            self._issue(path, f"expected an object, got {type(event).__name__}")
+            return previous_sequence, previous_end
+        previous_sequence = self._sequence(event, 'duty_event_sequence', path, previous_sequence)
+        if event.get('duty_event_type') != 'vehicle_event':
+            start, end = self._interval(event, path, 'start_time', 'end_time')
+            self._stop(event, 'origin_stop_id', path, required=True)
+            self._stop(event, 'destination_stop_id', path, required=True)
+            return previous_sequence, self._order(path, start, end, previous_end)
+        vehicle_id, sequence = event.get('vehicle_id'), event.get('vehicle_event_sequence')
+        for field, value in (('vehicle_id', vehicle_id), ('vehicle_event_sequence', sequence)):
+            if value is None:
+                self._issue(path + (field,), "missing")
+        if vehicle_id is None or sequence is None:
+            return previous_sequence, previous_end
+        if not isinstance(sequence, str):
+            event['vehicle_event_sequence'] = str(sequence)
+        key = vehicle_event_key(vehicle_id, sequence)
+        times = self._vehicle_events.get(key)
+        if times is None:
+            # Vehicles usually come before the duties; anything else is checked at the end, without the ordering.
+            self._deferred.append((path, 'vehicle event', key))
+            return previous_sequence, previous_end
+        return previous_sequence, self._order(path, *times, previous_end)
+
+"""Validate and normalise a loaded schedule in place; returns the list of ValidationIssues (empty when valid)."""
+def validate_schedule(json_data):
+    if not isinstance(json_data, dict):
+        return [ValidationIssue('', f"expected an object, got {type(json_data).__name__}")]
+    validator = ScheduleValidator()
+    for section in SECTIONS:
+        records = json_data.get(section)
+        if not isinstance(records, list):
+            validator.issues.append(ValidationIssue(section, "missing" if records is None else "expected a list"))
+            continue
+        for record in records:
+            validator.add(section, record)
+    return validator.finish()
@@ -0,0 +1,233 @@
+from collections.abc import Sequence
+from itertools import repeat
+import numpy as np
+import pandas as pd
+from src.index import DutyEventIndex
+from src.stops import UNKNOWN_STOP, as_stop_registry
+from src.utils import BREAK_THRESHOLD
+
+# Columns of the event frame: one row per timed duty event. destination is the
+# stop code in the StopRegistry, -1 when the event has no destination stop.
+EVENT_COLUMNS = ['duty_id', 'start_min', 'end_min', 'destination']
+BREAK_COLUMNS = ['duty_id', 'break_start_time', 'break_duration', 'break_stop_name']
+
+
+"""Load the timed events of a DutyEventIndex into a columnar frame.
+
+Rows are grouped by duty, in the order of `duty_ids` (all indexed duties by
+default, must be unique), and already sorted by start time within each duty.
+The columns are the index's event_arrays, and duty_id is a categorical column
+over them, so the duties are not hashed again.
+"""
+def index_events_frame(index, duty_ids=None):
+    if duty_ids is None:
+        duty_ids = index.duty_ids()
+    duty_codes, starts, ends, destinations = index.event_arrays(duty_ids)
+    return pd.DataFrame({
+        'duty_id': pd.Categorical.from_codes(duty_codes, categories=pd.Index(duty_ids, dtype=object)),
+        'start_min': starts,
+        'end_min': ends,
+        'destination': destinations,
+    }, columns=EVENT_COLUMNS)
+
+"""Find the gaps between consecutive events of every duty in an event frame.
+
+Sorts the events by (duty, start) with a stable sort, so ties keep their order
+like in calculate_breaks (frames that are already in that order, like the ones
+from index_events_frame, are only checked), and takes the gap between each
+event and the next event of the same duty.
+
+Returns (duty_codes, duty_ids, starts, durations, destinations) for the gaps,
+in duty then time order: numpy arrays of the duty code (into duty_ids), start
+minute (the end of the event before the gap), duration (zero or negative when
+the events touch or overlap) and stop code (the destination of the event
+before the gap, -1 when none) of each gap.
+"""
+def gap_arrays(events):
+    duty_codes, duty_ids = pd.factorize(events['duty_id'], sort=False)
+    starts = events['start_min'].to_numpy(dtype=np.int64)
+    ends = events['end_min'].to_numpy(dtype=np.int64)
+    destinations = events['destination'].to_numpy(dtype=np.int64)
+    if not np.all((duty_codes[1:] > duty_codes[:-1])
+                  | ((duty_codes[1:] == duty_codes[:-1]) & (starts[1:] >= starts[:-1]))):
+        order = np.lexsort((starts, duty_codes))
+        duty_codes, starts, ends, destinations = duty_codes[order], starts[order], ends[order], destinations[order]
+    duty_codes, starts, durations, destinations = _gaps(duty_codes, starts, ends, destinations)
+    return duty_codes, duty_ids, starts, durations, destinations
+
+"""Return (duty_codes, starts, durations, destinations) of the gaps between events already in duty then time order."""
+def _gaps(duty_codes, starts, ends, destinations):
+    same_duty = duty_codes[1:] == duty_codes[:-1]
+    return (duty_codes[:-1][same_duty], ends[:-1][same_duty], (starts[1:] - ends[:-1])[same_duty],
+            destinations[:-1][same_duty])
+
+"""Tell which gaps (see gap_arrays) are breaks.
+
+A gap is a break when it is longer than `threshold` minutes or, given
+BreakRules (see src/breaks.py), when it matches one of the rules. Returns
+(is_break, rule_codes): a boolean array over the gaps, and the position of the
+rule each gap matched, -1 when none did (None without rules).
+"""
+def break_mask(durations, destinations, stops, threshold=BREAK_THRESHOLD, rules=None):
+    if rules is None:
+        return durations > threshold, None
+    rule_codes = rules.classify_codes(durations, destinations, as_stop_registry(stops))
+    return rule_codes >= 0, rule_codes
+
+"""Find the breaks of every duty in an event frame with vectorised operations.
+
+Takes the gaps between the events of each duty (see gap_arrays) and keeps the
+gaps longer than `threshold` minutes, or, given BreakRules (see
+src/breaks.py), the gaps that match one of the rules.
+
+Returns (duty_codes, duty_ids, starts, durations, destinations, rule_codes) for
+the breaks, in duty then time order: numpy arrays of the duty code (into
+duty_ids), start minute, duration and destination stop code (-1 when none) of
+each break, and the position of the rule each break matched (None without rules).
+"""
+def break_arrays(events, stops, threshold=BREAK_THRESHOLD, rules=None):
+    duty_codes, duty_ids, starts, durations, destinations = gap_arrays(events)
+    is_break, rule_codes = break_mask(durations, destinations, stops, threshold, rules)
+    if rule_codes is not None:
+        rule_codes = rule_codes[is_break]
+    return (duty_codes[is_break], duty_ids, starts[is_break], durations[is_break], destinations[is_break],
+            rule_codes)
+
+"""Find the breaks of every duty in an event frame (see break_arrays) and join the stop names of the destinations.
+
+Returns a frame with BREAK_COLUMNS, one row per break, in duty then time order.
+With BreakRules, the frame also has the break_type and paid columns of the
+rule each break matched.
+"""
+def breaks_frame(events, stops, threshold=BREAK_THRESHOLD, rules=None):
+    stops = as_stop_registry(stops)
+    duty_codes, duty_ids, starts, durations, destinations, rule_codes = break_arrays(events, stops, threshold, rules)
+
+    # Code -1 (no destination) maps to the "Unknown Stop" appended at the end.
+    names = stops.names() + [UNKNOWN_STOP]
+    destinations[destinations < 0] = len(names) - 1
+    frame = pd.DataFrame({
+        'duty_id': pd.Categorical.from_codes(duty_codes, categories=pd.Index(duty_ids, dtype=object)),
+        'break_start_time': starts,
+        'break_duration': durations,
+        'break_stop_name': np.asarray(names, dtype=object)[destinations],
+    }, columns=BREAK_COLUMNS)
+    if rules is not None:
+        frame['break_type'] = np.asarray([rule.name for rule in rules], dtype=object)[rule_codes]
+        frame['paid'] = np.asarray([rule.paid for rule in rules], dtype=bool)[rule_codes]
+    return frame
+
+"""Group a breaks frame back into the per-duty lists of break dicts calculate_breaks returns.
+
+The rows are grouped by duty (see breaks_frame), so each duty's breaks are a
+slice of the rows, cut where the duty code changes; the break dicts are built
+in one pass over the columns.
+"""
+def breaks_by_duty(breaks):
+    duty_column = breaks['duty_id'].astype('category')
+    duty_codes = duty_column.cat.codes.to_numpy()
+    columns = [breaks['break_start_time'].tolist(), breaks['break_duration'].tolist(),
+               breaks['break_stop_name'].tolist()]
+    if 'break_type' in breaks:
+        columns += [breaks['break_type'].tolist(), breaks['paid'].tolist()]
+        break_infos = [
+            {'break_start_time': start, 'break_duration': duration, 'break_stop_name': stop_name,
+             'break_type': break_type, 'paid': paid}
+            for start, duration, stop_name, break_type, paid in zip(*columns)
+        ]
+    else:
+        break_infos = [
+            {'break_start_time': start, 'break_duration': duration, 'break_stop_name': stop_name}
+            for start, duration, stop_name in zip(*columns)
+        ]
+    starts = [0, *(np.flatnonzero(duty_codes[1:] != duty_codes[:-1]) + 1).tolist()] if len(break_infos) else []
+    duty_ids = duty_column.cat.categories[duty_codes[starts]].tolist()
+    return {duty_id: break_infos[start:end]
+            for duty_id, start, end in zip(duty_ids, starts, starts[1:] + [len(break_infos)])}
+
+"""The breaks of one duty, as a read-only sequence of the dicts calculate_breaks returns.
+
+The breaks of all the duties found by generate_breaks_info_vectorized share
+one set of columns; a DutyBreaks is the slice of one duty, and its dicts are
+only built when they are read (it compares equal to, and pickles as, the list
+of those dicts).
+"""
+class DutyBreaks(Sequence):
+    __slots__ = ('_columns', '_start', '_end')
+
+    def __init__(self, columns, start, end):
+        self._columns = columns
+        self._start = start
+        self._end = end
+
+    def _dicts(self):
+        starts, durations, destinations, rule_codes, names, rules = self._columns
+        start, end = self._start, self._end
+        break_infos = [
+            {'break_start_time': break_start, 'break_duration': duration, 'break_stop_name': names[destination]}
+            for break_start, duration, destination in zip(
+                starts[start:end].tolist(), durations[start:end].tolist(), destinations[start:end].tolist())
+        ]
+        if rule_codes is not None:
+            for break_info, rule_code in zip(break_infos, rule_codes[start:end].tolist()):
+                break_info['break_type'] = rules[rule_code].name
+                break_info['paid'] = rules[rule_code].paid
+        return break_infos
+
+    def __len__(self):
+        return self._end - self._start
+
+    def __getitem__(self, position):
+        return self._dicts()[position]
+
+    def __iter__(self):
+        return iter(self._dicts())
+
+    def __eq__(self, other):
+        if isinstance(other, (DutyBreaks, list)):
+            return self._dicts() == list(other)
+        return NotImplemented
+
+    def __reduce__(self):
+        return list, (self._dicts(),)
+
+    def __repr__(self):
+        return repr(self._dicts())
+
+"""Vectorised counterpart of steps.generate_breaks_info, producing the same breaks.
+
+The timed events of the duties are read from the DutyEventIndex (built from
+the vehicles when none is given) as columns (see DutyEventIndex.event_arrays),
+already grouped by duty and sorted, and the breaks of all of them are found at
+once, with `rules` like calculate_breaks. No frame and no dict is built per
+break: each duty gets its breaks as a DutyBreaks over the break columns.
+
+Returns the updated start/end times list with break details added for each duty.
+"""
+def generate_breaks_info_vectorized(start_end_with_stop_names, vehicles, stops, index=None, threshold=BREAK_THRESHOLD,
+                                    rules=None):
+    if index is None:
+        index = DutyEventIndex(vehicles, stops=stops)
+    elif stops is not index.stops:
+        index.stops.update(stops)
+    stops = index.stops
+
+    duty_ids = [duty_data['Duty ID'] for duty_data in start_end_with_stop_names]
+    unique_ids = list(dict.fromkeys(duty_ids))
+    duty_codes, starts, durations, destinations = _gaps(*index.event_arrays(unique_ids))
+    is_break, rule_codes = break_mask(durations, destinations, stops, threshold, rules)
+    positions = np.flatnonzero(is_break)
+    # Code -1 (no destination) maps to the "Unknown Stop" appended at the end.
+    columns = (starts[positions], durations[positions], destinations[positions],
+               None if rule_codes is None else rule_codes[positions], stops.names() + [UNKNOWN_STOP],
+               None if rules is None else list(rules))
+    bounds = np.zeros(len(unique_ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(duty_codes[positions], minlength=len(unique_ids)), out=bounds[1:])
+    bounds = bounds.tolist()
+    duty_breaks = list(map(DutyBreaks, repeat(columns, len(unique_ids)), bounds, bounds[1:]))
+    if len(unique_ids) < len(duty_ids):
+        by_duty = dict(zip(unique_ids, duty_breaks))
+        duty_breaks = [by_duty[duty_id] for duty_id in duty_ids]
+    for duty_data, breaks in zip(start_end_with_stop_names, duty_breaks):
+        duty_data['Breaks'] = breaks
+    return start_end_with_stop_names
@@ -0,0 +1,30 @@
+from src.steps import generate_start_end_times, generate_stop_names, generate_breaks_info
+
+"""
+Schedules shared by the tests of the ways the steps are run (pipeline,
+parallel), which must all give the report of the three separate steps.
+"""
+
+
+"""A vehicle running duties 1-5 from `origin` to `destination` and back, each with a 30 minute break, and the duties.
+
+The duties are listed out of order and include a sixth one without events.
+Returns (vehicles, duties).
+"""
+def round_trip_schedule(origin, destination):
+    vehicles = [{'vehicle_events': [
+        {'duty_id': str(number), 'start_time': f'0.0{number}:00', 'end_time': f'0.0{number}:10',
+         'origin_stop_id': origin, 'destination_stop_id': destination}
+        for number in range(1, 6)
+    ] + [
+        {'duty_id': str(number), 'start_time': f'0.0{number}:40', 'end_time': f'0.0{number}:50',
+         'origin_stop_id': destination, 'destination_stop_id': origin}
+        for number in range(1, 6)
+    ]}]
+    duties = [{'duty_id': str(number)} for number in (5, 3, 1, 4, 2, 6)]
+    return vehicles, duties
+
+"""The report of the three steps run one after the other over every duty, as the reference."""
+def serial_report(duties, index, stops):
+    start_end_times = generate_start_end_times(duties, None, index)
+    return generate_breaks_info(generate_stop_names(start_end_times, stops), None, stops, index)
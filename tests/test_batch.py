@@ -0,0 +1,80 @@
+import json
+import multiprocessing
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+from src.batch import SUMMARY_FILE, find_schedules, output_dirs, run_batch, run_dataset
+
+SCHEDULE = {
+    'stops': [{'stop_id': 'A', 'stop_name': 'Stop A', 'is_depot': True}],
+    'trips': [],
+    'vehicles': [{'vehicle_id': '1', 'vehicle_events': [
+        {'duty_id': '1', 'start_time': '0.08:00', 'end_time': '0.09:00', 'destination_stop_id': 'A'},
+        {'duty_id': '1', 'start_time': '0.09:30', 'end_time': '0.10:00', 'destination_stop_id': 'A'},
+    ]}],
+    'duties': [{'duty_id': '1'}],
+}
+
+"""run_dataset, except that the worker process dies on crash.json."""
+def crashing_run_dataset(filepath, *args):
+    if Path(filepath).name == 'crash.json':
+        os._exit(1)
+    return run_dataset(filepath, *args)
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp_dir.name)
+        (self.root / 'in').mkdir()
+        for name in ('a.json', 'b.json'):
+            with open(self.root / 'in' / name, 'w') as file:
+                json.dump(SCHEDULE, file)
+        with open(self.root / 'in' / 'broken.json', 'w') as file:
+            file.write('{"stops": [')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_find_schedules(self):
+        schedules = find_schedules([self.root / 'in', str(self.root / 'in' / 'a*.json')])
+        self.assertEqual([path.name for path in schedules], ['a.json', 'b.json', 'broken.json'])
+
+    def test_output_dirs_do_not_clash(self):
+        dirs = output_dirs([Path('x/a.json'), Path('y/a.json'), Path('b.json')], 'out')
+        self.assertEqual(dirs, [Path('out/a'), Path('out/a_2'), Path('out/b')])
+
+    def test_run_dataset_records_failures(self):
+        entry = run_dataset(self.root / 'in' / 'broken.json', self.root / 'out' / 'broken')
+        self.assertEqual(entry['status'], 'failed')
+        self.assertIn('ValueError', entry['error'])
+
+    def test_run_batch(self):
+        schedules = find_schedules([self.root / 'in'])
+        summary = run_batch(schedules, self.root / 'out', jobs=2, fmt='csv')
+        self.assertEqual((summary['datasets'], summary['succeeded'], summary['failed']), (3, 2, 1))
+        self.assertEqual([entry['status'] for entry in summary['entries']], ['ok', 'ok', 'failed'])
+        self.assertEqual(set(summary['entries'][0]['stages']), {'load', 'steps+export'})
+        self.assertEqual(summary['entries'][0]['duties'], 1)
+        self.assertTrue(os.path.exists(self.root / 'out' / 'b' / 'report_step3.csv'))
+        with open(self.root / 'out' / SUMMARY_FILE) as file:
+            self.assertEqual(json.load(file)['succeeded'], 2)
+
+    def test_run_dataset_exports_every_step(self):
+        entry = run_dataset(self.root / 'in' / 'a.json', self.root / 'out' / 'a')
+        self.assertEqual(entry['status'], 'ok')
+        self.assertEqual(set(entry['stages']), {'load', 'steps', 'export'})
+        self.assertTrue(os.path.exists(self.root / 'out' / 'a' / 'step3.xlsx'))
+
+    # The workers only see the patched run_dataset when they are forked.
+    @unittest.skipUnless(multiprocessing.get_start_method() == 'fork', "needs forked worker processes")
+    def test_run_batch_survives_a_dead_worker(self):
+        with open(self.root / 'in' / 'crash.json', 'w') as file:
+            json.dump(SCHEDULE, file)
+        schedules = [self.root / 'in' / name for name in ('a.json', 'crash.json', 'b.json')]
+        with mock.patch('src.batch.run_dataset', crashing_run_dataset):
+            summary = run_batch(schedules, self.root / 'out', jobs=2, fmt='csv')
+        self.assertEqual([entry['status'] for entry in summary['entries']], ['ok', 'failed', 'ok'])
+        self.assertIn('BrokenProcessPool', summary['entries'][1]['error'])
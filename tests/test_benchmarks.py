@@ -0,0 +1,61 @@
+import json
+import os
+import tempfile
+import unittest
+from benchmarks.bench_suite import compare
+from benchmarks.synthetic import MAX_SHIFT, copy_shifts, load_template, scale_dataset, write_scaled_dataset
+from src.index import DutyEventIndex, TripIndex, resolve_service_trips
+from src.stops import StopRegistry
+from src.steps import generate_start_end_times, generate_stop_names, generate_breaks_info
+
+def full_report(json_data):
+    resolve_service_trips(json_data['vehicles'], TripIndex(json_data['trips']))
+    stops = StopRegistry(json_data['stops'])
+    index = DutyEventIndex(json_data['vehicles'], json_data['duties'], stops)
+    start_end_times = generate_start_end_times(json_data['duties'], json_data['vehicles'], index)
+    return generate_breaks_info(generate_stop_names(start_end_times, stops), json_data['vehicles'], stops, index)
+
+class TestSyntheticSchedules(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.template = load_template()
+
+    def test_seed_is_reproducible(self):
+        self.assertEqual(scale_dataset(self.template, 3, seed=7), scale_dataset(self.template, 3, seed=7))
+        self.assertNotEqual(scale_dataset(self.template, 3, seed=7), scale_dataset(self.template, 3, seed=8))
+        shifts = copy_shifts(50, seed=1)
+        self.assertEqual(shifts[0], 0)
+        self.assertTrue(all(-MAX_SHIFT <= shift <= MAX_SHIFT for shift in shifts))
+
+    def test_shifted_copies_keep_their_breaks(self):
+        factor = 3
+        report = full_report(scale_dataset(self.template, factor, seed=5))
+        original = full_report(scale_dataset(self.template, 1))
+        self.assertEqual(len(report), factor * len(original))
+        for copy_number in range(factor):
+            copy_report = report[copy_number * len(original):(copy_number + 1) * len(original)]
+            for duty_data, original_data in zip(copy_report, original):
+                self.assertEqual([info['break_duration'] for info in duty_data['Breaks']],
+                                 [info['break_duration'] for info in original_data['Breaks']])
+                self.assertEqual(duty_data['First Stop'], original_data['First Stop'])
+
+    def test_written_dataset_matches_scale_dataset(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'schedule.json')
+            write_scaled_dataset(self.template, 2, path, seed=3)
+            with open(path) as file:
+                self.assertEqual(json.load(file), scale_dataset(self.template, 2, seed=3))
+
+class TestCompare(unittest.TestCase):
+
+    def results(self, **seconds):
+        return {'results': {'10x': {name: {'seconds': value, 'items': 1, 'items_per_second': 1 / value}
+                                    for name, value in seconds.items()}}}
+
+    def test_statuses(self):
+        baseline = self.results(steady=1.0, slower=1.0, faster=1.0, tiny=0.0001)
+        current = self.results(steady=1.1, slower=1.5, faster=0.5, tiny=0.001, added=1.0)
+        statuses = {row[1]: row[5] for row in compare(current, baseline, tolerance=0.25)}
+        self.assertEqual(statuses, {'steady': 'ok', 'slower': 'regression', 'faster': 'faster',
+                                    'tiny': 'noise', 'added': 'new'})
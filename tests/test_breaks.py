@@ -0,0 +1,138 @@
+import copy
+import random
+import unittest
+from src.breaks import BreakIndex, BreakRule, BreakRules
+from src.index import DutyEventIndex, EventRecord
+from src.stops import StopRegistry
+from src.steps import generate_breaks_info
+from src.utils import calculate_breaks
+
+STOPS = [
+    {'stop_id': 'D', 'stop_name': 'Depot', 'is_depot': True},
+    {'stop_id': 'A', 'stop_name': 'Stop A', 'is_depot': False},
+    {'stop_id': 'B', 'stop_name': 'Stop B', 'is_depot': False},
+]
+RULES = {'rules': [
+    {'name': 'depot meal', 'depot': True, 'min_duration': 30},
+    {'name': 'relief', 'stops': ['A'], 'max_duration': 45, 'paid': True},
+    {'name': 'break', 'min_duration': 20},
+]}
+
+class TestBreakRules(unittest.TestCase):
+
+    def setUp(self):
+        self.stops = StopRegistry(STOPS)
+        self.rules = BreakRules.from_config(RULES)
+        depot, stop_a, stop_b = (self.stops.code(stop_id) for stop_id in ('D', 'A', 'B'))
+        # Gaps of 20 at the depot, 40 at A, 60 at A, 25 at B and 35 at the depot.
+        self.events = [
+            EventRecord(0, 10, destination=depot), EventRecord(30, 40, destination=stop_a),
+            EventRecord(80, 90, destination=stop_a), EventRecord(150, 160, destination=stop_b),
+            EventRecord(185, 190, destination=depot), EventRecord(225, 230),
+        ]
+
+    def test_from_config(self):
+        self.assertEqual([rule.name for rule in self.rules], ['depot meal', 'relief', 'break'])
+        self.assertEqual(self.rules.rules[1].stop_ids, ('A',))
+        self.assertEqual(BreakRules.from_config([{}]).rules[0].min_duration, 15)
+        with self.assertRaises(ValueError):
+            BreakRules.from_config([{'name': 'x', 'threshold': 10}])
+        with self.assertRaises(ValueError):
+            BreakRules.from_config({'rules': []})
+
+    def test_from_config_checks_field_types(self):
+        for rule, message in [
+            ({'min_duration': '30'}, "Break rule 1: min_duration must be a number of minutes, got '30'"),
+            ({'max_duration': True}, "Break rule 1: max_duration must be a number of minutes, got True"),
+            ({'stops': 'MTC'}, "Break rule 1: stops must be a list of stop IDs, got 'MTC'"),
+            ({'stops': ['MTC', 7]}, "Break rule 1: stops must be a list of stop IDs, got ['MTC', 7]"),
+            ({'paid': 'yes'}, "Break rule 1: paid must be true or false, got 'yes'"),
+            ('meal', "Break rule 1: expected an object, got 'meal'"),
+        ]:
+            with self.subTest(rule=rule), self.assertRaises(ValueError) as context:
+                BreakRules.from_config([{'name': 'meal'}, rule])
+            self.assertEqual(str(context.exception), message)
+
+    def test_first_matching_rule_wins(self):
+        breaks = calculate_breaks(self.events, self.stops, rules=self.rules)
+        self.assertEqual(
+            [(info['break_start_time'], info['break_duration'], info['break_type'], info['paid']) for info in breaks],
+            [(40, 40, 'relief', True), (90, 60, 'break', False), (160, 25, 'break', False),
+             (190, 35, 'depot meal', False)])
+
+    def test_default_rule_matches_threshold(self):
+        default = calculate_breaks(self.events, self.stops, rules=BreakRules([BreakRule()]))
+        self.assertEqual([{key: info[key] for key in ('break_start_time', 'break_duration', 'break_stop_name')}
+                          for info in default], calculate_breaks(self.events, self.stops))
+
+    def test_engines_agree(self):
+        index = DutyEventIndex(stops=self.stops)
+        index.add_records('1', self.events)
+        index.add_records('2', self.events[2:])
+        report = [{'Duty ID': '1'}, {'Duty ID': '2'}]
+        python = generate_breaks_info(copy.deepcopy(report), None, self.stops, index, rules=self.rules)
+        pandas = generate_breaks_info(copy.deepcopy(report), None, self.stops, index, 'pandas', rules=self.rules)
+        self.assertEqual(python, pandas)
+        self.assertEqual(python[0]['Breaks'], calculate_breaks(self.events, self.stops, rules=self.rules))
+
+class TestBreakIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.stops = StopRegistry(STOPS)
+        rng = random.Random(0)
+        self.index = DutyEventIndex(stops=self.stops)
+        for duty_number in range(50):
+            records, time = [], rng.randrange(600)
+            for _ in range(8):
+                end = time + rng.randrange(5, 60)
+                records.append(EventRecord(time, end, destination=rng.choice([0, 1, 2, None])))
+                time = end + rng.randrange(0, 90)
+            self.index.add_records(str(duty_number), records)
+        self.report = generate_breaks_info([{'Duty ID': duty_id} for duty_id in self.index.duty_ids()],
+                                           None, self.stops, self.index)
+        self.breaks = BreakIndex.from_index(self.index)
+
+    def scan(self, start, end, stop_name=None):
+        return sorted(
+            (info['break_start_time'], duty_data['Duty ID'])
+            for duty_data in self.report for info in duty_data['Breaks']
+            if info['break_start_time'] < end and info['break_start_time'] + info['break_duration'] > start
+            and stop_name in (None, info['break_stop_name'])
+        )
+
+    def test_queries_match_a_full_scan(self):
+        self.assertEqual(len(self.breaks), sum(len(duty_data['Breaks']) for duty_data in self.report))
+        rng = random.Random(1)
+        for _ in range(200):
+            start = rng.randrange(1500)
+            end = start + rng.randrange(1, 120)
+            for stop_id, stop_name in [(None, None), ('D', 'Depot'), ('A', 'Stop A')]:
+                expected = self.scan(start, end, stop_name)
+                found = self.breaks.on_break(start, end, stop_id)
+                self.assertEqual(sorted((info['break_start_time'], info['duty_id']) for info in found), expected)
+                self.assertEqual([info['break_start_time'] for info in found], sorted(start for start, _ in expected))
+                self.assertEqual(self.breaks.count_on_break(start, end, stop_id), len(expected))
+                self.assertEqual(set(self.breaks.duties_on_break(start, end, stop_id)),
+                                 {duty_id for _, duty_id in expected})
+
+    def test_long_break_and_empty_window(self):
+        breaks = BreakIndex(['1', '2'], [0, 1, 1], [100, 0, 2000], [30, 10000, 20], [0, 0, -1], self.stops)
+        self.assertEqual([info['duty_id'] for info in breaks.on_break(110, 120)], ['2', '1'])
+        self.assertEqual([info['break_start_time'] for info in breaks.on_break(2005, 2006)], [0, 2000])
+        self.assertEqual(breaks.on_break(9000, 9001, 'D'), [{'duty_id': '2', 'break_start_time': 0,
+                                                             'break_duration': 10000, 'break_stop_name': 'Depot'}])
+        for window in [(120, 110), (120, 120)]:
+            with self.assertRaises(ValueError):
+                breaks.count_on_break(*window)
+            with self.assertRaises(ValueError):
+                breaks.on_break(*window)
+
+    def test_unknown_stop_and_rules(self):
+        self.assertEqual(self.breaks.on_break(0, 2000, 'nowhere'), [])
+        self.assertEqual(self.breaks.count_on_break(0, 2000, 'nowhere'), 0)
+        rules = BreakRules.from_config(RULES)
+        typed = BreakIndex.from_index(self.index, rules=rules)
+        found = typed.on_break(0, 2000)
+        self.assertTrue(found)
+        self.assertTrue(all(info['break_type'] in {'depot meal', 'relief', 'break'} for info in found))
+        self.assertTrue(all(info['paid'] == (info['break_type'] == 'relief') for info in found))
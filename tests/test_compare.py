@@ -0,0 +1,121 @@
+import copy
+import csv
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from src.compare import DIFF_COLUMNS, ReportSummary, break_changes, compare_reports, unchanged_duties, write_diff
+from src.main import DEFAULT_DATASET, compare_schedules, load_report_inputs
+from src.utils import load_json_data
+
+def duty(duty_id, start, end, first='Stop A', last='Stop A', breaks=()):
+    return {
+        'Duty ID': duty_id, 'Start Time': start, 'End Time': end, 'First Stop': first, 'Last Stop': last,
+        'Breaks': [{'break_start_time': break_start, 'break_duration': duration, 'break_stop_name': stop_name}
+                   for break_start, duration, stop_name in breaks],
+    }
+
+class TestCompare(unittest.TestCase):
+
+    def setUp(self):
+        self.old = ReportSummary([
+            duty('1', 300, 600, breaks=[(400, 30, 'Stop A'), (500, 20, 'Stop B')]),
+            duty('2', 300, 600),
+            duty('3', 100, 200),
+        ])
+        self.new = ReportSummary([
+            duty('2', 300, 600),
+            duty('1', 290, 600, last='Stop B', breaks=[(400, 45, 'Stop A'), (560, 20, 'Stop B')]),
+            duty('4', None, None, 'Unknown Stop', 'Unknown Stop'),
+        ])
+
+    def test_break_changes(self):
+        old = [(100, 20, 'A'), (200, 30, 'A'), (300, 20, 'B'), (400, 20, 'C')]
+        new = [(100, 20, 'A'), (210, 30, 'A'), (290, 40, 'B'), (405, 20, 'D'), (500, 20, 'C')]
+        self.assertEqual(list(break_changes(old, new)), [
+            ('moved', (200, 30, 'A'), (210, 30, 'A')),
+            ('resized', (300, 20, 'B'), (290, 40, 'B')),
+            ('removed', (400, 20, 'C'), None),
+            ('added', None, (405, 20, 'D')),
+            ('added', None, (500, 20, 'C')),
+        ])
+        self.assertEqual(list(break_changes([], [(1, 20, 'A')])), [('added', None, (1, 20, 'A'))])
+        self.assertEqual(list(break_changes(old, old)), [])
+        unpaid, paid = (100, 20, 'A', 'meal', False), (100, 20, 'A', 'meal', True)
+        self.assertEqual(list(break_changes([unpaid], [paid])), [('reclassified', unpaid, paid)])
+
+    def test_break_rules_are_compared(self):
+        old = ReportSummary([duty('1', 300, 600, breaks=[(400, 30, 'Stop A')])])
+        new = ReportSummary([duty('1', 300, 600, breaks=[(400, 30, 'Stop A')])])
+        new.send(dict(duty('1', 300, 600), Breaks=[{'break_start_time': 400, 'break_duration': 30,
+                                                    'break_stop_name': 'Stop A', 'break_type': 'meal', 'paid': True}]))
+        self.assertEqual(list(compare_reports(old, new)), [
+            ('1', 'changed', [('1', 'reclassified', 'Break', '0.06:40-0.07:10 at Stop A',
+                               '0.06:40-0.07:10 at Stop A (meal, paid)', 0)]),
+        ])
+
+    def test_compare_reports(self):
+        changes = list(compare_reports(self.old, self.new))
+        self.assertEqual([(duty_id, change) for duty_id, change, _ in changes],
+                         [('1', 'changed'), ('4', 'added'), ('3', 'removed')])
+        self.assertEqual(changes[0][2], [
+            ('1', 'changed', 'Start Time', '0.05:00', '0.04:50', -10),
+            ('1', 'changed', 'Last Stop', 'Stop A', 'Stop B', None),
+            ('1', 'resized', 'Break', '0.06:40-0.07:10 at Stop A', '0.06:40-0.07:25 at Stop A', 15),
+            ('1', 'removed', 'Break', '0.08:20-0.08:40 at Stop B', None, -20),
+            ('1', 'added', 'Break', None, '0.09:20-0.09:40 at Stop B', 20),
+        ])
+        self.assertEqual(changes[1][2], [('4', 'added', 'First Stop', None, 'Unknown Stop', None),
+                                         ('4', 'added', 'Last Stop', None, 'Unknown Stop', None)])
+        self.assertEqual([row[2:] for row in changes[2][2]], [('Start Time', '0.01:40', None, None),
+                                                              ('End Time', '0.03:20', None, None),
+                                                              ('First Stop', 'Stop A', None, None),
+                                                              ('Last Stop', 'Stop A', None, None)])
+        self.assertEqual(list(compare_reports(self.new, self.new)), [])
+
+    def test_write_diff(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            counts = write_diff(self.old, self.new, Path(tmp_dir) / 'diff', 'csv')
+            with open(Path(tmp_dir) / 'diff_changes.csv', newline='') as file:
+                rows = list(csv.reader(file))
+        self.assertEqual(counts, {'changed': 1, 'added': 1, 'removed': 1, 'unchanged': 1, 'rows': 11})
+        self.assertEqual(rows[0], DIFF_COLUMNS)
+        self.assertEqual(rows[1], ['1', 'changed', 'Start Time', '0.05:00', '0.04:50', '-10'])
+        self.assertEqual(len(rows), 12)
+
+    def test_unchanged_duties(self):
+        schedule = load_json_data(DEFAULT_DATASET)
+        changed = copy.deepcopy(schedule)
+        last_event = changed['vehicles'][0]['vehicle_events'][-1]
+        last_event['end_time'] = '0.21:59'
+        changed['duties'].append({'duty_id': 'new'})
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            new_path = Path(tmp_dir) / 'new.json'
+            new_path.write_text(json.dumps(changed))
+            old_duties, _, _, old_index = load_report_inputs(DEFAULT_DATASET)
+            new_duties, _, _, new_index = load_report_inputs(new_path)
+        old_ids, new_ids = [duty['duty_id'] for duty in old_duties], [duty['duty_id'] for duty in new_duties]
+        unchanged = unchanged_duties(old_index, old_ids, new_index, new_ids)
+        self.assertEqual(set(new_ids) - unchanged, {last_event['duty_id'], 'new'})
+        # A stop that only one version has changes the stop codes, so every duty is recomputed.
+        new_index.stops.intern('elsewhere')
+        self.assertEqual(unchanged_duties(old_index, old_ids, new_index, new_ids), set())
+
+    def test_compare_schedules(self):
+        schedule = load_json_data(DEFAULT_DATASET)
+        changed = copy.deepcopy(schedule)
+        removed = changed['duties'].pop(3)
+        last_event = changed['vehicles'][0]['vehicle_events'][-1]
+        last_event['end_time'] = '0.21:59'
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            new_path = Path(tmp_dir) / 'new.json'
+            new_path.write_text(json.dumps(changed))
+            for stream in (False, True):
+                counts = compare_schedules(DEFAULT_DATASET, new_path, Path(tmp_dir) / str(stream), stream=stream,
+                                           fmt='csv')
+                self.assertEqual(counts, {'changed': 1, 'added': 0, 'removed': 1,
+                                          'unchanged': len(changed['duties']) - 1, 'rows': 6})
+                with open(Path(tmp_dir) / str(stream) / 'report_diff_changes.csv', newline='') as file:
+                    rows = list(csv.reader(file))
+                self.assertEqual(rows[1], [last_event['duty_id'], 'changed', 'End Time', '0.21:04', '0.21:59', '55'])
+                self.assertEqual({row[0] for row in rows[2:]}, {removed['duty_id']})
@@ -0,0 +1,75 @@
+import csv
+import os
+import tempfile
+import unittest
+from unittest import mock
+import pandas as pd
+from src.exporters import STEP_COLUMNS, duty_rows, iter_step_rows, write_report
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+REPORT = [
+    {'Duty ID': '1', 'Start Time': 195, 'End Time': 700, 'First Stop': 'Stop A', 'Last Stop': 'Stop B',
+     'Breaks': [{'break_start_time': 240, 'break_duration': 72, 'break_stop_name': 'Stop C'},
+                {'break_start_time': 400, 'break_duration': 20, 'break_stop_name': 'Stop D'}]},
+    {'Duty ID': '2', 'Start Time': None, 'End Time': None, 'First Stop': 'Unknown Stop', 'Last Stop': 'Unknown Stop',
+     'Breaks': []},
+]
+
+class TestDutyRows(unittest.TestCase):
+
+    def test_step_1(self):
+        self.assertEqual(list(duty_rows(REPORT[0], 1)), [('1', '0.03:15', '0.11:40')])
+        self.assertEqual(list(duty_rows(REPORT[1], 1)), [('2', 'No Start Time Found', 'No End Time Found')])
+
+    def test_step_3(self):
+        rows = list(iter_step_rows(REPORT, 3))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[1], ('1', '0.03:15', '0.11:40', 'Stop A', 'Stop B', '0.06:40', 20, 'Stop D'))
+        self.assertEqual(rows[2][5:], (None, None, None))
+
+class TestWriteReport(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'report')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_xlsx_single_workbook(self):
+        row_counts = write_report(iter(REPORT), self.path, 'xlsx')
+        self.assertEqual(row_counts, {1: 2, 2: 2, 3: 3})
+        sheets = pd.read_excel(self.path + '.xlsx', sheet_name=None)
+        self.assertEqual(list(sheets), ['step1', 'step2', 'step3'])
+        self.assertEqual(list(sheets['step3'].columns), STEP_COLUMNS[3])
+        self.assertEqual(sheets['step3']['Break Start Time'].tolist()[:2], ['0.04:00', '0.06:40'])
+
+    def test_csv(self):
+        write_report(REPORT, self.path, 'csv', steps=(2,))
+        with open(self.path + '_step2.csv', newline='') as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[0], STEP_COLUMNS[2])
+        self.assertEqual(rows[2], ['2', 'No Start Time Found', 'No End Time Found', 'Unknown Stop', 'Unknown Stop'])
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_parquet(self):
+        write_report(REPORT, self.path, 'parquet', steps=(3,))
+        df = pd.read_parquet(self.path + '_step3.parquet')
+        self.assertEqual(list(df.columns), STEP_COLUMNS[3])
+        self.assertEqual(df['Break Duration'].tolist()[:2], [72, 20])
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_parquet_schema_is_declared(self):
+        # Duty 2 has no breaks, so its row group has nothing but None in the break columns.
+        report = [REPORT[1], REPORT[0], dict(REPORT[1], **{'Duty ID': 3})]
+        with mock.patch('src.exporters.PARQUET_BATCH_SIZE', 1):
+            write_report(report, self.path, 'parquet', steps=(3,))
+        table = pyarrow.parquet.read_table(self.path + '_step3.parquet')
+        self.assertEqual(str(table.schema.field('Break Duration').type), 'int64')
+        self.assertEqual(table.column('Break Duration').to_pylist(), [None, 72, 20, None])
+        self.assertEqual(table.column('Duty ID').to_pylist(), ['2', '1', '1', '3'])
@@ -0,0 +1,88 @@
+import copy
+import os
+import tempfile
+import unittest
+from src.incremental import ReportCache, content_hash, generate_report_incremental
+from src.index import DutyEventIndex
+from src.stops import StopRegistry
+from src.steps import generate_start_end_times, generate_stop_names, generate_breaks_info
+
+class TestIncrementalReport(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.tmp_dir.name, 'cache.pickle')
+        self.stops = [{'stop_id': 'A', 'stop_name': 'Stop A'}, {'stop_id': 'B', 'stop_name': 'Stop B'}]
+        self.vehicles = [
+            {'vehicle_id': str(number), 'vehicle_events': [
+                {'duty_id': str(number), 'start_time': f'0.0{number}:00', 'end_time': f'0.0{number}:10',
+                 'destination_stop_id': 'A'},
+                {'duty_id': str(number), 'start_time': f'0.0{number}:40', 'end_time': f'0.0{number}:50',
+                 'destination_stop_id': 'B'},
+            ]}
+            for number in range(1, 5)
+        ]
+        self.vehicles[0]['vehicle_events'].append(
+            {'duty_id': '2', 'start_time': '0.03:00', 'end_time': '0.03:05', 'destination_stop_id': 'B'})
+        self.duties = [{'duty_id': str(number), 'duty_events': []} for number in range(1, 5)]
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def full_report(self):
+        stops = StopRegistry(self.stops)
+        index = DutyEventIndex(self.vehicles, self.duties, stops)
+        start_end_times = generate_start_end_times(self.duties, None, index)
+        return generate_breaks_info(generate_stop_names(start_end_times, stops), None, stops, index)
+
+    def run_incremental(self):
+        return generate_report_incremental(self.duties, self.vehicles, self.stops, self.cache_path)
+
+    def test_content_hash(self):
+        self.assertEqual(content_hash({'a': 'x' * 3, 'b': [1, 2]}), content_hash({'a': 'xxx', 'b': [1, 2]}))
+        self.assertNotEqual(content_hash({'a': 1}), content_hash({'a': 2}))
+
+    def test_unchanged_schedule_recomputes_nothing(self):
+        self.assertEqual(self.run_incremental()[1], 4)
+        report, recomputed = self.run_incremental()
+        self.assertEqual(recomputed, 0)
+        self.assertEqual(report, self.full_report())
+
+    def test_changed_vehicle_recomputes_its_duties(self):
+        self.run_incremental()
+        self.vehicles[0]['vehicle_events'][1]['end_time'] = '0.01:55'
+        report, recomputed = self.run_incremental()
+        self.assertEqual(recomputed, 2)
+        self.assertEqual(report, self.full_report())
+
+    def test_duty_moved_between_vehicles(self):
+        self.run_incremental()
+        self.vehicles[3]['vehicle_events'].append(self.vehicles[0]['vehicle_events'].pop())
+        report, recomputed = self.run_incremental()
+        self.assertEqual(recomputed, 3)
+        self.assertEqual(report, self.full_report())
+
+    def test_added_and_removed_duties(self):
+        self.run_incremental()
+        del self.duties[2]
+        self.duties.append({'duty_id': '5', 'duty_events': []})
+        report, recomputed = self.run_incremental()
+        self.assertEqual(recomputed, 1)
+        self.assertEqual([duty_data['Duty ID'] for duty_data in report], ['1', '2', '4', '5'])
+        self.assertEqual(report, self.full_report())
+
+    def test_changed_stops_recompute_everything(self):
+        self.run_incremental()
+        self.stops = copy.deepcopy(self.stops)
+        self.stops[0]['stop_name'] = 'Stop A2'
+        report, recomputed = self.run_incremental()
+        self.assertEqual(recomputed, 4)
+        self.assertEqual(report[0]['Breaks'][0]['break_stop_name'], 'Stop A2')
+
+    def test_unreadable_cache_is_ignored(self):
+        with open(self.cache_path, 'wb') as file:
+            file.write(b'not a cache')
+        self.assertIsNone(ReportCache.load(self.cache_path))
+        report, recomputed = self.run_incremental()
+        self.assertEqual(recomputed, 4)
+        self.assertEqual(report, self.full_report())
@@ -0,0 +1,143 @@
+import unittest
+from src.index import DutyEventIndex, EventRecord, TripIndex, resolve_service_trips
+from src.stops import StopRegistry
+from src.steps import generate_start_end_times, generate_stop_names, generate_breaks_info
+
+class TestDutyEventIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.vehicles = [
+            {'vehicle_events': [
+                {'duty_id': '1', 'start_time': '0.10:00', 'end_time': '0.11:00', 'destination_stop_id': 'B'},
+                {'duty_id': '2', 'start_time': '0.09:00', 'end_time': '0.09:30', 'destination_stop_id': 'A'},
+                {'duty_id': '1', 'trip_id': 'T1'},
+            ]},
+            {'vehicle_events': [
+                {'duty_id': '1', 'start_time': '0.08:00', 'end_time': '0.09:00', 'destination_stop_id': 'A'},
+            ]},
+        ]
+        self.duties = [{'duty_id': '1'}, {'duty_id': '2'}, {'duty_id': '3'}]
+        self.stops = [{'stop_id': 'A', 'stop_name': 'Stop A'}, {'stop_id': 'B', 'stop_name': 'Stop B'}]
+
+    def test_groups_and_sorts_events_by_duty(self):
+        index = DutyEventIndex(self.vehicles, self.duties)
+        stop_a, stop_b = index.stops.code('A'), index.stops.code('B')
+        self.assertEqual(index.events('1'), [
+            EventRecord(480, 540, None, stop_a), EventRecord(600, 660, None, stop_b), EventRecord(None, None),
+        ])
+
+    def test_keeps_duty_order_and_empty_duties(self):
+        index = DutyEventIndex(self.vehicles, self.duties)
+        self.assertEqual(index.duty_ids(), ['1', '2', '3'])
+        self.assertEqual(index.events('3'), [])
+        self.assertNotIn('4', index)
+
+    def test_incremental_adds(self):
+        index = DutyEventIndex()
+        for vehicle in reversed(self.vehicles):
+            index.add_vehicle(vehicle)
+        self.assertEqual([record.start for record in index.events('1')], [480, 600, None])
+
+    def test_timed_events_skip_untimed(self):
+        index = DutyEventIndex(self.vehicles, self.duties)
+        self.assertEqual([record.start for record in index.timed_events('1')], [480, 600])
+
+    def test_start_end_times(self):
+        index = DutyEventIndex(self.vehicles, self.duties)
+        self.assertEqual(index.start_end_times('1'), (480, 660))
+        self.assertEqual(index.start_end_times('3'), (None, None))
+
+    def test_interns_stops_in_given_registry(self):
+        stops = StopRegistry(self.stops)
+        index = DutyEventIndex(self.vehicles, self.duties, stops)
+        self.assertIs(index.stops, stops)
+        self.assertEqual(stops.name_of(index.events('2')[0].destination), 'Stop A')
+
+    def test_steps_use_index(self):
+        index = DutyEventIndex(self.vehicles, self.duties)
+        start_end_times = generate_start_end_times(self.duties, self.vehicles, index)
+        self.assertEqual(start_end_times[2], {'Duty ID': '3', 'Start Time': None, 'End Time': None,
+                                              'First Stop ID': None, 'Last Stop ID': None})
+        report = generate_breaks_info(start_end_times, self.vehicles, self.stops, index)
+        self.assertEqual(report[0]['Breaks'], [{'break_start_time': 540, 'break_duration': 60, 'break_stop_name': 'Stop A'}])
+
+class TestDutyTimelines(unittest.TestCase):
+
+    def setUp(self):
+        self.vehicles = [{'vehicle_id': 'V1', 'vehicle_events': [
+            {'vehicle_event_sequence': '0', 'start_time': '0.08:00', 'end_time': '0.09:00',
+             'origin_stop_id': 'D', 'destination_stop_id': 'A', 'duty_id': '1'},
+            {'vehicle_event_sequence': '1', 'start_time': '0.09:30', 'end_time': '0.10:00',
+             'origin_stop_id': 'A', 'destination_stop_id': 'B', 'duty_id': '1'},
+            {'vehicle_event_sequence': '2', 'start_time': '0.11:00', 'end_time': '0.12:00',
+             'origin_stop_id': 'B', 'destination_stop_id': 'D', 'duty_id': '2'},
+        ]}]
+        self.duties = [
+            {'duty_id': '1', 'duty_events': [
+                {'duty_event_type': 'sign_on', 'start_time': '0.07:45', 'end_time': '0.07:50',
+                 'origin_stop_id': 'D', 'destination_stop_id': 'D'},
+                {'duty_event_type': 'vehicle_event', 'vehicle_id': 'V1', 'vehicle_event_sequence': 0},
+                {'duty_event_type': 'vehicle_event', 'vehicle_id': 'V1', 'vehicle_event_sequence': 1},
+                {'duty_event_type': 'taxi', 'start_time': '0.10:00', 'end_time': '0.10:20',
+                 'origin_stop_id': 'B', 'destination_stop_id': 'C'},
+            ]},
+            {'duty_id': '2'},
+        ]
+        self.stops = [{'stop_id': stop_id, 'stop_name': f'Stop {stop_id}'} for stop_id in 'ABCD']
+
+    def test_timeline_from_duty_events(self):
+        index = DutyEventIndex(self.vehicles, self.duties, StopRegistry(self.stops))
+        self.assertEqual([(record.start, record.end) for record in index.events('1')],
+                         [(465, 470), (480, 540), (570, 600), (600, 620)])
+        self.assertEqual(index.summary('1'), (465, 620, index.stops.code('D'), index.stops.code('C')))
+        self.assertEqual(index.start_end_times('2'), (660, 720))
+
+    def test_vehicles_added_after_duties_are_resolved(self):
+        index = DutyEventIndex(duties=self.duties)
+        self.assertEqual(len(index.events('1')), 2)
+        index.add_vehicle(self.vehicles[0])
+        self.assertEqual(len(index.events('1')), 4)
+
+    def test_steps_use_timelines(self):
+        stops = StopRegistry(self.stops)
+        index = DutyEventIndex(self.vehicles, self.duties, stops)
+        start_end_times = generate_start_end_times(self.duties, None, index)
+        self.assertEqual(start_end_times[0], {'Duty ID': '1', 'Start Time': 465, 'End Time': 620,
+                                              'First Stop ID': 'D', 'Last Stop ID': 'C'})
+        report = generate_breaks_info(generate_stop_names(start_end_times, stops), None, stops, index)
+        self.assertEqual((report[0]['First Stop'], report[0]['Last Stop']), ('Stop D', 'Stop C'))
+        self.assertEqual(report[0]['Breaks'], [{'break_start_time': 540, 'break_duration': 30, 'break_stop_name': 'Stop A'}])
+
+class TestTripIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.trips = [
+            {'trip_id': 'T1', 'origin_stop_id': 'A', 'destination_stop_id': 'B', 'departure_time': '0.08:00', 'arrival_time': '0.09:00'},
+            {'trip_id': 'T2', 'origin_stop_id': 'B', 'destination_stop_id': 'C', 'departure_time': '0.10:00', 'arrival_time': '0.11:00',
+             'sub_trips': [{'departure_time': '0.10:00', 'arrival_time': '0.10:20', 'sub_trip_index': 'T2_1'},
+                           {'departure_time': '0.10:20', 'arrival_time': '0.11:00', 'sub_trip_index': 'T2_2'}]},
+        ]
+
+    def test_get(self):
+        trip_index = TripIndex(self.trips)
+        self.assertEqual(trip_index.get('T1'), ('0.08:00', '0.09:00', 'A', 'B'))
+        self.assertIsNone(trip_index.get('T3'))
+
+    def test_get_sub_trip(self):
+        trip_index = TripIndex(self.trips)
+        self.assertEqual(trip_index.get('T2', '1'), ('0.10:00', '0.10:20', 'B', None))
+        self.assertEqual(trip_index.get('T2', '2'), ('0.10:20', '0.11:00', None, 'C'))
+
+    def test_resolve_service_trips(self):
+        vehicles = [{'vehicle_events': [
+            {'vehicle_event_type': 'service_trip', 'trip_id': 'T1', 'duty_id': '1'},
+            {'vehicle_event_type': 'service_trip', 'trip_id': 'T9', 'duty_id': '1'},
+            {'vehicle_event_type': 'deadhead', 'start_time': '0.09:05', 'end_time': '0.09:10', 'duty_id': '1'},
+        ]}]
+        unresolved = resolve_service_trips(vehicles, TripIndex(self.trips))
+        self.assertEqual(unresolved, 1)
+        self.assertEqual(vehicles[0]['vehicle_events'][0], {
+            'vehicle_event_type': 'service_trip', 'trip_id': 'T1', 'duty_id': '1',
+            'start_time': '0.08:00', 'end_time': '0.09:00', 'origin_stop_id': 'A', 'destination_stop_id': 'B',
+        })
+        self.assertNotIn('start_time', vehicles[0]['vehicle_events'][1])
@@ -0,0 +1,87 @@
+import json
+import os
+import tempfile
+import tracemalloc
+import unittest
+from src.metrics import NO_METRICS, Metrics
+from src.main import generate_reports
+
+class TestMetrics(unittest.TestCase):
+
+    def test_stage_records_measurements(self):
+        metrics = Metrics()
+        with metrics.stage('work') as stage:
+            total = sum(range(10000))
+            stage.items = 10000
+        self.assertEqual(total, 49995000)
+        [stage] = metrics.stages
+        self.assertEqual((stage.name, stage.items), ('work', 10000))
+        self.assertGreater(stage.wall_seconds, 0)
+        self.assertGreaterEqual(stage.cpu_seconds, 0)
+        self.assertGreater(stage.peak_rss, 0)
+        self.assertIsNone(stage.peak_memory_delta)
+        self.assertAlmostEqual(stage.items_per_second, 10000 / stage.wall_seconds)
+
+    @unittest.skipUnless(os.path.exists('/proc/self/clear_refs'), "the stage peak is only measured on Linux")
+    def test_stage_peak_rss(self):
+        metrics = Metrics()
+        with metrics.stage('allocate'):
+            data = b'x' * (64 * 2**20)
+            del data
+        with metrics.stage('idle'):
+            pass
+        allocate, idle = metrics.stages
+        self.assertGreater(allocate.stage_peak_rss - idle.stage_peak_rss, 48 * 2**20)
+        self.assertGreaterEqual(idle.peak_rss, allocate.stage_peak_rss)
+        self.assertEqual(metrics.totals()['stage_peak_rss_bytes'], allocate.stage_peak_rss)
+
+    def test_failed_stage_is_recorded(self):
+        metrics = Metrics()
+        with self.assertRaises(ZeroDivisionError):
+            with metrics.stage('fails'):
+                1 / 0
+        self.assertEqual([stage.name for stage in metrics.stages], ['fails'])
+
+    def test_disabled_metrics_record_nothing(self):
+        with NO_METRICS.stage('work', 5) as stage:
+            stage.items = 3
+        self.assertEqual(NO_METRICS.stages, [])
+
+    def test_formats(self):
+        metrics = Metrics()
+        with metrics.stage('load', 2):
+            pass
+        with metrics.stage('step1'):
+            pass
+        report = json.loads(metrics.format('json'))
+        self.assertEqual([stage['stage'] for stage in report['stages']], ['load', 'step1'])
+        self.assertIsNone(report['stages'][1]['items_per_second'])
+        self.assertIn('load', metrics.format('table'))
+        prometheus = metrics.format('prometheus')
+        self.assertIn('# TYPE duty_report_stage_wall_seconds gauge', prometheus)
+        self.assertIn('duty_report_stage_items{stage="load"} 2', prometheus)
+        self.assertIn('duty_report_stage_peak_rss_bytes{stage="load"}', prometheus)
+        # The per-stage growth is only measured when profiling.
+        self.assertNotIn('duty_report_stage_peak_memory_delta_bytes{', prometheus)
+        self.assertNotIn('duty_report_stage_items{stage="step1"}', prometheus)
+        with self.assertRaises(ValueError):
+            metrics.format('xml')
+
+    def test_profile(self):
+        metrics = Metrics(profile=True)
+        self.addCleanup(tracemalloc.stop)
+        with metrics.stage('allocate'):
+            data = [str(number) for number in range(10000)]
+        self.assertEqual(len(data), 10000)
+        self.assertGreater(metrics.stages[0].peak_memory_delta, 0)
+        self.assertIn('test_metrics.py', metrics.profile_report())
+
+    def test_generate_reports_stages(self):
+        metrics = Metrics()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            generate_reports(os.path.join('data', 'mini_json_dataset.json'), tmp_dir, fmt='csv', metrics=metrics)
+            metrics.write(os.path.join(tmp_dir, 'metrics.prom'), 'prometheus')
+            with open(os.path.join(tmp_dir, 'metrics.prom')) as file:
+                self.assertIn('stage="steps+export"', file.read())
+        self.assertEqual([stage.name for stage in metrics.stages], ['load', 'steps+export'])
+        self.assertEqual(metrics.stages[0].items, metrics.stages[1].items)
@@ -0,0 +1,112 @@
+import csv
+import random
+import tempfile
+import unittest
+from pathlib import Path
+from src.breaks import BreakIndex, BreakRules
+from src.index import DutyEventIndex, EventRecord
+from src.occupancy import STOP_SUMMARY_COLUMNS, Occupancy, nearest_depots, write_occupancy
+from src.stops import StopRegistry
+from src.steps import generate_breaks_info
+from src.utils import format_time
+
+STOPS = [
+    {'stop_id': 'D1', 'stop_name': 'North Depot', 'is_depot': True, 'latitude': 34.2, 'longitude': -118.2},
+    {'stop_id': 'D2', 'stop_name': 'South Depot', 'is_depot': True, 'latitude': 33.8, 'longitude': -118.2},
+    {'stop_id': 'A', 'stop_name': 'Stop A', 'is_depot': False, 'latitude': 34.1, 'longitude': -118.3},
+    {'stop_id': 'B', 'stop_name': 'Stop B', 'is_depot': False, 'latitude': 33.9, 'longitude': -118.1},
+    {'stop_id': 'C', 'stop_name': 'Stop C', 'is_depot': False},
+]
+
+class TestOccupancy(unittest.TestCase):
+
+    def setUp(self):
+        self.stops = StopRegistry(STOPS)
+        rng = random.Random(0)
+        self.index = DutyEventIndex(stops=self.stops)
+        self.timelines = {}
+        for duty_number in range(40):
+            records, time = [], rng.randrange(600)
+            for _ in range(8):
+                end = time + rng.randrange(5, 60)
+                records.append(EventRecord(time, end, destination=rng.choice([0, 1, 2, 3, 4, None])))
+                # Some events overlap the previous one, leaving no gap.
+                time = end + rng.randrange(-5, 90)
+            self.index.add_records(str(duty_number), records)
+            self.timelines[str(duty_number)] = records
+        self.occupancy = Occupancy.from_index(self.index)
+
+    def count(self, minute, stop_code, threshold=None):
+        """Brute force: the gaps of every duty covering `minute` at a stop."""
+        count = 0
+        for records in self.timelines.values():
+            for before, after in zip(records, records[1:]):
+                gap = after.start - before.end
+                if (before.destination == stop_code and before.end <= minute < after.start
+                        and (threshold is None or gap > threshold)):
+                    count += 1
+        return count
+
+    def test_counts_match_a_brute_force_scan(self):
+        breaks = BreakIndex.from_index(self.index)
+        first, last = self.occupancy.start, self.occupancy.start + self.occupancy.span
+        for minute in range(first - 5, last + 5, 7):
+            for stop_id, code in [('D1', 0), ('A', 2), ('C', 4)]:
+                self.assertEqual(self.occupancy.drivers_idle(minute, stop_id), self.count(minute, code))
+                self.assertEqual(self.occupancy.drivers_on_break(minute, stop_id), self.count(minute, code, 15))
+                self.assertEqual(self.occupancy.drivers_on_break(minute, stop_id),
+                                 breaks.count_on_break(minute, minute + 1, stop_id))
+            self.assertEqual(self.occupancy.drivers_on_break(minute), breaks.count_on_break(minute, minute + 1))
+        self.assertEqual(self.occupancy.drivers_idle(first, 'nowhere'), 0)
+
+    def test_summaries_match_the_report(self):
+        report = generate_breaks_info([{'Duty ID': duty_id} for duty_id in self.index.duty_ids()],
+                                      None, self.stops, self.index)
+        rows = {row[0]: dict(zip(STOP_SUMMARY_COLUMNS, row)) for row in self.occupancy.stop_summary_rows()}
+        for stop_id, stop_name in [('D1', 'North Depot'), ('B', 'Stop B'), (None, 'Unknown Stop')]:
+            infos = [info for duty_data in report for info in duty_data['Breaks']
+                     if info['break_stop_name'] == stop_name]
+            self.assertEqual(rows[stop_id]['Breaks'], len(infos))
+            self.assertEqual(rows[stop_id]['Break Minutes'], sum(info['break_duration'] for info in infos))
+            minutes = range(self.occupancy.start, self.occupancy.start + self.occupancy.span)
+            series = [self.count(minute, None if stop_id is None else self.stops.code(stop_id)) for minute in minutes]
+            self.assertEqual(rows[stop_id]['Peak Drivers Idle'], max(series))
+            self.assertEqual(rows[stop_id]['Peak Idle Time'], format_time(minutes[series.index(max(series))]))
+        self.assertEqual([(row['Stop ID'], row['Depot']) for row in rows.values()],
+                         [('D1', 'North Depot'), ('D2', 'South Depot'), ('A', 'North Depot'), ('B', 'South Depot'),
+                          ('C', None), (None, None)])
+
+        # North Depot's area is D1 and A, South Depot's D2 and B.
+        depot_rows = list(self.occupancy.depot_occupancy_rows())
+        for depot_id, codes in [('D1', [0, 2]), ('D2', [1, 3])]:
+            expected = [(format_time(minute), sum(self.count(minute, code) for code in codes))
+                        for minute in range(self.occupancy.start, self.occupancy.start + self.occupancy.span)]
+            self.assertEqual([(row[0], row[3]) for row in depot_rows if row[1] == depot_id],
+                             [(time, count) for time, count in expected if count])
+
+        depots = {row[0]: row for row in self.occupancy.depot_summary_rows()}
+        self.assertEqual(depots['D1'][2:5], (2, rows['D1']['Dwells'] + rows['A']['Dwells'],
+                                             rows['D1']['Dwell Minutes'] + rows['A']['Dwell Minutes']))
+
+    def test_rules_and_nearest_depots(self):
+        rules = BreakRules.from_config([{'name': 'depot', 'depot': True, 'min_duration': 40}])
+        typed = Occupancy.from_index(self.index, rules=rules)
+        self.assertEqual(typed.breaks[2:].sum(), 0)
+        self.assertEqual(typed.dwells.tolist(), self.occupancy.dwells.tolist())
+        self.assertEqual(nearest_depots(self.stops, [0, 1]).tolist(), [0, 1, 0, 1, -1])
+        self.assertEqual(nearest_depots(self.stops, []).tolist(), [-1] * 5)
+
+    def test_write_occupancy(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            row_counts = write_occupancy(self.occupancy, Path(tmp_dir) / 'occupancy', 'csv')
+            for name, count in row_counts.items():
+                with open(Path(tmp_dir) / f'occupancy_{name}.csv', newline='') as file:
+                    self.assertEqual(len(list(csv.reader(file))), count + 1)
+            self.assertEqual(row_counts['depot_summary'], 2)
+            minutes = range(self.occupancy.start, self.occupancy.start + self.occupancy.span)
+            self.assertEqual(row_counts['stop_occupancy'],
+                             sum(self.count(minute, code) > 0 for minute in minutes for code in [0, 1, 2, 3, 4, None]))
+
+            empty = Occupancy.from_index(DutyEventIndex(stops=self.stops))
+            self.assertEqual(empty.span, 0)
+            self.assertEqual(write_occupancy(empty, Path(tmp_dir) / 'empty', 'xlsx')['stop_occupancy'], 0)
@@ -0,0 +1,43 @@
+import unittest
+from src.index import DutyEventIndex
+from src.parallel import duty_depot, generate_report_parallel, hash_shard, pack_shard, partition_duties, run_shard
+from src.stops import StopRegistry
+from tests.fixtures import round_trip_schedule, serial_report
+
+class TestParallelReport(unittest.TestCase):
+
+    def setUp(self):
+        self.stops = StopRegistry([
+            {'stop_id': 'D', 'stop_name': 'Depot', 'is_depot': True},
+            {'stop_id': 'A', 'stop_name': 'Stop A', 'is_depot': False},
+        ])
+        self.vehicles, self.duties = round_trip_schedule('D', 'A')
+        self.index = DutyEventIndex(self.vehicles, self.duties, self.stops)
+
+    def test_hash_shard_is_stable(self):
+        self.assertEqual(hash_shard('110', 8), hash_shard('110', 8))
+        self.assertTrue(0 <= hash_shard('110', 8) < 8)
+
+    def test_partition_by_depot(self):
+        self.assertEqual(duty_depot(self.index, '1'), 'D')
+        self.assertIsNone(duty_depot(self.index, '6'))
+        shards = partition_duties(['1', '6', '2'], self.index, 4, 'depot')
+        self.assertEqual(shards, [['1', '2'], ['6']])
+
+    def test_same_report_in_process(self):
+        report = generate_report_parallel(self.duties, self.index, workers=1)
+        self.assertEqual(report, serial_report(self.duties, self.index, self.stops))
+
+    def test_same_report_in_pool(self):
+        report = generate_report_parallel(self.duties, self.index, workers=2, shard_by='depot')
+        self.assertEqual(report, serial_report(self.duties, self.index, self.stops))
+
+    def test_shard_round_trip(self):
+        shard = ['2', '1']
+        report = run_shard(pack_shard(shard, self.index), stops=self.stops)
+        duties = [duty for duty_id in shard for duty in self.duties if duty['duty_id'] == duty_id]
+        self.assertEqual(report, serial_report(duties, self.index, self.stops))
+
+    def test_unknown_shard_mode(self):
+        with self.assertRaises(ValueError):
+            generate_report_parallel(self.duties, self.index, workers=1, shard_by='route')
@@ -0,0 +1,55 @@
+import tempfile
+import unittest
+from src.index import DutyEventIndex
+from src.main import DEFAULT_DATASET, generate_reports
+from src.pipeline import ListSink, batched, breaks, fan_out, fused, pipeline, start_end, stop_names
+from src.stops import StopRegistry
+from src.utils import load_json_data
+from tests.fixtures import round_trip_schedule, serial_report
+
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.stops = StopRegistry([{'stop_id': 'A', 'stop_name': 'Stop A'}, {'stop_id': 'B', 'stop_name': 'Stop B'}])
+        self.vehicles, self.duties = round_trip_schedule('A', 'B')
+        self.index = DutyEventIndex(self.vehicles, self.duties, self.stops)
+
+    def test_batched(self):
+        self.assertEqual(list(batched(range(5), 2)), [[0, 1], [2, 3], [4]])
+
+    def test_chained_stages(self):
+        records = (pipeline(duty for duty in self.duties) | start_end(self.index, batch_size=4)
+                   | stop_names(self.stops, batch_size=1) | breaks(self.index, self.stops, batch_size=2))
+        self.assertEqual(list(records), serial_report(self.duties, self.index, self.stops))
+
+    def test_stages_are_lazy(self):
+        def duties():
+            yield self.duties[0]
+            raise AssertionError("pulled a second duty")
+        records = pipeline(duties()) | fused(self.index, self.stops, batch_size=1)
+        self.assertEqual(next(iter(records))['Duty ID'], '5')
+
+    def test_fused_fans_out_to_sinks(self):
+        first, second = ListSink(), ListSink()
+        results = pipeline(self.duties) | fused(self.index, self.stops, engine='pandas') | fan_out(first, second)
+        self.assertEqual(results, [first.records, second.records])
+        self.assertEqual(first.records, serial_report(self.duties, self.index, self.stops))
+        self.assertEqual(first.records[0]['Breaks'],
+                         [{'break_start_time': 310, 'break_duration': 30, 'break_stop_name': 'Stop B'}])
+
+    def test_sinks_closed_on_error(self):
+        class FailingSink(ListSink):
+            closed = False
+            def send(self, record):
+                raise ValueError(record['Duty ID'])
+            def close(self):
+                self.closed = True
+        sink = FailingSink()
+        with self.assertRaises(ValueError):
+            pipeline(self.duties) | fused(self.index, self.stops) | fan_out(sink)
+        self.assertTrue(sink.closed)
+
+    def test_generate_reports_returns_duty_count(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            counts = [generate_reports(DEFAULT_DATASET, tmp_dir, fmt=fmt) for fmt in (None, 'csv')]
+        self.assertEqual(counts, [len(load_json_data(DEFAULT_DATASET)['duties'])] * 2)
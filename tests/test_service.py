@@ -0,0 +1,101 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from src.service import LRUCache, ReportService
+
+SCHEDULE = {
+    'stops': [{'stop_id': 'A', 'stop_name': 'Stop A', 'is_depot': False}],
+    'trips': [],
+    'vehicles': [{'vehicle_id': '1', 'vehicle_events': [
+        {'duty_id': '1', 'start_time': '0.08:00', 'end_time': '0.09:00', 'destination_stop_id': 'A'},
+        {'duty_id': '1', 'start_time': '0.09:30', 'end_time': '0.10:00', 'destination_stop_id': 'A'},
+    ]}],
+    'duties': [{'duty_id': '1', 'duty_events': []}],
+}
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.get('a'), cache.get('c')), (1, 3))
+        self.assertEqual((cache.hits, cache.misses), (3, 1))
+
+class TestReportService(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'schedule.json')
+        self.write_schedule(SCHEDULE)
+        self.service = ReportService(self.path)
+        self.server = await self.service.serve(port=0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        self.service.watcher.cancel()
+        self.server.close()
+        await self.server.wait_closed()
+        self.tmp_dir.cleanup()
+
+    def write_schedule(self, schedule):
+        with open(self.path, 'w') as file:
+            json.dump(schedule, file)
+
+    async def get(self, target):
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        writer.write(f"GET {target} HTTP/1.1\r\nConnection: close\r\n\r\n".encode())
+        response = await reader.read()
+        writer.close()
+        head, _, body = response.partition(b'\r\n\r\n')
+        return int(head.split()[1]), json.loads(body)
+
+    async def test_duty(self):
+        status, duty = await self.get('/duties/1')
+        self.assertEqual(status, 200)
+        self.assertEqual((duty['start_time'], duty['end_time']), ('0.08:00', '0.10:00'))
+        self.assertEqual(duty['breaks'], [{'start_time': '0.09:00', 'duration': 30, 'stop_name': 'Stop A'}])
+
+    async def test_threshold_and_cache(self):
+        _, duty = await self.get('/duties/1?threshold=30')
+        self.assertEqual(duty['breaks'], [])
+        await self.get('/duties/1?threshold=30')
+        self.assertEqual((self.service.cache.hits, self.service.cache.misses), (1, 1))
+
+    async def test_report_and_errors(self):
+        status, report = await self.get('/report')
+        self.assertEqual((status, [duty['duty_id'] for duty in report]), (200, ['1']))
+        self.assertEqual((await self.get('/duties/2'))[0], 404)
+        self.assertEqual((await self.get('/duties/1?threshold=x'))[0], 400)
+        self.assertEqual((await self.get('/nowhere'))[0], 404)
+
+    async def test_breaks(self):
+        status, result = await self.get('/breaks?start=0.09:10&end=0.09:20&stop=A')
+        self.assertEqual(status, 200)
+        self.assertEqual(result, {'count': 1, 'breaks': [
+            {'duty_id': '1', 'start_time': '0.09:00', 'duration': 30, 'stop_name': 'Stop A'}]})
+        self.assertEqual((await self.get('/breaks?start=0.10:00&end=0.11:00'))[1]['count'], 0)
+        self.assertEqual((await self.get('/breaks?start=0.09:10'))[0], 400)
+        self.assertEqual(await self.get('/breaks?start=0.09:20&end=0.09:20'),
+                         (400, {'error': "start must be before end"}))
+
+    async def test_reload_on_change(self):
+        await self.get('/duties/1')
+        schedule = json.loads(json.dumps(SCHEDULE))
+        schedule['vehicles'][0]['vehicle_events'][1]['end_time'] = '0.11:00'
+        self.write_schedule(schedule)
+        os.utime(self.path, ns=(0, 10**18))
+        self.assertTrue(await self.service.reload_if_changed())
+        _, duty = await self.get('/duties/1')
+        self.assertEqual(duty['end_time'], '0.11:00')
+
+    async def test_broken_file_keeps_dataset(self):
+        with open(self.path, 'w') as file:
+            file.write('{"stops": [')
+        self.assertFalse(await self.service.reload_if_changed())
+        self.assertEqual((await self.get('/duties/1'))[0], 200)
@@ -0,0 +1,85 @@
+import json
+import os
+import tempfile
+import unittest
+from src.index import DutyEventIndex
+from src.snapshot import SnapshotIndex, load_schedule_snapshot, read_snapshot, snapshot_path
+from src.validation import ScheduleValidationError
+from src.steps import generate_start_end_times, generate_stop_names, generate_breaks_info
+
+SCHEDULE = {
+    'stops': [{'stop_id': 'A', 'stop_name': 'Stop A', 'latitude': 1.5, 'longitude': 2.5, 'is_depot': True},
+              {'stop_id': 'B', 'stop_name': 'Stop B', 'is_depot': False}],
+    'trips': [{'trip_id': 'T1', 'origin_stop_id': 'A', 'destination_stop_id': 'B',
+               'departure_time': '0.08:00', 'arrival_time': '0.09:00'}],
+    'vehicles': [{'vehicle_id': '1', 'vehicle_events': [
+        {'vehicle_event_sequence': '0', 'vehicle_event_type': 'pre_trip', 'start_time': '0.07:30', 'end_time': '0.07:40',
+         'origin_stop_id': 'A', 'destination_stop_id': 'A', 'duty_id': '1'},
+        {'vehicle_event_sequence': '1', 'vehicle_event_type': 'service_trip', 'trip_id': 'T1', 'duty_id': '1'},
+        {'vehicle_event_sequence': '2', 'vehicle_event_type': 'service_trip', 'trip_id': 'T9', 'duty_id': '2'},
+        {'vehicle_event_sequence': '3', 'vehicle_event_type': 'deadhead', 'start_time': '0.09:30', 'end_time': '0.09:45',
+         'origin_stop_id': 'B', 'destination_stop_id': 'X', 'duty_id': '1'},
+    ]}],
+    'duties': [{'duty_id': '2'}, {'duty_id': '1'}],
+}
+
+def report(duties, stops, index):
+    start_end_times = generate_start_end_times(duties, None, index)
+    return generate_breaks_info(generate_stop_names(start_end_times, stops), None, stops, index)
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'schedule.json')
+        self.write_schedule(SCHEDULE)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_schedule(self, schedule):
+        with open(self.path, 'w') as file:
+            json.dump(schedule, file)
+
+    def test_warm_load_matches_cold_load(self):
+        cold = load_schedule_snapshot(self.path)
+        self.assertNotIsInstance(cold[2], SnapshotIndex)
+        self.assertTrue(snapshot_path(self.path).exists())
+        warm = load_schedule_snapshot(self.path)
+        self.assertIsInstance(warm[2], SnapshotIndex)
+        self.assertEqual([duty['duty_id'] for duty in warm[0]], ['2', '1'])
+        self.assertEqual(report(*warm), report(*cold))
+        self.assertEqual(warm[2].events('2')[0].start, None)
+        self.assertEqual(warm[1].name_of(warm[2].events('1')[-1].destination), 'Unknown Stop')
+        self.assertEqual(warm[1].coordinates('A'), (1.5, 2.5))
+
+    def test_touched_file_keeps_snapshot(self):
+        load_schedule_snapshot(self.path)
+        os.utime(self.path, ns=(0, 10**18))
+        self.assertIsNotNone(read_snapshot(self.path))
+
+    def test_changed_file_invalidates_snapshot(self):
+        load_schedule_snapshot(self.path)
+        with open(self.path) as file:
+            content = file.read()
+        with open(self.path, 'w') as file:
+            file.write(content.replace('0.09:45', '0.09:50'))
+        os.utime(self.path, ns=(0, 10**18))
+        self.assertIsNone(read_snapshot(self.path))
+        duties, stops, index = load_schedule_snapshot(self.path)
+        self.assertEqual(index.start_end_times('1'), (450, 590))
+
+    def test_unvalidated_snapshot_is_revalidated(self):
+        # The schedule refers to an unknown trip (T9) and stop (X).
+        load_schedule_snapshot(self.path, validate=False)
+        self.assertIsNotNone(read_snapshot(self.path))
+        self.assertIsNone(read_snapshot(self.path, validate=True))
+        with self.assertRaises(ScheduleValidationError):
+            load_schedule_snapshot(self.path, validate=True)
+
+    def test_corrupt_snapshot_is_rebuilt(self):
+        with open(snapshot_path(self.path), 'wb') as file:
+            file.write(b'DUTYSNAP garbage')
+        self.assertIsNone(read_snapshot(self.path))
+        self.assertIsInstance(load_schedule_snapshot(self.path)[2], DutyEventIndex)
+        self.assertIsNotNone(read_snapshot(self.path))
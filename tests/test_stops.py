@@ -0,0 +1,49 @@
+import unittest
+from src.stops import StopRegistry, as_stop_registry
+
+class TestStopRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.stops = [
+            {'stop_id': 'A', 'stop_name': 'Stop A', 'latitude': 34.1, 'longitude': -117.7, 'is_depot': True},
+            {'stop_id': 'B', 'stop_name': 'Stop B', 'latitude': 34.2, 'longitude': -117.8, 'is_depot': False},
+        ]
+
+    def test_lookup_by_id_and_code(self):
+        registry = StopRegistry(self.stops)
+        self.assertEqual(registry.name('B'), 'Stop B')
+        self.assertEqual(registry.code('B'), 1)
+        self.assertEqual(registry.name_of(1), 'Stop B')
+        self.assertEqual(registry.stop_id(0), 'A')
+
+    def test_unknown_stops(self):
+        registry = StopRegistry(self.stops)
+        self.assertEqual(registry.name('C'), 'Unknown Stop')
+        self.assertIsNone(registry.code('C'))
+        code = registry.intern('C')
+        self.assertEqual(code, 2)
+        self.assertEqual(registry.intern('C'), 2)
+        self.assertEqual(registry.name_of(code), 'Unknown Stop')
+        self.assertIsNone(registry.intern(None))
+        self.assertEqual(registry.name_of(None), 'Unknown Stop')
+
+    def test_depots_and_coordinates(self):
+        registry = StopRegistry(self.stops)
+        self.assertTrue(registry.is_depot('A'))
+        self.assertFalse(registry.is_depot('B'))
+        self.assertFalse(registry.is_depot('C'))
+        self.assertEqual(registry.coordinates('A'), (34.1, -117.7))
+        self.assertIsNone(registry.coordinates('C'))
+
+    def test_update_names_interned_stop(self):
+        registry = StopRegistry()
+        code = registry.intern('A')
+        registry.update(self.stops)
+        self.assertEqual(registry.code('A'), code)
+        self.assertEqual(registry.name_of(code), 'Stop A')
+
+    def test_round_trip(self):
+        registry = StopRegistry(self.stops)
+        self.assertEqual(list(registry), self.stops)
+        self.assertIs(as_stop_registry(registry), registry)
+        self.assertEqual(list(as_stop_registry(self.stops)), self.stops)
@@ -0,0 +1,70 @@
+import json
+import os
+import tempfile
+import unittest
+from src.streaming import iter_schedule, load_json_stream, stream_report_inputs
+
+SCHEDULE = {
+    'stops': [{'stop_id': 'A', 'stop_name': 'Stop A', 'latitude': 1.5, 'longitude': 2.5, 'is_depot': True},
+              {'stop_id': 'B', 'stop_name': 'Stop B', 'latitude': 1.0, 'longitude': 2.0, 'is_depot': False}],
+    'trips': [{'trip_id': 'T1', 'route_number': '1', 'origin_stop_id': 'A', 'destination_stop_id': 'B',
+               'departure_time': '0.08:00', 'arrival_time': '0.09:00'}],
+    'metadata': {'version': 12345},
+    'vehicles': [{'vehicle_id': '1', 'vehicle_events': [
+        {'vehicle_event_sequence': '0', 'vehicle_event_type': 'pre_trip', 'start_time': '0.07:30', 'end_time': '0.07:40',
+         'origin_stop_id': 'A', 'destination_stop_id': 'A', 'duty_id': '1'},
+        {'vehicle_event_sequence': '1', 'vehicle_event_type': 'service_trip', 'trip_id': 'T1', 'duty_id': '1'},
+        {'vehicle_event_sequence': '2', 'vehicle_event_type': 'deadhead', 'start_time': '0.09:30', 'end_time': '0.09:45',
+         'origin_stop_id': 'B', 'destination_stop_id': 'A', 'duty_id': '1'},
+    ]}],
+    'duties': [{'duty_id': '1', 'duty_events': [
+        {'duty_event_sequence': '0', 'duty_event_type': 'sign_on', 'start_time': '0.07:20', 'end_time': '0.07:30',
+         'origin_stop_id': 'A', 'destination_stop_id': 'A'},
+    ] + [
+        {'duty_event_sequence': str(sequence + 1), 'duty_event_type': 'vehicle_event', 'vehicle_event_sequence': sequence,
+         'vehicle_id': '1'}
+        for sequence in range(3)
+    ]}],
+}
+
+class TestIterSchedule(unittest.TestCase):
+
+    def setUp(self):
+        file = tempfile.NamedTemporaryFile('w', suffix='.json', delete=False)
+        json.dump(SCHEDULE, file, indent=2)
+        file.close()
+        self.filepath = file.name
+
+    def tearDown(self):
+        os.remove(self.filepath)
+
+    def test_yields_sections_in_order(self):
+        sections = [section for section, record in iter_schedule(self.filepath)]
+        self.assertEqual(sections, ['stops', 'stops', 'trips', 'vehicles', 'duties'])
+
+    def test_compacts_records(self):
+        json_data = load_json_stream(self.filepath)
+        self.assertEqual(json_data['stops'][0], SCHEDULE['stops'][0])
+        self.assertNotIn('vehicle_event_sequence', json_data['vehicles'][0])
+        self.assertEqual(json_data['duties'][0]['duty_events'][1],
+                         {'duty_event_type': 'vehicle_event', 'vehicle_id': '1', 'vehicle_event_sequence': 0})
+
+    def test_full_records(self):
+        records = [record for section, record in iter_schedule(self.filepath, sections=('vehicles',), compact=False)]
+        self.assertEqual(records, SCHEDULE['vehicles'])
+
+    def test_small_chunks(self):
+        self.assertEqual(list(iter_schedule(self.filepath, chunk_size=3)), list(iter_schedule(self.filepath)))
+
+    def test_invalid_json(self):
+        with open(self.filepath, 'w') as f:
+            f.write('{"stops": [{"stop_id": "A"}, ')
+        with self.assertRaises(json.JSONDecodeError):
+            list(iter_schedule(self.filepath))
+
+    def test_stream_report_inputs(self):
+        duties, stops, index = stream_report_inputs(self.filepath)
+        self.assertEqual([duty['duty_id'] for duty in duties], ['1'])
+        self.assertEqual(len(stops), 2)
+        self.assertEqual(stops.coordinates('B'), (1.0, 2.0))
+        self.assertEqual([record.start for record in index.timed_events('1')], [440, 450, 480, 570])
@@ -3,7 +3,9 @@ import json
 import unittest
 import pandas as pd
 from unittest.mock import patch
-from src.utils import export_to_excel, load_json_data, time_to_minutes, format_time, find_stop_name_by_id, compare_times, calculate_breaks
+from src.index import EventRecord
+from src.stops import StopRegistry
+from src.utils import export_to_excel, load_json_data, time_to_minutes, format_time, find_stop_name_by_id, compare_times, calculate_breaks, times_to_minutes, format_times
 
 class TestLoadJsonData(unittest.TestCase):
 
@@ -95,6 +97,23 @@ class TestFormatTime(unittest.TestCase):
         with self.assertRaises(TypeError):
             format_time(minutes)
 
+class TestTimesToMinutes(unittest.TestCase):
+
+    def test_column(self):
+        time_strs = ['0.03:15', '1.00:00', '0.03:15', '0.23:59']
+        self.assertEqual(times_to_minutes(time_strs).tolist(), [195, 1440, 195, 1439])
+
+    def test_empty_column(self):
+        self.assertEqual(times_to_minutes([]).tolist(), [])
+
+class TestFormatTimes(unittest.TestCase):
+
+    def test_column(self):
+        self.assertEqual(format_times([195, 1440, 195]), ['0.03:15', '1.00:00', '0.03:15'])
+
+    def test_missing_and_strings(self):
+        self.assertEqual(format_times([None, 195, '8:00'], missing='No Time'), ['No Time', '0.03:15', '8:00'])
+
 class TestFindStopNameById(unittest.TestCase):
 
     def test_find_existing_stop(self):
@@ -113,6 +132,11 @@ class TestFindStopNameById(unittest.TestCase):
         actual = find_stop_name_by_id(stop_id, stops)
         self.assertEqual(actual, expected)
 
+    def test_stop_registry(self):
+        stops = StopRegistry([{'stop_id': 1, 'stop_name': 'Stop 1'}, {'stop_id': 2, 'stop_name': 'Stop 2'}])
+        self.assertEqual(find_stop_name_by_id(2, stops), 'Stop 2')
+        self.assertEqual(find_stop_name_by_id(3, stops), 'Unknown Stop')
+
     def test_empty_stops_list(self):
         stops = []
         stop_id = 1
@@ -142,6 +166,10 @@ class TestCompareTimes(unittest.TestCase):
         time2 = '2.1:15'
         self.assertTrue(compare_times(time1, time2))
 
+def to_records(vehicle_events, stops):
+    return [EventRecord(time_to_minutes(event['start_time']), time_to_minutes(event['end_time']), None, stops.code(event['destination_stop_id']))
+            for event in vehicle_events]
+
 class TestCalculateBreaks(unittest.TestCase):
 
     def test_no_breaks(self):
@@ -150,7 +178,8 @@ class TestCalculateBreaks(unittest.TestCase):
             {'start_time': '1.35:00', 'end_time': '2.00:00', 'destination_stop_id': 'B'}
         ]
         stops = [{'stop_id': 'A', 'stop_name': 'Stop A'}, {'stop_id': 'B', 'stop_name': 'Stop B'}]
-        breaks = calculate_breaks(vehicle_events, stops)
+        stops = StopRegistry(stops)
+        breaks = calculate_breaks(to_records(vehicle_events, stops), stops)
         self.assertEqual(breaks, [])
 
     def test_one_break(self):
@@ -159,8 +188,9 @@ class TestCalculateBreaks(unittest.TestCase):
             {'start_time': '1.45:00', 'end_time': '2.00:00', 'destination_stop_id': 'B'}
         ]
         stops = [{'stop_id': 'A', 'stop_name': 'Stop A'}, {'stop_id': 'B', 'stop_name': 'Stop B'}]
-        breaks = calculate_breaks(vehicle_events, stops)
-        expected = [{'break_start_time': '1.30:00', 'break_duration': 15, 'break_stop_name': 'Stop A'}]
+        stops = StopRegistry(stops)
+        breaks = calculate_breaks(to_records(vehicle_events, stops), stops)
+        expected = [{'break_start_time': time_to_minutes('1.30:00'), 'break_duration': 15, 'break_stop_name': 'Stop A'}]
         self.assertEqual(breaks, expected)
 
     def test_multiple_breaks(self):
@@ -170,10 +200,11 @@ class TestCalculateBreaks(unittest.TestCase):
             {'start_time': '2.30:00', 'end_time': '3.00:00', 'destination_stop_id': 'C'}
         ]
         stops = [{'stop_id': 'A', 'stop_name': 'Stop A'}, {'stop_id': 'B', 'stop_name': 'Stop B'}, {'stop_id': 'C', 'stop_name': 'Stop C'}]
-        breaks = calculate_breaks(vehicle_events, stops)
+        stops = StopRegistry(stops)
+        breaks = calculate_breaks(to_records(vehicle_events, stops), stops)
         expected = [
-            {'break_start_time': '1.30:00', 'break_duration': 15, 'break_stop_name': 'Stop A'},
-            {'break_start_time': '2.00:00', 'break_duration': 30, 'break_stop_name': 'Stop B'}
+            {'break_start_time': time_to_minutes('1.30:00'), 'break_duration': 15, 'break_stop_name': 'Stop A'},
+            {'break_start_time': time_to_minutes('2.00:00'), 'break_duration': 30, 'break_stop_name': 'Stop B'}
         ]
         self.assertEqual(breaks, expected)
         
@@ -206,6 +237,12 @@ class TestExportToExcel(unittest.TestCase):
         # Assert error message is printed
         self.assertRaises(SystemExit, export_to_excel, data, 'test', 4)
 
+    def test_invalid_step_returns_before_writing(self):
+        with patch('pandas.DataFrame.to_excel') as to_excel, patch('builtins.print') as printed:
+            self.assertIsNone(export_to_excel([{'Duty ID': '1'}], './tests/test', 4))
+        to_excel.assert_not_called()
+        printed.assert_called_once_with("Invalid step number. Please enter a number between 1 and 3.")
+
     def test_file_write_error(self):
         # Mock error when writing file
         with patch('pandas.DataFrame.to_excel', side_effect=Exception('Test error')):
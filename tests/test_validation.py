@@ -0,0 +1,163 @@
+import copy
+import json
+import os
+import tempfile
+import unittest
+from src.main import DEFAULT_DATASET, load_report_inputs
+from src.streaming import stream_report_inputs
+from src.utils import load_json_data
+from src.validation import ScheduleValidationError, ScheduleValidator, ValidationIssue, validate_schedule
+
+SCHEDULE = {
+    'stops': [{'stop_id': 'A', 'stop_name': 'Stop A', 'is_depot': True},
+              {'stop_id': 'B', 'stop_name': 'Stop B', 'is_depot': False}],
+    'trips': [{'trip_id': 'T1', 'origin_stop_id': 'A', 'destination_stop_id': 'B',
+               'departure_time': '0.09:00', 'arrival_time': '0.10:00'}],
+    'vehicles': [{'vehicle_id': 'V1', 'vehicle_events': [
+        {'vehicle_event_sequence': '0', 'vehicle_event_type': 'pre_trip', 'duty_id': 'D1',
+         'start_time': '0.08:00', 'end_time': '0.08:30', 'origin_stop_id': 'A', 'destination_stop_id': 'A'},
+        {'vehicle_event_sequence': '1', 'vehicle_event_type': 'service_trip', 'duty_id': 'D1', 'trip_id': 'T1'},
+        {'vehicle_event_sequence': '2', 'vehicle_event_type': 'deadhead', 'duty_id': 'D1',
+         'start_time': '0.10:30', 'end_time': '0.11:00', 'origin_stop_id': 'B', 'destination_stop_id': 'A'},
+    ]}],
+    'duties': [{'duty_id': 'D1', 'duty_events': [
+        {'duty_event_sequence': '0', 'duty_event_type': 'sign_on', 'start_time': '0.07:50', 'end_time': '0.08:00',
+         'origin_stop_id': 'A', 'destination_stop_id': 'A'},
+    ] + [
+        {'duty_event_sequence': str(sequence + 1), 'duty_event_type': 'vehicle_event', 'vehicle_id': 'V1',
+         'vehicle_event_sequence': sequence}
+        for sequence in range(3)
+    ]}],
+}
+
+"""Validate a schedule record by record with the given validator; returns its issues."""
+def run_validator(schedule, validator):
+    for section in ('stops', 'trips', 'vehicles', 'duties'):
+        for record in schedule[section]:
+            validator.add(section, record)
+    return validator.finish()
+
+class TestValidation(unittest.TestCase):
+
+    def setUp(self):
+        self.schedule = copy.deepcopy(SCHEDULE)
+
+    def test_valid_schedules(self):
+        self.assertEqual(validate_schedule(self.schedule), [])
+        self.assertEqual(validate_schedule(load_json_data(DEFAULT_DATASET)), [])
+
+    def test_normalises_in_place(self):
+        self.schedule['trips'][0]['departure_time'] = '0.9:00'
+        self.assertEqual(validate_schedule(self.schedule), [])
+        self.assertEqual(self.schedule['trips'][0]['departure_time'], '0.09:00')
+        self.assertEqual([event.get('vehicle_event_sequence') for event in self.schedule['duties'][0]['duty_events']],
+                         [None, '0', '1', '2'])
+
+    def test_collects_every_issue_with_its_location(self):
+        vehicle_events = self.schedule['vehicles'][0]['vehicle_events']
+        vehicle_events[0]['start_time'] = '0.24:00'
+        vehicle_events[1]['trip_id'] = 'T9'
+        vehicle_events[2]['destination_stop_id'] = 'Z'
+        vehicle_events[2]['end_time'] = '0.10:00'
+        duty_events = self.schedule['duties'][0]['duty_events']
+        duty_events[0]['start_time'] = '0.08:10'
+        duty_events[3]['vehicle_event_sequence'] = 7
+        self.schedule['duties'].append({'duty_id': 'D1'})
+        self.assertEqual(validate_schedule(self.schedule), [
+            ValidationIssue('vehicles[0].vehicle_events[0].start_time', "invalid time '0.24:00', expected 'day.HH:MM'"),
+            ValidationIssue('vehicles[0].vehicle_events[2].end_time', "'0.10:00' is before start_time '0.10:30'"),
+            ValidationIssue('duties[0].duty_events[0].end_time', "'0.08:00' is before start_time '0.08:10'"),
+            ValidationIssue('duties[1].duty_id', "duplicate duty_id 'D1'"),
+            ValidationIssue('vehicles[0].vehicle_events[1].trip_id', "unknown trip 'T9'"),
+            ValidationIssue('vehicles[0].vehicle_events[2].destination_stop_id', "unknown stop 'Z'"),
+            ValidationIssue('duties[0].duty_events[3]', "unknown vehicle event '7' of vehicle 'V1'"),
+        ])
+
+    def test_sequence_ordering(self):
+        vehicle_events = self.schedule['vehicles'][0]['vehicle_events']
+        vehicle_events[2]['start_time'] = '0.09:45'
+        duty_events = self.schedule['duties'][0]['duty_events']
+        duty_events[1]['duty_event_sequence'] = '0'
+        self.assertEqual(validate_schedule(self.schedule), [
+            ValidationIssue('vehicles[0].vehicle_events[2]',
+                            "starts at 0.09:45, before the previous event ends at 0.10:00"),
+            ValidationIssue('duties[0].duty_events[1].duty_event_sequence', "'0' is out of sequence order (after 0)"),
+            ValidationIssue('duties[0].duty_events[3]', "starts at 0.09:45, before the previous event ends at 0.10:00"),
+        ])
+
+    def test_vehicle_event_sequences(self):
+        vehicle_events = self.schedule['vehicles'][0]['vehicle_events']
+        duty_events = self.schedule['duties'][0]['duty_events']
+        for event, sequence in zip(vehicle_events, ('10', '011', 'x')):
+            event['vehicle_event_sequence'] = sequence
+        for event, sequence in zip(duty_events[1:], (10, '011', 'x')):
+            event['vehicle_event_sequence'] = sequence
+        self.assertEqual(validate_schedule(self.schedule), [])
+        duty_events[2]['vehicle_event_sequence'] = '11'
+        self.assertEqual(validate_schedule(self.schedule), [
+            ValidationIssue('duties[0].duty_events[2]', "unknown vehicle event '11' of vehicle 'V1'"),
+        ])
+        self.schedule['trips'][0]['arrival_time'] = '9999999.00:00'
+        self.assertEqual(validate_schedule(self.schedule)[0], ValidationIssue(
+            'trips[0].arrival_time', "invalid time '9999999.00:00', expected 'day.HH:MM'"))
+
+    def test_fast_path_finds_the_same_issues(self):
+        sub_trips = [{'sub_trip_index': 'T1_1', 'departure_time': '0.09:00', 'arrival_time': '0.09:20'},
+                     {'sub_trip_index': 'T1_2', 'departure_time': '0.9:20', 'arrival_time': '0.10:00'}]
+        mutations = [
+            lambda schedule: None,
+            lambda schedule: schedule['trips'][0].update(departure_time='0.9:00'),
+            lambda schedule: schedule['trips'][0].update(arrival_time='0.08:00', origin_stop_id='Z'),
+            lambda schedule: schedule['trips'].append(dict(schedule['trips'][0])),
+            lambda schedule: schedule['trips'][0].update(sub_trips=sub_trips),
+            lambda schedule: schedule['vehicles'][0]['vehicle_events'][1].update(sub_trip_index='2'),
+            lambda schedule: schedule['vehicles'].append(copy.deepcopy(schedule['vehicles'][0])),
+            lambda schedule: schedule['vehicles'][0]['vehicle_events'][2].update(start_time='0.09:45'),
+            lambda schedule: schedule['vehicles'][0]['vehicle_events'][1].update(vehicle_event_sequence='0'),
+            lambda schedule: schedule['vehicles'][0]['vehicle_events'][0].update(origin_stop_id='Z'),
+            lambda schedule: schedule['vehicles'][0]['vehicle_events'][0].pop('end_time'),
+            lambda schedule: schedule['vehicles'][0]['vehicle_events'][1].update(start_time='0.09:00'),
+            lambda schedule: schedule['duties'][0]['duty_events'][2].update(vehicle_event_sequence=9),
+            lambda schedule: schedule['duties'][0]['duty_events'][1].update(duty_event_sequence='0'),
+            lambda schedule: schedule['duties'][0]['duty_events'][0].update(start_time='0.08:10'),
+            lambda schedule: schedule['duties'].append({'duty_id': 'D1', 'duty_events': 'none'}),
+        ]
+        for position, mutate in enumerate(mutations):
+            with self.subTest(position=position):
+                schedule = copy.deepcopy(SCHEDULE)
+                mutate(schedule)
+                thorough = copy.deepcopy(schedule)
+                issues = run_validator(schedule, ScheduleValidator())
+                self.assertEqual(issues, run_validator(thorough, ScheduleValidator(fast_path=False)))
+                self.assertEqual(schedule, thorough)
+
+    def test_references_to_later_records(self):
+        validator = ScheduleValidator()
+        for section in ('duties', 'vehicles', 'trips', 'stops'):
+            for record in self.schedule[section]:
+                validator.add(section, record)
+        self.assertEqual(validator.finish(), [])
+        self.assertEqual(validate_schedule({'stops': []}), [
+            ValidationIssue('trips', 'missing'), ValidationIssue('vehicles', 'missing'),
+            ValidationIssue('duties', 'missing'),
+        ])
+
+    def test_loaders_fail_fast(self):
+        self.schedule['vehicles'][0]['vehicle_events'][0]['end_time'] = 'late'
+        # Fields the streaming loader does not keep are checked as well.
+        self.schedule['stops'][0]['latitude'] = 'north'
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as file:
+            json.dump(self.schedule, file)
+        try:
+            for stream in (False, True):
+                with self.assertRaises(ScheduleValidationError) as context:
+                    load_report_inputs(file.name, stream=stream)
+                self.assertEqual([str(issue) for issue in context.exception.issues],
+                                 ["stops[0].latitude: expected a number, got 'north'",
+                                  "vehicles[0].vehicle_events[0].end_time: invalid time 'late', expected 'day.HH:MM'"])
+                self.assertIn('2 problem(s)', str(context.exception))
+            duties, _, index = stream_report_inputs(file.name)
+            self.assertEqual([duty['duty_id'] for duty in duties], ['D1'])
+            self.assertEqual(len(load_report_inputs(file.name, validate=False)[0]), 1)
+        finally:
+            os.unlink(file.name)
@@ -0,0 +1,72 @@
+import pickle
+import unittest
+from src.index import DutyEventIndex
+from src.steps import generate_breaks_info
+from src.vectorized import breaks_by_duty, breaks_frame, index_events_frame
+
+class TestVectorizedBreaks(unittest.TestCase):
+
+    def setUp(self):
+        self.vehicles = [
+            {'vehicle_events': [
+                {'duty_id': '1', 'start_time': '0.10:00', 'end_time': '0.11:00', 'destination_stop_id': 'B'},
+                {'duty_id': '2', 'start_time': '0.09:00', 'end_time': '0.09:30', 'destination_stop_id': 'A'},
+                {'duty_id': '2', 'start_time': '0.09:40', 'end_time': '0.09:50'},
+                {'duty_id': '1', 'trip_id': 'T1'},
+            ]},
+            {'vehicle_events': [
+                {'duty_id': '1', 'start_time': '0.08:00', 'end_time': '0.09:00', 'destination_stop_id': 'A'},
+                {'duty_id': '1', 'start_time': '0.11:30', 'end_time': '0.12:00', 'destination_stop_id': 'Z'},
+                {'duty_id': '2', 'start_time': '0.11:00', 'end_time': '0.11:10', 'destination_stop_id': 'A'},
+            ]},
+        ]
+        self.stops = [{'stop_id': 'A', 'stop_name': 'Stop A'}, {'stop_id': 'B', 'stop_name': 'Stop B'}]
+        self.expected = {
+            '1': [{'break_start_time': 540, 'break_duration': 60, 'break_stop_name': 'Stop A'},
+                  {'break_start_time': 660, 'break_duration': 30, 'break_stop_name': 'Stop B'}],
+            '2': [{'break_start_time': 590, 'break_duration': 70, 'break_stop_name': 'Unknown Stop'}],
+        }
+
+    def test_unsorted_frame_is_sorted_by_breaks_frame(self):
+        index = DutyEventIndex(self.vehicles, stops=self.stops)
+        events = index_events_frame(index).iloc[[5, 1, 3, 0, 4, 2]]
+        self.assertEqual(breaks_by_duty(breaks_frame(events, index.stops)), self.expected)
+
+    def test_index_events_frame(self):
+        index = DutyEventIndex(self.vehicles, stops=self.stops)
+        events = index_events_frame(index)
+        self.assertEqual(events['duty_id'].tolist(), ['1', '1', '1', '2', '2', '2'])
+        self.assertEqual(events['start_min'].tolist(), [480, 600, 690, 540, 580, 660])
+        self.assertEqual(events['end_min'].tolist(), [540, 660, 720, 570, 590, 670])
+        self.assertEqual(events['destination'].tolist(), [0, 1, 2, 0, -1, 0])
+        self.assertEqual(breaks_by_duty(breaks_frame(events, index.stops)), self.expected)
+
+    def test_threshold(self):
+        index = DutyEventIndex(self.vehicles, stops=self.stops)
+        breaks = breaks_frame(index_events_frame(index), index.stops, threshold=45)
+        self.assertEqual(breaks['break_duration'].tolist(), [60, 70])
+
+    def test_empty(self):
+        index = DutyEventIndex(stops=self.stops)
+        breaks = breaks_frame(index_events_frame(index), index.stops)
+        self.assertEqual(len(breaks), 0)
+        self.assertEqual(breaks_by_duty(breaks), {})
+
+    def test_same_breaks_as_python_engine(self):
+        duties = [{'Duty ID': '2'}, {'Duty ID': '1'}, {'Duty ID': '3'}]
+        python_report = generate_breaks_info([dict(duty) for duty in duties], self.vehicles, self.stops)
+        pandas_report = generate_breaks_info([dict(duty) for duty in duties], self.vehicles, self.stops, engine='pandas')
+        self.assertEqual(pandas_report, python_report)
+        self.assertEqual(pandas_report[2]['Breaks'], [])
+
+    def test_breaks_pickle_as_lists(self):
+        duties = [{'Duty ID': '1'}, {'Duty ID': '1'}]
+        report = generate_breaks_info(duties, self.vehicles, self.stops, engine='pandas')
+        breaks = pickle.loads(pickle.dumps(report[0]['Breaks']))
+        self.assertIsInstance(breaks, list)
+        self.assertEqual(breaks, self.expected['1'])
+        self.assertEqual(report[1]['Breaks'][-1], self.expected['1'][-1])
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            generate_breaks_info([], self.vehicles, self.stops, engine='spark')